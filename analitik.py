@@ -0,0 +1,185 @@
+from datetime import date
+
+from stok import posisi_stok
+
+# === ANALITIK PENJUALAN ===
+# Baris penjualan_item & pembelian satu rentang dibaca sekali dalam bentuk
+# angka (barang sebagai rowid, bulan sebagai indeks) ke array NumPy. Semua
+# agregasi per barang, kategori dan bulan memakai bincount / argsort / cumsum,
+# jadi tidak ada loop Python per baris transaksi.
+
+UKURAN_BACA = 200_000
+# Klasifikasi ABC berdasarkan porsi omzet kumulatif
+BATAS_A = 0.80
+BATAS_B = 0.95
+JUMLAH_TREN = 10
+
+SQL_BULAN = "(CAST(substr({kolom}, 1, 4) AS INTEGER) * 12 + CAST(substr({kolom}, 6, 2) AS INTEGER) - 1)"
+
+
+def butuh_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ValueError("Analitik butuh paket numpy (pip install numpy)")
+    return numpy
+
+
+def indeks_bulan(tanggal):
+    return int(tanggal[:4]) * 12 + int(tanggal[5:7]) - 1
+
+
+def nama_bulan(indeks):
+    return f"{indeks // 12:04d}-{indeks % 12 + 1:02d}"
+
+
+def baca_kolom(np, cur, sql, params, jumlah_kolom):
+    """Hasil query angka -> tuple array kolom, dibaca per potongan."""
+    cur.execute(sql, params)
+    potongan = []
+    while True:
+        baris = cur.fetchmany(UKURAN_BACA)
+        if not baris:
+            break
+        potongan.append(np.array(baris, dtype=np.int64))
+    if not potongan:
+        return tuple(np.zeros(0, dtype=np.int64) for _ in range(jumlah_kolom))
+    return tuple(np.concatenate(potongan).T)
+
+
+def bagi(np, a, b):
+    return np.divide(a, b, out=np.zeros(len(a)), where=b != 0)
+
+
+def analisis(conn, awal, akhir):
+    """Margin, sell-through, kecepatan, ABC dan tren bulanan untuk [awal, akhir)."""
+    np = butuh_numpy()
+    cur = conn.cursor()
+    cur.row_factory = None
+
+    cur.execute("SELECT rowid, id_barang, nama_barang, IFNULL(kategori, 'Lainnya') FROM barang ORDER BY rowid")
+    barang = cur.fetchall()
+    n = len(barang)
+    rowid = np.array([b[0] for b in barang], dtype=np.int64)
+    daftar_kategori = sorted({b[3] for b in barang})
+    posisi_kategori = {k: i for i, k in enumerate(daftar_kategori)}
+    kategori = np.array([posisi_kategori[b[3]] for b in barang], dtype=np.int64)
+    n_kategori = len(daftar_kategori)
+
+    hari = max(1, date.fromisoformat(akhir).toordinal() - date.fromisoformat(awal).toordinal())
+    bulan_awal = indeks_bulan(awal)
+    n_bulan = indeks_bulan(date.fromordinal(date.fromisoformat(akhir).toordinal() - 1).isoformat()) - bulan_awal + 1
+
+    # === BACA SEKALI ===
+    rid, bulan, qty, omzet, laba = baca_kolom(np, cur, f"""
+        SELECT b.rowid, {SQL_BULAN.format(kolom="i.tanggal")},
+               IFNULL(i.jumlah, 0), IFNULL(i.total, 0), IFNULL(i.laba, 0)
+        FROM penjualan_item i JOIN barang b ON b.id_barang = i.id_barang
+        WHERE i.tanggal >= ? AND i.tanggal < ?
+    """, (awal, akhir), 5)
+    idx = np.searchsorted(rowid, rid)
+    bulan = bulan - bulan_awal
+
+    rid_beli, qty_beli, total_beli = baca_kolom(np, cur, """
+        SELECT b.rowid, IFNULL(p.jumlah, 0), IFNULL(p.total_beli, 0)
+        FROM pembelian p JOIN barang b ON b.id_barang = p.id_barang
+        WHERE p.tanggal >= ? AND p.tanggal < ?
+    """, (awal, akhir), 3)
+    idx_beli = np.searchsorted(rowid, rid_beli)
+
+    posisi = posisi_stok(cur, awal)
+    stok_awal = np.array([max(0, posisi.get(b[1], {}).get("stok", 0)) for b in barang], dtype=np.float64)
+
+    # === PER BARANG ===
+    qty_b = np.bincount(idx, weights=qty, minlength=n)
+    omzet_b = np.bincount(idx, weights=omzet, minlength=n)
+    laba_b = np.bincount(idx, weights=laba, minlength=n)
+    qty_beli_b = np.bincount(idx_beli, weights=qty_beli, minlength=n)
+    beli_b = np.bincount(idx_beli, weights=total_beli, minlength=n)
+    margin_b = bagi(np, laba_b, omzet_b)
+    sell_through_b = bagi(np, qty_b, stok_awal + qty_beli_b)
+    kecepatan_b = qty_b / hari
+
+    # ABC: barang diurutkan menurut omzet; kelas dari porsi kumulatif sebelum barang itu
+    urut = np.argsort(-omzet_b, kind="stable")
+    total_omzet = omzet_b.sum()
+    porsi_sebelum = (np.cumsum(omzet_b[urut]) - omzet_b[urut]) / (total_omzet or 1)
+    kelas_urut = np.where(porsi_sebelum < BATAS_A, "A", np.where(porsi_sebelum < BATAS_B, "B", "C"))
+    kelas_urut[omzet_b[urut] <= 0] = "-"
+    kelas_b = np.empty(n, dtype=kelas_urut.dtype)
+    kelas_b[urut] = kelas_urut
+
+    # === PER KATEGORI ===
+    kat_baris = kategori[idx]
+    omzet_k = np.bincount(kat_baris, weights=omzet, minlength=n_kategori)
+    laba_k = np.bincount(kat_baris, weights=laba, minlength=n_kategori)
+    qty_k = np.bincount(kat_baris, weights=qty, minlength=n_kategori)
+    tersedia_k = np.bincount(kategori, weights=stok_awal + qty_beli_b, minlength=n_kategori)
+
+    # === TREN BULANAN ===
+    omzet_bulan = np.bincount(bulan, weights=omzet, minlength=n_bulan)
+    laba_bulan = np.bincount(bulan, weights=laba, minlength=n_bulan)
+    qty_bulan = np.bincount(bulan, weights=qty, minlength=n_bulan)
+    sebelumnya = np.concatenate(([0.0], omzet_bulan[:-1]))
+    tumbuh_bulan = bagi(np, omzet_bulan - sebelumnya, sebelumnya)
+    omzet_kat_bulan = np.bincount(kat_baris * n_bulan + bulan, weights=omzet,
+                                  minlength=n_kategori * n_bulan).reshape(n_kategori, n_bulan)
+
+    # Barang yang paling naik / turun di bulan terakhir dibanding bulan sebelumnya
+    naik = turun = []
+    if n_bulan >= 2:
+        pilih = bulan >= n_bulan - 2
+        matriks = np.bincount(idx[pilih] * 2 + (bulan[pilih] - (n_bulan - 2)), weights=omzet[pilih],
+                              minlength=n * 2).reshape(n, 2)
+        selisih = matriks[:, 1] - matriks[:, 0]
+        urut_selisih = np.argsort(selisih, kind="stable")
+
+        def baris_tren(i):
+            return {"id_barang": barang[i][1], "nama_barang": barang[i][2],
+                    "sebelum": int(matriks[i, 0]), "sesudah": int(matriks[i, 1]), "selisih": int(selisih[i])}
+
+        naik = [baris_tren(i) for i in urut_selisih[::-1][:JUMLAH_TREN] if selisih[i] > 0]
+        turun = [baris_tren(i) for i in urut_selisih[:JUMLAH_TREN] if selisih[i] < 0]
+
+    aktif = np.flatnonzero((omzet_b != 0) | (qty_beli_b != 0))
+    aktif = aktif[np.argsort(-omzet_b[aktif], kind="stable")]
+    return {
+        "awal": awal,
+        "akhir": akhir,
+        "baris": int(len(idx)),
+        "total": {"omzet": int(total_omzet), "laba": int(laba_b.sum()), "qty": int(qty_b.sum()),
+                  "margin": float(laba_b.sum() / total_omzet) if total_omzet else 0.0},
+        "barang": [{
+            "id_barang": barang[i][1],
+            "nama_barang": barang[i][2],
+            "kategori": barang[i][3],
+            "qty": int(qty_b[i]),
+            "omzet": int(omzet_b[i]),
+            "laba": int(laba_b[i]),
+            "margin": float(margin_b[i]),
+            "qty_beli": int(qty_beli_b[i]),
+            "pembelian": int(beli_b[i]),
+            "sell_through": float(sell_through_b[i]),
+            "kecepatan": float(kecepatan_b[i]),
+            "kelas": str(kelas_b[i]),
+        } for i in aktif],
+        "kategori": [{
+            "kategori": daftar_kategori[k],
+            "qty": int(qty_k[k]),
+            "omzet": int(omzet_k[k]),
+            "laba": int(laba_k[k]),
+            "margin": float(laba_k[k] / omzet_k[k]) if omzet_k[k] else 0.0,
+            "sell_through": float(qty_k[k] / tersedia_k[k]) if tersedia_k[k] else 0.0,
+            "bulanan": [int(v) for v in omzet_kat_bulan[k]],
+        } for k in np.argsort(-omzet_k, kind="stable") if omzet_k[k] != 0],
+        "bulan": [{
+            "bulan": nama_bulan(bulan_awal + b),
+            "omzet": int(omzet_bulan[b]),
+            "laba": int(laba_bulan[b]),
+            "qty": int(qty_bulan[b]),
+            "tumbuh": float(tumbuh_bulan[b]) if b > 0 and sebelumnya[b] else None,
+        } for b in range(n_bulan)],
+        "kelas": {k: int((kelas_b == k).sum()) for k in ("A", "B", "C")},
+        "naik": naik,
+        "turun": turun,
+    }
@@ -1,28 +1,89 @@
-from datetime import datetime
-from flask import Flask, request, render_template, redirect
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date, timedelta
+
+import click
+from flask import Flask, request, render_template, redirect, jsonify, Response, send_file, stream_with_context
+
+import aset
+import cache
+import db
+import metrik
+import outlet
+from db import get_db, buka_koneksi, migrasi, jalankan_migrasi, generate_id, mulai_tulis, DatabaseSibuk
+from notifikasi import antre_wa, jalankan_pengirim, bangunkan_pengirim, hitung_outbox
+from sinkron_sheet import jalankan_sinkron
+from rekap import KOLOM_REKAP_BARANG, ambil_rekap, ambil_rekap_barang, bangun_ulang_rekap, buat_trigger_rekap
+from datatables import layani_datatables
+from impor import JENIS_IMPOR, baca_berkas
+from ekspor import EKSPOR, baris_ekspor, stream_csv, tulis_xlsx
+from pencarian import BATAS_HASIL, cari_barang, cari_pelanggan, info_barang
+from stok import catat_penyesuaian, jalankan_snapshot, posisi_stok
+from analitik import analisis
+from restok import daftar_restok, jalankan_ringkasan, perbarui_kecepatan
+import peristiwa
+from cadangan import buat_cadangan, daftar_cadangan, jalankan_penjadwal, pulihkan
 
 app = Flask(__name__)
-
-# Koneksi ke Google Sheets
-scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-creds = ServiceAccountCredentials.from_json_keyfile_name("credentials.json", scope)
-client = gspread.authorize(creds)
-
-sheet = client.open("poswaserda").worksheet("Data Barang")
+db.init_app(app)
+# Worker latar mencatat lewat logger "pos.*" ke handler yang sama dengan app.logger
+log_worker = logging.getLogger("pos")
+log_worker.setLevel(logging.INFO)
+log_worker.handlers = app.logger.handlers
+log_worker.propagate = False
+aset.init_app(app)
+
+# Database yang sudah dimigrasi di proses ini
+_db_siap = set()
+_db_siap_lock = threading.Lock()
+
+
+def siapkan_db(path):
+    """Jalankan migrasi sekali per database sebelum dipakai."""
+    if path in _db_siap:
+        return
+    with _db_siap_lock:
+        if path not in _db_siap:
+            conn = buka_koneksi(path)
+            jalankan_migrasi(conn)
+            conn.close()
+            _db_siap.add(path)
+
+
+def daftar_db():
+    """[(kode outlet, path database)] yang dilayani; kode None untuk mode satu toko."""
+    if outlet.aktif():
+        return list(outlet.daftar_outlet().items())
+    return [(None, app.config["DB_PATH"])]
+
+
+def status_outbox():
+    if not outlet.aktif():
+        return hitung_outbox(get_db().cursor())
+    jumlah = Counter()
+    for _, path in daftar_db():
+        conn = buka_koneksi(path)
+        try:
+            for status, n in hitung_outbox(conn.cursor()):
+                jumlah[status] += n
+        finally:
+            conn.close()
+    return sorted(jumlah.items())
+
+
+outlet.init_app(app, siapkan_db)
+metrik.init_app(app, status_outbox)
 
 @app.route("/barang", methods=["GET", "POST"])
 def index():
-    import sqlite3
-    conn = sqlite3.connect("pos.db")
-    conn.row_factory = sqlite3.Row
+    conn = get_db()
     cursor = conn.cursor()
 
-    # Ambil semua data dari database
-    cursor.execute("SELECT * FROM barang")
-    data = cursor.fetchall()
-
     # Deteksi ID yang sedang diedit
     edit_id = request.args.get("edit")
     item_edit = None
@@ -31,6 +92,7 @@ def index():
         item_edit = cursor.fetchone()
 
     if request.method == "POST":
+        mulai_tulis(conn)
         id_barang = request.form["id_barang"].strip()
         nama_barang = request.form["nama_barang"]
         satuan = request.form["satuan"]
@@ -60,50 +122,141 @@ def index():
     ]
 
     return render_template("index.html",
-                           data=data,
                            item_edit=item_edit,
                            satuan_options=satuan_options,
                            kategori_options=kategori_options)
 
+
+@app.route("/barang/penyesuaian", methods=["POST"])
+def penyesuaian_stok():
+    """Koreksi stok dari hasil hitung fisik; selisihnya dicatat di jurnal mutasi."""
+    conn = get_db()
+    id_barang = request.form["id_barang"]
+    try:
+        stok_fisik = int(request.form["stok_fisik"])
+    except ValueError:
+        return "Stok fisik harus berupa angka", 400
+    mulai_tulis(conn)
+    cur = conn.cursor()
+    try:
+        selisih, id_mutasi = catat_penyesuaian(cur, id_barang, stok_fisik, request.form.get("keterangan", ""))
+    except ValueError as e:
+        conn.rollback()
+        return str(e), 404
+    if selisih:
+        sesuaikan_lapisan_fifo(cur, f"OPN{id_mutasi}", id_barang, selisih)
+    perbarui_kecepatan(cur)
+    peristiwa.catat_perubahan(cur, id_barang=[id_barang])
+    conn.commit()
+    peristiwa.umumkan(conn.path)
+    return redirect(f"/barang?edit={id_barang}")
+
+# === DATA TABEL (DataTables server-side) ===
+@app.route("/api/barang")
+def api_barang():
+    cur = get_db().cursor()
+    return jsonify(layani_datatables(cur, "barang",
+                                     kolom=["id_barang", "nama_barang", "satuan", "kategori", "stok_akhir"],
+                                     kolom_urut=["nama_barang", "stok_akhir"],
+                                     kolom_cari=["nama_barang", "kategori"],
+                                     args=request.args,
+                                     urutan_bawaan="id_barang"))
+
+
+@app.route("/api/stok")
+def api_stok():
+    """Posisi stok & harga beli terakhir per barang di akhir ?tanggal=YYYY-MM-DD."""
+    try:
+        tanggal = date.fromisoformat(request.args.get("tanggal", str(date.today())))
+    except ValueError:
+        return jsonify({"error": "tanggal tidak valid"}), 400
+    cur = get_db().cursor()
+    posisi = posisi_stok(cur, str(tanggal + timedelta(days=1)))
+    barang = cache.katalog(cur, "barang")
+    return jsonify({
+        "tanggal": str(tanggal),
+        "data": [{"id_barang": idb, "nama_barang": barang.get(idb, {}).get("nama_barang"), **pos}
+                 for idb, pos in sorted(posisi.items())],
+    })
+
+
+@app.route("/restok")
+def restok():
+    """Barang yang perlu dipesan: hari stok tersisa & saran jumlah pesan."""
+    semua = request.args.get("semua") == "1"
+    daftar = daftar_restok(get_db().cursor(), semua=semua)
+    return render_template("restok.html", daftar=daftar, semua=semua,
+                           total_biaya=sum(b["perkiraan_biaya"] for b in daftar if b["perlu_pesan"]))
+
+
+@app.route("/api/restok")
+def api_restok():
+    cur = get_db().cursor()
+    return jsonify({"data": daftar_restok(cur, semua=request.args.get("semua") == "1")})
+
+
+@app.route("/api/pelanggan")
+def api_pelanggan():
+    cur = get_db().cursor()
+    return jsonify(layani_datatables(cur, "pelanggan",
+                                     kolom=["id_pelanggan", "nama", "wa"],
+                                     kolom_urut=["nama", "wa"],
+                                     kolom_cari=["nama", "wa"],
+                                     args=request.args,
+                                     urutan_bawaan="id_pelanggan"))
+
+
+@app.route("/api/pengeluaran")
+def api_pengeluaran():
+    cur = get_db().cursor()
+    return jsonify(layani_datatables(cur, "pengeluaran",
+                                     kolom=["id_pengeluaran", "tanggal", "kategori", "jumlah", "keterangan"],
+                                     kolom_urut=["tanggal", "jumlah", "keterangan"],
+                                     kolom_cari=["tanggal", "kategori", "keterangan"],
+                                     args=request.args,
+                                     urutan_bawaan="id_pengeluaran"))
+
+# === PENCARIAN (Select2 ajax) ===
+@app.route("/api/cari/barang")
+def api_cari_barang():
+    cur = get_db().cursor()
+    hasil = cari_barang(cur, request.args.get("q", ""),
+                        batas=min(request.args.get("limit", BATAS_HASIL, type=int), 100),
+                        hanya_tersedia=request.args.get("tersedia") == "1")
+    return jsonify({"results": [
+        dict(b, id=b["id_barang"], text=f'{b["nama_barang"]} - {b["stok_akhir"]}') for b in hasil
+    ]})
+
+
+@app.route("/api/cari/pelanggan")
+def api_cari_pelanggan():
+    cur = get_db().cursor()
+    hasil = cari_pelanggan(cur, request.args.get("q", ""),
+                           batas=min(request.args.get("limit", BATAS_HASIL, type=int), 100))
+    return jsonify({"results": [
+        dict(p, id=p["id_pelanggan"], text=f'{p["id_pelanggan"]} - {p["nama"]}') for p in hasil
+    ]})
+
 @app.route("/pembelian", methods=["GET", "POST"])
 def pembelian():
-    import sqlite3
-    from datetime import date
-
-    conn = sqlite3.connect("pos.db")
-    conn.row_factory = sqlite3.Row
+    conn = get_db()
     cur = conn.cursor()
 
-    # Ambil barang untuk dropdown
-    cur.execute("SELECT * FROM barang")
-    barang_data = cur.fetchall()
+    # Ambil barang untuk dropdown (dari cache katalog)
+    barang_data = cache.katalog(cur, "barang").values()
     barang_options = [{"id": row["id_barang"], "nama": row["nama_barang"], "stok": row["stok_akhir"], "satuan": row["satuan"]} for row in barang_data]
 
-    # Tambah stok ke kolom stok_akhir
-    def tambah_stok_akhir(id_barang, jumlah):
-        cur.execute("SELECT stok_akhir FROM barang WHERE id_barang = ?", (id_barang,))
-        row = cur.fetchone()
-        stok_lama = row["stok_akhir"] if row else 0
-        stok_baru = stok_lama + jumlah
-        cur.execute("UPDATE barang SET stok_akhir = ? WHERE id_barang = ?", (stok_baru, id_barang))
-
-    def kurangi_stok_akhir(id_barang, jumlah):
-        cur.execute("SELECT stok_akhir FROM barang WHERE id_barang = ?", (id_barang,))
-        row = cur.fetchone()
-        stok_lama = row["stok_akhir"] if row else 0
-        stok_baru = max(0, stok_lama - jumlah)
-        cur.execute("UPDATE barang SET stok_akhir = ? WHERE id_barang = ?", (stok_baru, id_barang))
-
     # Ambil semua pembelian
     now = datetime.today()
     bulan = f"{now.month:02d}"   # Format dua digit, misalnya '08'
     tahun = str(now.year)        # Misalnya '2025'
+    awal, akhir = rentang_bulan(bulan, tahun)
 
     # Query berdasarkan bulan dan tahun saat ini
     cur.execute("""
         SELECT * FROM pembelian
-        WHERE strftime('%m', tanggal) = ? AND strftime('%Y', tanggal) = ?
-    """, (bulan, tahun)) 
+        WHERE tanggal >= ? AND tanggal < ?
+    """, (awal, akhir)) 
     pembelian_data = cur.fetchall()
 
     # MODE EDIT
@@ -115,6 +268,7 @@ def pembelian():
 
     # POST: TAMBAH / EDIT
     if request.method == "POST":
+        mulai_tulis(conn)
         id_barang = request.form["id_barang"]
         jumlah = int(request.form["jumlah"])
         harga = int(request.form["harga_beli"])
@@ -126,14 +280,38 @@ def pembelian():
         nama_barang = next((b["nama"] for b in barang_options if b["id"] == id_barang), "Tidak ditemukan")
 
         id_pembelian = request.form.get("id_pembelian")
+        berubah_tanggal, berubah_barang = [today], [id_barang]
         if id_pembelian and id_pembelian.startswith("PB"):
             # MODE EDIT
             cur.execute("SELECT * FROM pembelian WHERE id_pembelian = ?", (id_pembelian,))
             row = cur.fetchone()
             if row:
+                berubah_tanggal.append(row["tanggal"])
+                berubah_barang.append(row["id_barang"])
                 id_barang_lama = row["id_barang"]
                 jumlah_lama = row["jumlah"]
-                kurangi_stok_akhir(id_barang_lama, jumlah_lama)
+                # Barang yang sudah terjual tidak bisa "dibatalkan belinya":
+                # stok (dan jurnal mutasi) tidak boleh jadi negatif
+                cur.execute("SELECT stok_akhir FROM barang WHERE id_barang = ?", (id_barang_lama,))
+                stok_lama = cur.fetchone()
+                sisa = (stok_lama["stok_akhir"] if stok_lama else 0) - jumlah_lama
+                if id_barang == id_barang_lama:
+                    sisa += jumlah
+                if sisa < 0:
+                    conn.rollback()
+                    return f"Stok {row['nama_barang']} akan jadi {sisa}: sebagian pembelian ini sudah terjual", 400
+                # Penjualan yang sudah memakai lapisan ini tidak dihitung ulang HPP-nya,
+                # jadi qty terjualnya harus tetap ada di lapisan ini
+                terpakai = lapisan_terpakai(cur, id_pembelian)
+                if terpakai and id_barang != id_barang_lama:
+                    conn.rollback()
+                    return f"Barang tidak bisa diganti: {terpakai} dari pembelian ini sudah terjual", 400
+                if jumlah < terpakai:
+                    conn.rollback()
+                    return f"Jumlah minimal {terpakai}: sebanyak itu dari pembelian ini sudah terjual", 400
+                # Stok diubah dengan delta atomik, bukan baca-lalu-tulis
+                cur.execute("UPDATE barang SET stok_akhir = stok_akhir - ? WHERE id_barang = ?",
+                            (jumlah_lama, id_barang_lama))
 
                 cur.execute("""
                     UPDATE pembelian
@@ -141,7 +319,15 @@ def pembelian():
                     WHERE id_pembelian=?
                 """, (today, id_barang, nama_barang, jumlah, harga, total, keterangan, id_pembelian))
 
-                tambah_stok_akhir(id_barang, jumlah)
+                cur.execute("UPDATE barang SET stok_akhir = stok_akhir + ? WHERE id_barang = ?", (jumlah, id_barang))
+
+                # Sesuaikan lapisan FIFO: qty yang sudah terjual tetap terpakai
+                cur.execute("""
+                    UPDATE stok_lapisan
+                    SET tanggal=?, id_barang=?, harga_beli=?,
+                        sisa=? - (jumlah - sisa), jumlah=?
+                    WHERE id_pembelian=?
+                """, (today, id_barang, harga, jumlah, jumlah, id_pembelian))
 
         else:
             # MODE TAMBAH: generate ID baru 
@@ -151,10 +337,17 @@ def pembelian():
                                        jumlah, harga_beli, total_beli, keterangan)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             """, (new_id, today, id_barang, nama_barang, jumlah, harga, total, keterangan))
+            cur.execute("""
+                INSERT INTO stok_lapisan (id_pembelian, id_barang, tanggal, harga_beli, jumlah, sisa)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (new_id, id_barang, today, harga, jumlah, jumlah))
 
-            tambah_stok_akhir(id_barang, jumlah)
+            cur.execute("UPDATE barang SET stok_akhir = stok_akhir + ? WHERE id_barang = ?", (jumlah, id_barang))
 
+        perbarui_kecepatan(cur)
+        peristiwa.catat_perubahan(cur, tanggal=berubah_tanggal, id_barang=berubah_barang)
         conn.commit()
+        peristiwa.umumkan(conn.path)
         return redirect("/pembelian")
 
     return render_template("pembelian.html",
@@ -163,11 +356,236 @@ def pembelian():
                            item_edit=item_edit)
 
 
-def generate_id(table, prefix, cur):
-    cur.execute(f"SELECT id_{table} FROM {table} WHERE id_{table} LIKE '{prefix}%'")
-    existing = [int(row[0][len(prefix):]) for row in cur.fetchall()]
-    new_num = max(existing) + 1 if existing else 1
-    return f"{prefix}{new_num:03d}"
+@app.route("/pembelian/hapus", methods=["POST"])
+def hapus_pembelian():
+    """Hapus pembelian yang belum terjual; stok dan lapisannya ikut ditarik."""
+    conn = get_db()
+    cur = conn.cursor()
+    id_pembelian = request.form["id_pembelian"]
+    mulai_tulis(conn)
+    cur.execute("SELECT * FROM pembelian WHERE id_pembelian = ?", (id_pembelian,))
+    row = cur.fetchone()
+    if row is None:
+        conn.rollback()
+        return "Pembelian tidak ditemukan", 404
+    terpakai = lapisan_terpakai(cur, id_pembelian)
+    if terpakai:
+        conn.rollback()
+        return f"Tidak bisa dihapus: {terpakai} dari pembelian ini sudah terjual", 400
+
+    cur.execute("DELETE FROM pembelian WHERE id_pembelian = ?", (id_pembelian,))
+    cur.execute("DELETE FROM stok_lapisan WHERE id_pembelian = ?", (id_pembelian,))
+    cur.execute("UPDATE barang SET stok_akhir = stok_akhir - ? WHERE id_barang = ?",
+                (row["jumlah"], row["id_barang"]))
+    perbarui_kecepatan(cur)
+    peristiwa.catat_perubahan(cur, tanggal=[row["tanggal"]], id_barang=[row["id_barang"]])
+    conn.commit()
+    peristiwa.umumkan(conn.path)
+    return redirect("/pembelian")
+
+
+def rentang_bulan(bulan, tahun):
+    # Batas [awal, akhir) satu bulan; perbandingan langsung pada kolom
+    # tanggal bisa memakai index, beda dengan strftime(tanggal).
+    bulan, tahun = int(bulan), int(tahun)
+    if not 1 <= bulan <= 12:
+        raise ValueError("bulan tidak valid")
+    awal = f"{tahun:04d}-{bulan:02d}-01"
+    if bulan == 12:
+        akhir = f"{tahun + 1:04d}-01-01"
+    else:
+        akhir = f"{tahun:04d}-{bulan + 1:02d}-01"
+    return awal, akhir
+
+
+# === LAPISAN STOK FIFO ===
+# Setiap pembelian menjadi satu lapisan dengan sisa qty. Penjualan menghabiskan
+# lapisan tertua lebih dulu, dan pemakaiannya dicatat di penjualan_lapisan agar
+# bisa dikembalikan saat transaksi diedit.
+@migrasi(1)
+def init_lapisan_fifo(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='stok_lapisan'")
+    sudah_ada = cur.fetchone() is not None
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS stok_lapisan (
+            id_pembelian TEXT PRIMARY KEY,
+            id_barang TEXT,
+            tanggal TEXT,
+            harga_beli INTEGER,
+            jumlah INTEGER,
+            sisa INTEGER
+        )
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_stok_lapisan_aktif
+        ON stok_lapisan (id_barang, tanggal, id_pembelian) WHERE sisa > 0
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS penjualan_lapisan (
+            id_penjualan TEXT,
+            id_barang TEXT,
+            id_pembelian TEXT,
+            jumlah INTEGER
+        )
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_penjualan_lapisan_trx
+        ON penjualan_lapisan (id_penjualan)
+    """)
+
+    if not sudah_ada:
+        # Isi awal dari riwayat: semua pembelian jadi lapisan penuh,
+        # lalu penjualan lama diputar ulang sesuai urutan tanggal.
+        cur.execute("""
+            INSERT INTO stok_lapisan (id_pembelian, id_barang, tanggal, harga_beli, jumlah, sisa)
+            SELECT id_pembelian, id_barang, tanggal, harga_beli, jumlah, jumlah FROM pembelian
+        """)
+        cur.execute("SELECT id_penjualan, id_barang, jumlah FROM penjualan ORDER BY tanggal, rowid")
+        for row in cur.fetchall():
+            ambil_lapisan_fifo(conn.cursor(), row[0], row[1], row[2])
+
+
+@migrasi(16)
+def init_urutan_lapisan(conn):
+    # Lapisan bertanggal sama diurutkan menurut urutan masuk (rowid), bukan
+    # id_pembelian: sebagai teks PB1000 < PB999 dan OPN... < PB.... Index
+    # sudah menyimpan rowid di ujung kuncinya.
+    conn.execute("DROP INDEX IF EXISTS idx_stok_lapisan_aktif")
+    conn.execute("""
+        CREATE INDEX idx_stok_lapisan_aktif
+        ON stok_lapisan (id_barang, tanggal) WHERE sisa > 0
+    """)
+
+
+def ambil_lapisan_fifo(cur, id_penjualan, id_barang, jumlah_jual):
+    """Habiskan lapisan tertua untuk satu baris penjualan, kembalikan total HPP."""
+    cur.execute("""
+        SELECT id_pembelian, harga_beli, sisa FROM stok_lapisan
+        WHERE id_barang = ? AND sisa > 0
+        ORDER BY tanggal, rowid
+    """, (id_barang,))
+
+    total_hpp = 0
+    sisa = jumlah_jual
+    pemakaian = []
+    for id_pembelian, harga, qty in cur:
+        ambil = min(sisa, qty)
+        total_hpp += ambil * harga
+        sisa -= ambil
+        pemakaian.append((id_pembelian, ambil))
+        if sisa == 0:
+            break
+
+    if sisa > 0:
+        # Stok di lapisan kurang: sisanya dihitung pakai harga beli terakhir
+        cur.execute("""
+            SELECT harga_beli FROM stok_lapisan WHERE id_barang = ?
+            ORDER BY tanggal DESC, rowid DESC LIMIT 1
+        """, (id_barang,))
+        row = cur.fetchone()
+        total_hpp += sisa * (row[0] if row else 0)
+
+    for id_pembelian, ambil in pemakaian:
+        cur.execute("UPDATE stok_lapisan SET sisa = sisa - ? WHERE id_pembelian = ?", (ambil, id_pembelian))
+        cur.execute("""
+            INSERT INTO penjualan_lapisan (id_penjualan, id_barang, id_pembelian, jumlah)
+            VALUES (?, ?, ?, ?)
+        """, (id_penjualan, id_barang, id_pembelian, ambil))
+
+    return total_hpp
+
+
+def lapisan_terpakai(cur, id_pembelian):
+    """Qty lapisan satu pembelian yang sudah dipakai penjualan / susut opname."""
+    cur.execute("SELECT jumlah - sisa FROM stok_lapisan WHERE id_pembelian = ?", (id_pembelian,))
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+
+def kembalikan_lapisan_fifo(cur, id_penjualan):
+    """Kembalikan qty lapisan yang dipakai satu transaksi penjualan."""
+    cur.execute("SELECT id_pembelian, jumlah FROM penjualan_lapisan WHERE id_penjualan = ?", (id_penjualan,))
+    for id_pembelian, jumlah in cur.fetchall():
+        cur.execute("UPDATE stok_lapisan SET sisa = sisa + ? WHERE id_pembelian = ?", (jumlah, id_pembelian))
+    cur.execute("DELETE FROM penjualan_lapisan WHERE id_penjualan = ?", (id_penjualan,))
+
+
+def sesuaikan_lapisan_fifo(cur, ref, id_barang, selisih):
+    """Ikutkan lapisan FIFO pada stok opname.
+
+    Susut diambil dari lapisan tertua (tercatat di penjualan_lapisan dengan
+    id ref); kelebihan jadi lapisan baru berharga beli terakhir.
+    """
+    if selisih < 0:
+        ambil_lapisan_fifo(cur, ref, id_barang, -selisih)
+        return
+    cur.execute("""
+        SELECT harga_beli FROM stok_lapisan WHERE id_barang = ?
+        ORDER BY tanggal DESC, rowid DESC LIMIT 1
+    """, (id_barang,))
+    row = cur.fetchone()
+    cur.execute("""
+        INSERT INTO stok_lapisan (id_pembelian, id_barang, tanggal, harga_beli, jumlah, sisa)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (ref, id_barang, str(date.today()), row[0] if row else 0, selisih, selisih))
+
+
+def hitung_hpp_fifo(cur, id_penjualan, id_barang, jumlah_jual):
+    if jumlah_jual == 0:
+        return 0
+    total_hpp = ambil_lapisan_fifo(cur, id_penjualan, id_barang, jumlah_jual)
+    return round(total_hpp / jumlah_jual)
+
+
+def simpan_penjualan(cur, id_penjualan, tanggal, id_pelanggan, catatan, items, barang_dict, pelanggan_dict):
+    """Tulis satu transaksi (header, baris, stok, HPP FIFO, nota WA) di transaksi berjalan.
+
+    items: [(id_barang, jumlah, harga_jual)]. Untuk edit, baris lama harus
+    sudah dihapus dan stoknya dikembalikan.
+    """
+    item_list = []
+    baris_item = []
+    total_all = 0
+    laba_all = 0
+
+    for id_barang, jumlah, harga_jual in items:
+        nama_barang = barang_dict[id_barang]["nama_barang"]
+        total = jumlah * harga_jual
+        hpp_unit = hitung_hpp_fifo(cur, id_penjualan, id_barang, jumlah)
+        laba = (harga_jual - hpp_unit) * jumlah
+
+        baris_item.append((id_penjualan, tanggal, id_barang, nama_barang,
+                           jumlah, harga_jual, total, hpp_unit, laba))
+
+        # Kurangi stok
+        cur.execute("UPDATE barang SET stok_akhir = stok_akhir - ? WHERE id_barang = ?", (jumlah, id_barang))
+
+        item_list.append({"nama": nama_barang, "jumlah": jumlah, "harga": harga_jual})
+        total_all += total
+        laba_all += laba
+
+    # Header menyimpan total transaksi, jadi daftar & nota tidak perlu menjumlah baris
+    cur.execute("""
+        INSERT INTO penjualan (id_penjualan, tanggal, id_pelanggan, catatan, total, laba)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(id_penjualan) DO UPDATE SET
+            tanggal = excluded.tanggal, id_pelanggan = excluded.id_pelanggan,
+            catatan = excluded.catatan, total = excluded.total, laba = excluded.laba
+    """, (id_penjualan, tanggal, id_pelanggan, catatan, total_all, laba_all))
+    cur.executemany("""
+        INSERT INTO penjualan_item (id_penjualan, tanggal, id_barang, nama_barang,
+                                    jumlah, harga_jual, total, hpp_unit, laba)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, baris_item)
+
+    # Nota masuk outbox dalam transaksi yang sama, dikirim oleh worker
+    nama_pelanggan = pelanggan_dict.get(id_pelanggan, {}).get("nama", "Tidak Dikenal")
+    nomor_wa = pelanggan_dict.get(id_pelanggan, {}).get("wa", "")
+    nota = format_wa_nota(tanggal, nama_pelanggan, nomor_wa, item_list, total_all, catatan)
+    antre_wa(cur, nomor_wa, nota, id_penjualan)
+    return total_all
 
 
 def format_wa_nota(tanggal, nama_pelanggan, nomor_wa, item_list, total, catatan):
@@ -192,21 +610,53 @@ def format_wa_nota(tanggal, nama_pelanggan, nomor_wa, item_list, total, catatan)
 
     return "\n".join(lines)
 
-import requests
+# Dengan beberapa proses worker (gunicorn), worker latar hanya dijalankan di
+# proses yang memegang kunci berkas POS_KUNCI_LATAR. Kunci lepas sendiri saat
+# proses mati, lalu diambil alih proses lain di request berikutnya.
+KUNCI_LATAR = os.environ.get("POS_KUNCI_LATAR")
+JEDA_COBA_KUNCI = 30
+_kunci_latar = None
+_coba_kunci_berikutnya = 0
 
-def kirim_wa(nomor_wa, pesan):
-    endpoint = "http://194.163.184.129:3001/send-message"
-    payload = {
-        "number": nomor_wa,
-        "message": pesan
-    }
+
+def pegang_kunci_latar():
+    global _kunci_latar, _coba_kunci_berikutnya
+    if not KUNCI_LATAR or _kunci_latar is not None:
+        return True
+    if time.monotonic() < _coba_kunci_berikutnya:
+        return False
+    _coba_kunci_berikutnya = time.monotonic() + JEDA_COBA_KUNCI
+
+    import fcntl
+    berkas = open(KUNCI_LATAR, "a")
     try:
-        response = requests.post(endpoint, json=payload)
-        return response.status_code == 200
-    except Exception as e:
-        print("Gagal kirim WA:", e)
+        fcntl.flock(berkas, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        berkas.close()
         return False
-    
+    _kunci_latar = berkas
+    return True
+
+
+@app.before_request
+def mulai_worker():
+    if not pegang_kunci_latar():
+        return
+    for kode, path in daftar_db():
+        siapkan_db(path)
+        jalankan_pengirim(path)
+        # Koneksi ke Google Sheets dibuka malas oleh worker sinkron
+        jalankan_sinkron(path, kode)
+        jalankan_snapshot(path)
+        jalankan_penjadwal(path)
+        jalankan_ringkasan(path, kode)
+
+
+@app.errorhandler(DatabaseSibuk)
+def database_sibuk(e):
+    return "Database sedang sibuk, silakan coba lagi.", 503, {"Retry-After": "1"}
+
+
 def format_rupiah(angka):
     return f"Rp {angka:,.0f}".replace(",", ".")
 
@@ -215,42 +665,16 @@ app.jinja_env.filters["rupiah"] = format_rupiah
 @app.route("/", methods=["GET", "POST"])
 @app.route("/penjualan", methods=["GET", "POST"])
 def penjualan():
-    import sqlite3
-    from datetime import date
-
-    conn = sqlite3.connect("pos.db")
-    conn.row_factory = sqlite3.Row
+    conn = get_db()
     cur = conn.cursor()
 
-    # Ambil data referensi
-    cur.execute("SELECT * FROM pelanggan")
-    pelanggan_data = cur.fetchall()
-    pelanggan_dict = {row["id_pelanggan"]: {"nama": row["nama"], "wa": row["wa"]} for row in pelanggan_data}
-
-    cur.execute("SELECT * FROM barang")
-    barang_data = cur.fetchall()
-    barang_dict = {row["id_barang"]: row for row in barang_data}
-
-    cur.execute("SELECT * FROM pembelian ORDER BY tanggal ASC")
-    pembelian_data = cur.fetchall()
-
-    # FIFO untuk HPP
-    def hitung_hpp_fifo(id_barang, jumlah_jual):
-        stok = [(row["jumlah"], row["harga_beli"]) for row in pembelian_data if row["id_barang"] == id_barang]
-        total_hpp = 0
-        sisa = jumlah_jual
-        for qty, harga in stok:
-            ambil = min(sisa, qty)
-            total_hpp += ambil * harga
-            sisa -= ambil
-            if sisa == 0:
-                break
-        if jumlah_jual == 0:
-            return 0
-        return round(total_hpp / jumlah_jual)
+    # Ambil data referensi; dimuat ulang hanya kalau barang/pelanggan berubah
+    pelanggan_dict = cache.katalog(cur, "pelanggan")
+    barang_dict = cache.katalog(cur, "barang")
 
     # FORM SUBMIT
     if request.method == "POST":
+        mulai_tulis(conn)
         edit_id = request.form.get("edit_id")
         is_edit = bool(edit_id)
 
@@ -263,204 +687,379 @@ def penjualan():
         catatan = request.form["catatan"]
         tanggal = str(date.today())
 
-        # Jika EDIT, kembalikan stok dulu & hapus penjualan lama
+        # Jika EDIT, kembalikan stok dulu & hapus baris lama
+        rows_lama = []
+        tanggal_lama = None
         if is_edit:
-            cur.execute("SELECT * FROM penjualan WHERE id_penjualan=?", (id_penjualan,))
+            cur.execute("SELECT tanggal FROM penjualan WHERE id_penjualan=?", (id_penjualan,))
+            header_lama = cur.fetchone()
+            tanggal_lama = header_lama["tanggal"] if header_lama else None
+            cur.execute("SELECT id_barang, jumlah FROM penjualan_item WHERE id_penjualan=?", (id_penjualan,))
             rows_lama = cur.fetchall()
             for row in rows_lama:
                 cur.execute("UPDATE barang SET stok_akhir = stok_akhir + ? WHERE id_barang = ?", (row["jumlah"], row["id_barang"]))
-            cur.execute("DELETE FROM penjualan WHERE id_penjualan=?", (id_penjualan,))
-
-        item_list = []
-        total_all = 0
-
-        for id_barang, jumlah_str, harga_str in zip(id_barang_list, jumlah_list, harga_list):
-            jumlah = int(jumlah_str)
-            harga_jual = int(harga_str)
-            nama_barang = barang_dict[id_barang]["nama_barang"]
-            total = jumlah * harga_jual
-            hpp_unit = hitung_hpp_fifo(id_barang, jumlah)
-            laba = (harga_jual - hpp_unit) * jumlah
-
-            # Tambahkan ke tabel
-            cur.execute("""
-                INSERT INTO penjualan (id_penjualan, tanggal, id_pelanggan, id_barang, nama_barang,
-                jumlah, harga_jual, total, catatan, hpp_unit, laba)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (id_penjualan, tanggal, id_pelanggan, id_barang, nama_barang,
-                  jumlah, harga_jual, total, catatan, hpp_unit, laba))
-
-            # Kurangi stok
-            cur.execute("UPDATE barang SET stok_akhir = stok_akhir - ? WHERE id_barang = ?", (jumlah, id_barang))
-
-            item_list.append({"nama": nama_barang, "jumlah": jumlah, "harga": harga_jual})
-            total_all += total
+            cur.execute("DELETE FROM penjualan_item WHERE id_penjualan=?", (id_penjualan,))
+            kembalikan_lapisan_fifo(cur, id_penjualan)
+
+        items = [(id_barang, int(jumlah), int(harga))
+                 for id_barang, jumlah, harga in zip(id_barang_list, jumlah_list, harga_list)]
+        total = simpan_penjualan(cur, id_penjualan, tanggal, id_pelanggan, catatan, items, barang_dict, pelanggan_dict)
+        perbarui_kecepatan(cur)
+        peristiwa.catat_perubahan(
+            cur, tanggal=[tanggal, tanggal_lama],
+            id_barang=[row["id_barang"] for row in rows_lama] + [item[0] for item in items],
+            penjualan=[{"id_penjualan": id_penjualan, "tanggal": tanggal, "total": total, "edit": is_edit,
+                        "pelanggan": pelanggan_dict.get(id_pelanggan, {}).get("nama", "Tidak Dikenal")}])
 
         conn.commit()
-
-        # Kirim nota
-        nama_pelanggan = pelanggan_dict.get(id_pelanggan, {}).get("nama", "Tidak Dikenal")
-        nomor_wa = pelanggan_dict.get(id_pelanggan, {}).get("wa", "")
-        nota = format_wa_nota(tanggal, nama_pelanggan, nomor_wa, item_list, total_all, catatan)
-        kirim_wa(nomor_wa, nota)
+        bangunkan_pengirim(conn.path)
+        peristiwa.umumkan(conn.path)
 
         return redirect("/penjualan")
 
     # TAMBAH / EDIT FORM
-    if request.args.get("tambah") or request.args.get("edit"):
-        barang_tersedia = [b for b in barang_data if b["stok_akhir"] > 0]
-        harga_terakhir = {}
-        for row in reversed(pembelian_data):
-            idb = row["id_barang"]
-            if idb not in harga_terakhir:
-                harga_terakhir[idb] = row["harga_beli"]
-
-        if request.args.get("edit"):
-            edit_id = request.args.get("edit")
-            cur.execute("SELECT * FROM penjualan WHERE id_penjualan = ?", (edit_id,))
-            rows = cur.fetchall()
-            if not rows:
-                return "Transaksi tidak ditemukan"
-            id_pelanggan = rows[0]["id_pelanggan"]
-            catatan = rows[0]["catatan"]
-            return render_template("penjualan_form.html",
-                                   pelanggan_data=pelanggan_data,
-                                   barang_data=barang_data,
-                                   harga_terakhir=harga_terakhir,
-                                   edit=True,
-                                   id_penjualan=edit_id,
-                                   selected_pelanggan=id_pelanggan,
-                                   catatan=catatan,
-                                   baris=rows)
-        else:
-            return render_template("penjualan_form.html",
-                                   pelanggan_data=pelanggan_data,
-                                   barang_data=barang_tersedia,
-                                   harga_terakhir=harga_terakhir)
+    # Daftar barang & pelanggan dimuat lewat /api/cari/* (Select2 ajax)
+    if request.args.get("edit"):
+        edit_id = request.args.get("edit")
+        cur.execute("SELECT * FROM penjualan WHERE id_penjualan = ?", (edit_id,))
+        header = cur.fetchone()
+        if header is None:
+            return "Transaksi tidak ditemukan"
+        cur.execute("SELECT * FROM penjualan_item WHERE id_penjualan = ? ORDER BY id", (edit_id,))
+        rows = cur.fetchall()
+        id_pelanggan = header["id_pelanggan"]
+        catatan = header["catatan"]
+        barang_edit = info_barang(cur, [row["id_barang"] for row in rows])
+        return render_template("penjualan_form.html",
+                               barang_edit=barang_edit,
+                               harga_terakhir={idb: b["harga_terakhir"] for idb, b in barang_edit.items()},
+                               edit=True,
+                               id_penjualan=edit_id,
+                               selected_pelanggan=id_pelanggan,
+                               nama_pelanggan=pelanggan_dict.get(id_pelanggan, {}).get("nama", ""),
+                               catatan=catatan,
+                               baris=rows)
+    if request.args.get("tambah"):
+        return render_template("penjualan_form.html", harga_terakhir={})
 
     # LIHAT NOTA
     if request.args.get("lihat"):
         lihat_id = request.args.get("lihat")
         cur.execute("SELECT * FROM penjualan WHERE id_penjualan = ?", (lihat_id,))
-        rows = cur.fetchall()
-        if not rows:
+        header = cur.fetchone()
+        if header is None:
             return "Transaksi tidak ditemukan"
 
-        tanggal = rows[0]["tanggal"]
-        id_pelanggan = rows[0]["id_pelanggan"]
-        nama_pelanggan = pelanggan_dict.get(id_pelanggan, {}).get("nama", "Tidak Dikenal")
-        catatan = rows[0]["catatan"]
-
-        item_list = []
-        total_all = 0
-        for row in rows:
-            item_list.append({
-                "nama": row["nama_barang"],
-                "jumlah": row["jumlah"],
-                "harga": row["harga_jual"]
-            })
-            total_all += row["total"]
-
-        return render_template("nota_penjualan.html",
-                               id_penjualan=lihat_id,
-                               tanggal=tanggal,
-                               nama_pelanggan=nama_pelanggan,
-                               catatan=catatan,
-                               item_list=item_list,
-                               total=total_all)
+        def buat_nota():
+            cur.execute("SELECT nama_barang, jumlah, harga_jual FROM penjualan_item WHERE id_penjualan = ? ORDER BY id",
+                        (lihat_id,))
+            id_pelanggan = header["id_pelanggan"]
+            item_list = [{"nama": row["nama_barang"], "jumlah": row["jumlah"], "harga": row["harga_jual"]}
+                         for row in cur.fetchall()]
+            return render_template("nota_penjualan.html",
+                                   id_penjualan=lihat_id,
+                                   tanggal=header["tanggal"],
+                                   nama_pelanggan=pelanggan_dict.get(id_pelanggan, {}).get("nama", "Tidak Dikenal"),
+                                   catatan=header["catatan"],
+                                   item_list=item_list,
+                                   total=header["total"])
+
+        # Nota bulan yang sudah tutup dilayani dari cache
+        tanggal = header["tanggal"]
+        if not tanggal or not cache.bulan_tutup(tanggal[:7]):
+            return buat_nota()
+        versi = cache.versi_data(cur, [f"periode:{tanggal[:7]}", "pelanggan"])
+        return cache.layani_html(("nota", conn.path, lihat_id) + versi, buat_nota)
     
-        # TAMPILKAN RINGKASAN TRANSAKSI
-    now = datetime.today()
-    bulan = f"{now.month:02d}"   # Format dua digit, misalnya '08'
-    tahun = str(now.year)        # Misalnya '2025'
-
-    # Query berdasarkan bulan dan tahun saat ini
-    cur.execute("""
-        SELECT * FROM penjualan
-        WHERE strftime('%m', tanggal) = ? AND strftime('%Y', tanggal) = ?
-    """, (bulan, tahun))
-    rows = cur.fetchall()
-    transaksi_dict = {}
-    for row in rows:
-        id_trans = row["id_penjualan"]
-        total = row["total"]
-        if id_trans not in transaksi_dict:
-            transaksi_dict[id_trans] = {
-                "tanggal": row["tanggal"],
-                "id_pelanggan": row["id_pelanggan"],
-                "nama_pelanggan": pelanggan_dict.get(row["id_pelanggan"], {}).get("nama", "Tidak Dikenal"),
-                "total": total
-            }
-        else:
-            transaksi_dict[id_trans]["total"] += total
+    # RIWAYAT: baris tabel diambil per halaman lewat /api/penjualan
+    return render_template("penjualan.html")
+
+
+@app.route("/api/penjualan")
+def api_penjualan():
+    """Header transaksi bulan berjalan, per halaman (DataTables server-side)."""
+    today = datetime.today()
+    awal, akhir = rentang_bulan(today.month, today.year)
+    cur = get_db().cursor()
+    return jsonify(layani_datatables(cur, """(
+                                         SELECT p.id_penjualan, p.tanggal, p.total,
+                                                IFNULL(pl.nama, 'Tidak Dikenal') AS nama_pelanggan
+                                         FROM penjualan p
+                                         LEFT JOIN pelanggan pl ON pl.id_pelanggan = p.id_pelanggan
+                                         WHERE p.tanggal >= ? AND p.tanggal < ?
+                                     )""",
+                                     kolom=["id_penjualan", "tanggal", "nama_pelanggan", "total"],
+                                     kolom_urut=["tanggal", "nama_pelanggan", "total"],
+                                     kolom_cari=["nama_pelanggan", "id_penjualan"],
+                                     args=request.args,
+                                     urutan_bawaan="tanggal DESC, id_penjualan DESC",
+                                     params_tabel=(awal, akhir)))
+
+
+MAKS_BATCH_PENJUALAN = 500
+
+
+def baca_penjualan_batch(data, barang_dict, pelanggan_dict):
+    """Validasi body JSON batch. Kembalikan (daftar penjualan, daftar error)."""
+    daftar = data.get("penjualan") if isinstance(data, dict) else None
+    if not isinstance(daftar, list) or not daftar:
+        return [], [{"indeks": "-", "error": "body harus berisi daftar 'penjualan'"}]
+    if len(daftar) > MAKS_BATCH_PENJUALAN:
+        return [], [{"indeks": "-", "error": f"maksimal {MAKS_BATCH_PENJUALAN} penjualan per batch"}]
+
+    hari_ini = str(date.today())
+    valid = []
+    error = []
+    for indeks, jual in enumerate(daftar):
+        try:
+            if not isinstance(jual, dict):
+                raise ValueError("penjualan harus berupa objek")
+            kunci = str(jual.get("kunci") or "").strip()
+            if not kunci or len(kunci) > 100:
+                raise ValueError("kunci wajib diisi (maks. 100 karakter)")
+            id_pelanggan = jual.get("id_pelanggan")
+            if id_pelanggan not in pelanggan_dict:
+                raise ValueError(f"id_pelanggan {id_pelanggan} tidak ditemukan")
+            tanggal = jual.get("tanggal") or hari_ini
+            if date.fromisoformat(tanggal).isoformat() != tanggal or tanggal > hari_ini:
+                raise ValueError(f"tanggal {tanggal} tidak valid")
+            item = jual.get("item")
+            if not isinstance(item, list) or not item:
+                raise ValueError("item kosong")
+            items = []
+            for baris in item:
+                id_barang = baris.get("id_barang") if isinstance(baris, dict) else None
+                if id_barang not in barang_dict:
+                    raise ValueError(f"id_barang {id_barang} tidak ditemukan")
+                jumlah, harga = int(baris.get("jumlah")), int(baris.get("harga_jual"))
+                if jumlah <= 0 or harga < 0:
+                    raise ValueError("jumlah harus > 0 dan harga_jual tidak boleh negatif")
+                items.append((id_barang, jumlah, harga))
+        except (TypeError, ValueError) as e:
+            error.append({"indeks": indeks, "error": str(e)})
+            continue
+        valid.append({"kunci": kunci, "tanggal": tanggal, "id_pelanggan": id_pelanggan,
+                      "catatan": str(jual.get("catatan") or ""), "items": items})
+    return valid, error
+
+
+@app.route("/api/penjualan/batch", methods=["POST"])
+def api_penjualan_batch():
+    """Simpan banyak penjualan sekaligus (sinkron kasir offline) dalam satu transaksi.
+
+    Tiap penjualan membawa kunci idempoten buatan klien; kunci yang sudah
+    pernah disimpan tidak ditulis ulang, cukup dikembalikan id_penjualan-nya.
+    """
+    conn = get_db()
+    cur = conn.cursor()
+    pelanggan_dict = cache.katalog(cur, "pelanggan")
+    barang_dict = cache.katalog(cur, "barang")
+
+    valid, error = baca_penjualan_batch(request.get_json(silent=True), barang_dict, pelanggan_dict)
+    if error:
+        # Semua atau tidak sama sekali: klien membetulkan lalu mengirim ulang batch utuh
+        return jsonify({"error": error}), 400
+
+    mulai_tulis(conn)
+    daftar_kunci = list({jual["kunci"] for jual in valid})
+    cur.execute(f"SELECT kunci, id_penjualan FROM penjualan_kunci WHERE kunci IN ({', '.join('?' * len(daftar_kunci))})",
+                daftar_kunci)
+    tersimpan = dict(cur.fetchall())
+
+    baru = []
+    for jual in valid:
+        if jual["kunci"] not in tersimpan:
+            tersimpan[jual["kunci"]] = None
+            baru.append(jual)
+
+    if baru:
+        pertama = generate_id("penjualan", "PJ", cur, jumlah=len(baru))
+        mulai = int(pertama[2:])
+        dibuat = datetime.now().isoformat(timespec="seconds")
+        for i, jual in enumerate(baru):
+            id_penjualan = f"PJ{mulai + i:03d}"
+            jual["total"] = simpan_penjualan(cur, id_penjualan, jual["tanggal"], jual["id_pelanggan"], jual["catatan"],
+                                             jual["items"], barang_dict, pelanggan_dict)
+            jual["id_penjualan"] = id_penjualan
+            tersimpan[jual["kunci"]] = id_penjualan
+        cur.executemany("INSERT INTO penjualan_kunci (kunci, id_penjualan, dibuat) VALUES (?, ?, ?)",
+                        [(jual["kunci"], jual["id_penjualan"], dibuat) for jual in baru])
+        perbarui_kecepatan(cur)
+        peristiwa.catat_perubahan(
+            cur, tanggal=[jual["tanggal"] for jual in baru],
+            id_barang=[item[0] for jual in baru for item in jual["items"]],
+            penjualan=[{"id_penjualan": jual["id_penjualan"], "tanggal": jual["tanggal"], "total": jual["total"],
+                        "edit": False, "pelanggan": pelanggan_dict.get(jual["id_pelanggan"], {}).get("nama", "Tidak Dikenal")}
+                       for jual in baru])
+    conn.commit()
+    if baru:
+        bangunkan_pengirim(conn.path)
+        peristiwa.umumkan(conn.path)
+
+    hasil = [{"kunci": jual["kunci"], "id_penjualan": tersimpan[jual["kunci"]],
+              "duplikat": jual.get("id_penjualan") is None}
+             for jual in valid]
+    return jsonify({"hasil": hasil})
+
+def baca_periode_laporan(args):
+    """(bulan, tahun, awal, akhir, dari, sampai) dari query string laporan."""
+    today = date.today()
+    bulan = args.get("bulan", f"{today.month:02d}")
+    tahun = args.get("tahun", str(today.year))
+    try:
+        awal, akhir = rentang_bulan(bulan, tahun)
+    except ValueError:
+        bulan, tahun = f"{today.month:02d}", str(today.year)
+        awal, akhir = rentang_bulan(bulan, tahun)
+
+    # Rentang bebas (mis. awal tahun s/d hari ini) lewat ?dari=&sampai=
+    dari = args.get("dari")
+    sampai = args.get("sampai")
+    if dari and sampai:
+        try:
+            awal = date.fromisoformat(dari).isoformat()
+            akhir = (date.fromisoformat(sampai) + timedelta(days=1)).isoformat()
+        except ValueError:
+            dari = sampai = None
+    return bulan, tahun, awal, akhir, dari, sampai
 
-    return render_template("penjualan.html", transaksi=transaksi_dict)
 
 @app.route("/laporan")
 def laporan():
-    import sqlite3
-    import datetime
-    from collections import defaultdict
-    from flask import request, render_template
-
-    conn = sqlite3.connect("pos.db")
-    conn.row_factory = sqlite3.Row
+    conn = get_db()
     cur = conn.cursor()
-
-    today = datetime.date.today()
-    bulan = request.args.get("bulan", f"{today.month:02d}")
-    tahun = request.args.get("tahun", str(today.year))
-
-    # === TOTAL MODAL ===
-    cur.execute("""
-        SELECT * FROM pemodal
-        WHERE strftime('%m', tanggal) = ? AND strftime('%Y', tanggal) = ?
-    """, (bulan, tahun))
-    pemodal_data = cur.fetchall()
-    total_modal = sum(row["jumlah"] for row in pemodal_data)
-
-    # === TOTAL PENGELUARAN ===
-    cur.execute("""
-        SELECT * FROM pengeluaran
-        WHERE strftime('%m', tanggal) = ? AND strftime('%Y', tanggal) = ?
-    """, (bulan, tahun))
-    pengeluaran_data = cur.fetchall()
-    total_pengeluaran = sum(row["jumlah"] for row in pengeluaran_data)
-
-    # === PENJUALAN ===
-    cur.execute("""
-        SELECT * FROM penjualan
-        WHERE strftime('%m', tanggal) = ? AND strftime('%Y', tanggal) = ?
-    """, (bulan, tahun))
-    penjualan_data = cur.fetchall()
-
-    total_penjualan = 0
-    total_laba = 0
-    ringkasan_harian = defaultdict(lambda: {"penjualan": 0, "laba": 0})
-
-    for row in penjualan_data:
-        tanggal = row["tanggal"]
-        total_penjualan += row["total"]
-        total_laba += row["laba"]
-        ringkasan_harian[tanggal]["penjualan"] += row["total"]
-        ringkasan_harian[tanggal]["laba"] += row["laba"]
-
-    # === NILAI BARANG ===
-    cur.execute("SELECT * FROM barang")
-    barang_data = cur.fetchall()
-
-    cur.execute("""
-        SELECT * FROM pembelian
-        WHERE strftime('%m', tanggal) = ? AND strftime('%Y', tanggal) = ?
-        ORDER BY tanggal DESC
-    """, (bulan, tahun))
-    pembelian_data = cur.fetchall()
-
-    harga_beli_terakhir = {}
-    for row in pembelian_data:
-        idb = row["id_barang"]
-        if idb not in harga_beli_terakhir:
-            harga_beli_terakhir[idb] = row["harga_beli"]
+    bulan, tahun, awal, akhir, dari, sampai = baca_periode_laporan(request.args)
+
+    # Periode yang sudah tutup dilayani dari cache (lihat cache.py). Nilai
+    # barang bergantung pada semua mutasi sebelum akhir periode dan pada nama
+    # barang, jadi kunci HTML memuat versi riwayat & versi nama barang;
+    # penjualan bulan berjalan tidak mengubah keduanya.
+    kunci_periode, versi_nilai = kunci_laporan(cur, awal, akhir)
+
+    def buat_html():
+        data = data_periode(cur, kunci_periode, awal, akhir)
+        angka = hitung_angka_laporan(data["total"], hitung_nilai_barang(cur, akhir))
+        return render_laporan(angka, data["ringkasan"], bulan, tahun, dari, sampai,
+                              per_barang=beri_nama_barang(cur, data["per_barang"]))
+
+    if kunci_periode is None:
+        return buat_html()
+    return cache.layani_html(("laporan", bulan, tahun, dari, sampai) + kunci_periode[1:] + versi_nilai, buat_html)
+
+
+# === LAPORAN GABUNGAN (mode multi-outlet) ===
+# Angka tiap outlet dihitung paralel di thread pool, masing-masing dengan
+# koneksinya sendiri; query SQLite melepas GIL, jadi waktunya mendekati outlet
+# yang paling lambat. Hasilnya lalu dijumlahkan. Bawaan jumlah thread:
+# min(32, jumlah outlet), pool dibuat ulang kalau jumlah outlet berubah;
+# POS_OUTLET_PARALEL untuk menimpanya.
+PARALEL_OUTLET = os.environ.get("POS_OUTLET_PARALEL")
+_pool_outlet = (0, None)   # (jumlah thread, executor)
+_pool_outlet_lock = threading.Lock()
+
+
+def pool_outlet(jumlah_outlet):
+    global _pool_outlet
+    ukuran = max(1, int(PARALEL_OUTLET) if PARALEL_OUTLET else min(32, jumlah_outlet))
+    with _pool_outlet_lock:
+        if _pool_outlet[0] != ukuran:
+            # Pool lama tidak di-shutdown: laporan yang masih memakainya tetap
+            # jalan, threadnya berhenti sendiri begitu pool lama tidak dirujuk
+            _pool_outlet = (ukuran, ThreadPoolExecutor(max_workers=ukuran, thread_name_prefix="laporan-outlet"))
+        return _pool_outlet[1]
+
+
+def laporan_outlet(path, awal, akhir):
+    """Angka laporan, ringkasan harian & total per barang satu outlet."""
+    conn = buka_koneksi(path)
+    try:
+        cur = conn.cursor()
+        data = data_periode(cur, kunci_laporan(cur, awal, akhir)[0], awal, akhir)
+        angka = hitung_angka_laporan(data["total"], hitung_nilai_barang(cur, akhir))
+        return angka, data["ringkasan"], beri_nama_barang(cur, data["per_barang"])
+    finally:
+        conn.close()
+
+
+@app.route("/laporan/gabungan")
+def laporan_gabungan():
+    if not outlet.aktif():
+        return redirect("/laporan")
+    bulan, tahun, awal, akhir, dari, sampai = baca_periode_laporan(request.args)
+
+    daftar = daftar_db()
+    for _, path in daftar:
+        siapkan_db(path)
+    hasil = list(pool_outlet(len(daftar)).map(lambda item: laporan_outlet(item[1], awal, akhir), daftar))
+
+    # Pembagian kas/pemodal dan bagi hasil dihitung per outlet, lalu dijumlahkan
+    angka = {}
+    harian = {}
+    # id_barang hanya unik per database outlet; barang digabung menurut nama
+    per_barang = {}
+    for angka_outlet, ringkasan, barang_outlet in hasil:
+        for kunci, nilai in angka_outlet.items():
+            angka[kunci] = angka.get(kunci, 0) + nilai
+        for tgl, data in ringkasan:
+            baris = harian.setdefault(tgl, {"penjualan": 0, "laba": 0})
+            baris["penjualan"] += data["penjualan"]
+            baris["laba"] += data["laba"]
+        for b in barang_outlet:
+            baris = per_barang.setdefault(b["nama_barang"], dict.fromkeys(KOLOM_REKAP_BARANG[1:], 0))
+            for kolom in KOLOM_REKAP_BARANG[1:]:
+                baris[kolom] += b[kolom]
+
+    per_barang = sorted(({"nama_barang": nama, **baris} for nama, baris in per_barang.items()),
+                        key=lambda b: (-b["penjualan"], b["nama_barang"]))
+    per_outlet = [(kode, hasil_outlet[0]) for (kode, _), hasil_outlet in zip(daftar, hasil)]
+    return render_laporan(angka, sorted(harian.items()), bulan, tahun, dari, sampai,
+                          per_barang=per_barang, per_outlet=per_outlet)
+
+
+# Dinaikkan kalau bentuk data periode / HTML laporan berubah, supaya isi
+# cache disk dari versi sebelumnya tidak terpakai lagi
+FORMAT_LAPORAN = 2
+MAKS_BARANG_LAPORAN = 50
+
+
+def kunci_laporan(cur, awal, akhir):
+    """(kunci cache data periode, versi nilai barang); (None, ()) kalau periodenya belum tutup."""
+    if not cache.periode_tutup(akhir):
+        return None, ()
+    nama_versi = [f"periode:{p}" for p in cache.daftar_periode(awal, akhir)]
+    versi = cache.versi_data(cur, nama_versi + ["barang_nama"])
+    versi_nilai = (cache.versi_riwayat(cur, akhir),) + versi[-1:]
+    return ("laporan-periode", FORMAT_LAPORAN, cur.connection.path, awal, akhir) + versi[:-1], versi_nilai
+
+
+def data_periode(cur, kunci_periode, awal, akhir):
+    data = cache.ambil(kunci_periode) if kunci_periode else None
+    if data is None:
+        data = hitung_data_periode(cur, awal, akhir)
+        if kunci_periode:
+            cache.simpan(kunci_periode, data)
+    return data
+
+
+def hitung_data_periode(cur, awal, akhir):
+    """Bagian laporan yang hanya bergantung pada data periode [awal, akhir)."""
+    total, ringkasan = ambil_rekap(cur, awal, akhir)
+    return {"total": total, "ringkasan": ringkasan, "per_barang": ambil_rekap_barang(cur, awal, akhir)}
+
+
+def beri_nama_barang(cur, per_barang):
+    """Tempelkan nama barang terkini; nama tidak ikut di-cache bersama data periode."""
+    barang = cache.katalog(cur, "barang")
+    return [dict(b, nama_barang=barang[b["id_barang"]]["nama_barang"] if b["id_barang"] in barang else b["id_barang"])
+            for b in per_barang]
+
+
+def hitung_nilai_barang(cur, akhir):
+    # Posisi stok & harga beli terakhir di akhir periode (snapshot bulanan +
+    # mutasi). Kalau periodenya sampai hari ini, stok memakai stok_akhir.
+    barang_data = cache.katalog(cur, "barang").values()
+    posisi = posisi_stok(cur, akhir)
+    stok_berjalan = akhir > str(date.today())
 
     kas_manual = 0
     total_nilai_barang = 0
@@ -468,8 +1067,9 @@ def laporan():
     for row in barang_data:
         idb = row["id_barang"]
         nama = row["nama_barang"].upper()
-        stok = row["stok_akhir"]
-        harga = harga_beli_terakhir.get(idb, 0)
+        pos = posisi.get(idb, {"stok": 0, "harga_beli": 0})
+        stok = row["stok_akhir"] if stok_berjalan else pos["stok"]
+        harga = pos["harga_beli"]
         subtotal = stok * harga
 
         if "KAS" in nama:
@@ -477,6 +1077,20 @@ def laporan():
         else:
             total_nilai_barang += subtotal
 
+    return {"kas_manual": kas_manual, "total_nilai_barang": total_nilai_barang}
+
+
+def hitung_angka_laporan(total, nilai):
+    # === TOTAL MODAL, PENGELUARAN & PENJUALAN (dari tabel rekap) ===
+    total_modal = total["modal"]
+    total_pengeluaran = total["pengeluaran"]
+    total_penjualan = total["penjualan"]
+    total_laba = total["laba"]
+
+    # === NILAI BARANG ===
+    kas_manual = nilai["kas_manual"]
+    total_nilai_barang = nilai["total_nilai_barang"]
+
     pengeluaran_dari_kas = min(kas_manual, total_pengeluaran)
     pengeluaran_dari_pemodal = total_pengeluaran - pengeluaran_dari_kas
 
@@ -495,9 +1109,7 @@ def laporan():
         bagian_kas = round(total_laba * 0.35)
         bagian_pemodal = total_laba - bagian_kamu - bagian_kas
 
-    return render_template("laporan.html",
-        bulan=bulan,
-        tahun=tahun,
+    return dict(
         total_modal=total_modal,
         total_pengeluaran=total_pengeluaran,
         pengeluaran_dari_kas=pengeluaran_dari_kas,
@@ -512,24 +1124,104 @@ def laporan():
         bagian_kas=bagian_kas,
         kas_manual=kas_manual,
         bagian_pemodal=bagian_pemodal,
-        ringkasan=sorted(ringkasan_harian.items())
     )
 
 
+def render_laporan(angka, ringkasan, bulan, tahun, dari, sampai, per_barang=(), per_outlet=None):
+    return render_template("laporan.html",
+        bulan=bulan,
+        tahun=tahun,
+        dari=dari,
+        sampai=sampai,
+        ringkasan=ringkasan,
+        per_barang=per_barang[:MAKS_BARANG_LAPORAN],
+        barang_lain=max(0, len(per_barang) - MAKS_BARANG_LAPORAN),
+        per_outlet=per_outlet,
+        **angka
+    )
+
+
+
+
+@app.route("/dashboard")
+def dashboard():
+    """Angka hari ini & bulan ini; selanjutnya diperbarui lewat /api/peristiwa."""
+    cur = get_db().cursor()
+    today = date.today()
+    # Id peristiwa dibaca sebelum angkanya, supaya tidak ada perubahan yang terlewat
+    cur.execute("SELECT IFNULL(MAX(id), 0) FROM peristiwa")
+    dari = cur.fetchone()[0]
+    cur.execute(f"""
+        SELECT tanggal, {", ".join(peristiwa.KOLOM_REKAP)} FROM rekap_harian
+        WHERE tanggal >= ? AND tanggal <= ?
+    """, (today.replace(day=1).isoformat(), today.isoformat()))
+    rekap = {row[0]: dict(zip(peristiwa.KOLOM_REKAP, row[1:])) for row in cur.fetchall()}
+    cur.execute("""
+        SELECT p.id_penjualan, p.tanggal, p.total, IFNULL(c.nama, 'Tidak Dikenal') AS pelanggan
+        FROM penjualan p LEFT JOIN pelanggan c ON c.id_pelanggan = p.id_pelanggan
+        WHERE p.tanggal = ? ORDER BY p.rowid DESC LIMIT ?
+    """, (today.isoformat(), peristiwa.MAKS_DAFTAR))
+    penjualan_terakhir = [dict(row) for row in cur.fetchall()]
+    return render_template("dashboard.html", dari=dari, rekap=rekap, hari_ini=today.isoformat(),
+                           penjualan_terakhir=penjualan_terakhir)
+
+
+@app.route("/api/peristiwa")
+def api_peristiwa():
+    """Server-Sent Events: rekap, stok & penjualan baru, digabung per JEDA_GABUNG."""
+    if peristiwa.jumlah_pelanggan() >= peristiwa.MAKS_PELANGGAN:
+        return Response("Terlalu banyak dashboard tersambung", status=503, headers={"Retry-After": "30"})
+    dari = request.headers.get("Last-Event-ID") or request.args.get("dari")
+    conn = get_db()
+    bus_db = peristiwa.bus(conn.path)
+    langganan = bus_db.langgan(conn, int(dari) if dari and dari.isdigit() else None)
+    return Response(peristiwa.alirkan(bus_db, langganan), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route("/analitik")
+def analitik():
+    """Margin, sell-through, kelas ABC dan tren bulanan; bawaan 12 bulan terakhir."""
+    conn = get_db()
+    cur = conn.cursor()
+    today = date.today()
+    bulan_mulai = today.year * 12 + today.month - 1 - 11
+    try:
+        dari = date.fromisoformat(request.args.get("dari") or date(bulan_mulai // 12, bulan_mulai % 12 + 1, 1).isoformat())
+        sampai = date.fromisoformat(request.args.get("sampai") or today.isoformat())
+    except ValueError:
+        return "Tanggal tidak valid", 400
+    if sampai < dari:
+        dari, sampai = sampai, dari
+    awal, akhir = dari.isoformat(), (sampai + timedelta(days=1)).isoformat()
+
+    # Rentang yang sudah tutup di-cache seperti laporan
+    kunci = None
+    if cache.periode_tutup(akhir):
+        # Stok awal bergantung pada riwayat sebelum awal, nama & kategori pada barang_nama
+        versi = (cache.versi_riwayat(cur, akhir),) + cache.versi_data(cur, ["barang_nama"])
+        kunci = ("analitik", conn.path, awal, akhir) + versi
+    data = cache.ambil(kunci) if kunci else None
+    if data is None:
+        try:
+            data = analisis(conn, awal, akhir)
+        except ValueError as e:
+            return render_template("analitik.html", error=str(e), dari=dari, sampai=sampai), 501
+        if kunci:
+            cache.simpan(kunci, data)
+
+    if request.args.get("format") == "json":
+        return jsonify(data)
+    return render_template("analitik.html", data=data, dari=dari, sampai=sampai, error=None)
 
 
 @app.route("/pelanggan", methods=["GET", "POST"])
 def pelanggan():
-    import sqlite3
-    conn = sqlite3.connect("pos.db")
-    conn.row_factory = sqlite3.Row
+    conn = get_db()
     cur = conn.cursor()
 
-    # Ambil semua data
-    cur.execute("SELECT * FROM pelanggan")
-    rows = cur.fetchall()
-
     if request.method == "POST":
+        mulai_tulis(conn)
         id_pelanggan = request.form.get("id_pelanggan")
         nama = request.form["nama"]
         wa = request.form["wa"]
@@ -556,31 +1248,27 @@ def pelanggan():
         cur.execute("SELECT * FROM pelanggan WHERE id_pelanggan = ?", (edit_id,))
         item_edit = cur.fetchone()
 
-    return render_template("pelanggan.html", rows=rows, item_edit=item_edit)
+    return render_template("pelanggan.html", item_edit=item_edit)
 
 @app.route("/pengeluaran", methods=["GET", "POST"])
 def pengeluaran():
-    import sqlite3
-    from datetime import date
-
-    conn = sqlite3.connect("pos.db")
-    conn.row_factory = sqlite3.Row
+    conn = get_db()
     cur = conn.cursor()
 
     kategori_list = ["Listrik", "Sewa", "Bensin", "ATK", "Gaji", "Lainnya"]
 
-    # Ambil semua data
-    cur.execute("SELECT * FROM pengeluaran")
-    rows = cur.fetchall()
-
     if request.method == "POST":
+        mulai_tulis(conn)
         id_pengeluaran = request.form.get("id_pengeluaran")
         tanggal = request.form["tanggal"]
         kategori = request.form["kategori"]
         jumlah = int(request.form["jumlah"])
         keterangan = request.form.get("keterangan", "")
 
+        berubah_tanggal = [tanggal]
         if request.form.get("mode") == "edit":
+            cur.execute("SELECT tanggal FROM pengeluaran WHERE id_pengeluaran=?", (id_pengeluaran,))
+            berubah_tanggal += [row["tanggal"] for row in cur.fetchall()]
             cur.execute("""
                 UPDATE pengeluaran SET tanggal=?, kategori=?, jumlah=?, keterangan=?
                 WHERE id_pengeluaran=?
@@ -594,7 +1282,9 @@ def pengeluaran():
                 VALUES (?, ?, ?, ?, ?)
             """, (new_id, tanggal, kategori, jumlah, keterangan))
 
+        peristiwa.catat_perubahan(cur, tanggal=berubah_tanggal)
         conn.commit()
+        peristiwa.umumkan(conn.path)
         return redirect("/pengeluaran")
 
     # Edit jika ada
@@ -605,7 +1295,6 @@ def pengeluaran():
         item_edit = cur.fetchone()
 
     return render_template("pengeluaran.html",
-                           rows=rows,
                            item_edit=item_edit,
                            kategori_list=kategori_list,
                            today=str(date.today()))
@@ -613,32 +1302,33 @@ def pengeluaran():
 
 @app.route("/pemodal", methods=["GET", "POST"])
 def pemodal():
-    import sqlite3
-    from datetime import date
-
-    conn = sqlite3.connect("pos.db")
-    conn.row_factory = sqlite3.Row
+    conn = get_db()
     cur = conn.cursor()
 
     # Ambil semua data
     now = datetime.today()
     bulan = f"{now.month:02d}"   # Format dua digit, misalnya '08'
     tahun = str(now.year)        # Misalnya '2025'
+    awal, akhir = rentang_bulan(bulan, tahun)
 
     # Query berdasarkan bulan dan tahun saat ini
     cur.execute("""
         SELECT * FROM pemodal
-        WHERE strftime('%m', tanggal) = ? AND strftime('%Y', tanggal) = ?
-    """, (bulan, tahun)) 
+        WHERE tanggal >= ? AND tanggal < ?
+    """, (awal, akhir)) 
     rows = cur.fetchall()
 
     if request.method == "POST":
+        mulai_tulis(conn)
         id_pemodal = request.form.get("id_pemodal")
         nama = request.form["nama"]
         jumlah = int(request.form["jumlah"])
         tanggal = request.form["tanggal"]
 
+        berubah_tanggal = [tanggal]
         if request.form.get("mode") == "edit":
+            cur.execute("SELECT tanggal FROM pemodal WHERE id_pemodal=?", (id_pemodal,))
+            berubah_tanggal += [row["tanggal"] for row in cur.fetchall()]
             cur.execute("""
                 UPDATE pemodal SET nama=?, jumlah=?, tanggal=? WHERE id_pemodal=?
             """, (nama, jumlah, tanggal, id_pemodal))
@@ -650,7 +1340,9 @@ def pemodal():
                 VALUES (?, ?, ?, ?)
             """, (new_id, nama, jumlah, tanggal))
 
+        peristiwa.catat_perubahan(cur, tanggal=berubah_tanggal)
         conn.commit()
+        peristiwa.umumkan(conn.path)
         return redirect("/pemodal")
 
     # Edit
@@ -666,5 +1358,241 @@ def pemodal():
                            today=str(date.today()))
 
 
+@migrasi(4)
+def buat_index_dasar(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_penjualan_tanggal ON penjualan (tanggal)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_penjualan_id ON penjualan (id_penjualan)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_penjualan_barang ON penjualan (id_barang)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_penjualan_pelanggan ON penjualan (id_pelanggan)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_pembelian_tanggal ON pembelian (tanggal)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_pembelian_barang ON pembelian (id_barang, tanggal)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_pengeluaran_tanggal ON pengeluaran (tanggal)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_pemodal_tanggal ON pemodal (tanggal)")
+
+
+@migrasi(8)
+def pisah_penjualan(conn):
+    """Pecah tabel penjualan datar jadi header (penjualan) dan baris (penjualan_item).
+
+    Header menyimpan total & laba per transaksi. Tanggal ikut disalin ke baris
+    supaya rekap per barang tetap bisa dijaga trigger tanpa join.
+    """
+    for aksi in ("insert", "delete", "update"):
+        conn.execute(f"DROP TRIGGER IF EXISTS trg_rekap_penjualan_{aksi}")
+    conn.execute("ALTER TABLE penjualan RENAME TO penjualan_lama")
+
+    conn.execute("""
+        CREATE TABLE penjualan (
+            id_penjualan TEXT PRIMARY KEY,
+            tanggal TEXT,
+            id_pelanggan TEXT,
+            catatan TEXT,
+            total INTEGER DEFAULT 0,
+            laba INTEGER DEFAULT 0
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE penjualan_item (
+            id INTEGER PRIMARY KEY,
+            id_penjualan TEXT NOT NULL REFERENCES penjualan (id_penjualan),
+            tanggal TEXT,
+            id_barang TEXT,
+            nama_barang TEXT,
+            jumlah INTEGER,
+            harga_jual INTEGER,
+            total INTEGER,
+            hpp_unit INTEGER,
+            laba INTEGER
+        )
+    """)
+
+    # Data header diambil dari baris pertama tiap transaksi
+    conn.execute("""
+        INSERT INTO penjualan (id_penjualan, tanggal, id_pelanggan, catatan, total, laba)
+        SELECT id_penjualan, tanggal, id_pelanggan, catatan, total, laba FROM (
+            SELECT id_penjualan, tanggal, id_pelanggan, catatan,
+                   SUM(IFNULL(total, 0)) AS total, SUM(IFNULL(laba, 0)) AS laba, MIN(rowid)
+            FROM penjualan_lama
+            WHERE id_penjualan IS NOT NULL
+            GROUP BY id_penjualan
+        )
+    """)
+    conn.execute("""
+        INSERT INTO penjualan_item (id_penjualan, tanggal, id_barang, nama_barang,
+                                    jumlah, harga_jual, total, hpp_unit, laba)
+        SELECT id_penjualan, tanggal, id_barang, nama_barang, jumlah, harga_jual, total, hpp_unit, laba
+        FROM penjualan_lama
+        WHERE id_penjualan IS NOT NULL
+        ORDER BY rowid
+    """)
+    conn.execute("DROP TABLE penjualan_lama")
+
+    conn.execute("CREATE INDEX idx_penjualan_tanggal ON penjualan (tanggal, id_penjualan)")
+    conn.execute("CREATE INDEX idx_penjualan_pelanggan ON penjualan (id_pelanggan)")
+    conn.execute("CREATE INDEX idx_penjualan_item_trx ON penjualan_item (id_penjualan)")
+    conn.execute("CREATE INDEX idx_penjualan_item_barang ON penjualan_item (id_barang, tanggal)")
+
+    buat_trigger_rekap(conn, "penjualan_item")
+    bangun_ulang_rekap(conn)
+
+
+@migrasi(10)
+def init_penjualan_kunci(conn):
+    """Kunci idempoten dari /api/penjualan/batch -> id_penjualan yang dibuat."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS penjualan_kunci (
+            kunci TEXT PRIMARY KEY,
+            id_penjualan TEXT NOT NULL,
+            dibuat TEXT
+        ) WITHOUT ROWID
+    """)
+
+
+# === IMPOR MASSAL ===
+@app.route("/impor", methods=["GET", "POST"])
+def impor():
+    hasil = None
+    jenis = request.form.get("jenis", "pembelian")
+    if request.method == "POST":
+        berkas = request.files.get("berkas")
+        if jenis not in JENIS_IMPOR or not berkas or not berkas.filename:
+            hasil = {"berhasil": 0, "error": [{"baris": "-", "error": "Pilih jenis impor dan berkas CSV/XLSX"}]}
+        else:
+            try:
+                hasil = JENIS_IMPOR[jenis](get_db(), baca_berkas(berkas.stream, berkas.filename))
+            except (ValueError, UnicodeDecodeError) as e:
+                get_db().rollback()
+                hasil = {"berhasil": 0, "error": [{"baris": "-", "error": str(e)}]}
+        if request.args.get("format") == "json":
+            return jsonify(hasil), (200 if not hasil["error"] else 400)
+    return render_template("impor.html", hasil=hasil, jenis=jenis)
+
+
+# === EKSPOR ===
+@app.route("/ekspor/<jenis>")
+def ekspor(jenis):
+    if jenis not in EKSPOR:
+        return "Jenis ekspor tidak dikenal", 404
+
+    today = datetime.today().date()
+    try:
+        if request.args.get("dari") and request.args.get("sampai"):
+            awal = date.fromisoformat(request.args["dari"]).isoformat()
+            akhir = (date.fromisoformat(request.args["sampai"]) + timedelta(days=1)).isoformat()
+        else:
+            awal, akhir = rentang_bulan(request.args.get("bulan", today.month),
+                                        request.args.get("tahun", today.year))
+    except ValueError:
+        return "Rentang tanggal tidak valid", 400
+
+    header, _ = EKSPOR[jenis]
+    rows = baris_ekspor(get_db().cursor(), jenis, awal, akhir)
+    nama = f"{jenis}_{awal}_{date.fromisoformat(akhir) - timedelta(days=1)}"
+
+    if request.args.get("format") == "xlsx":
+        return send_file(tulis_xlsx(header, rows), as_attachment=True,
+                         download_name=f"{nama}.xlsx",
+                         mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+
+    gzip = request.args.get("gzip") == "1"
+    response = Response(stream_with_context(stream_csv(header, rows, gzip)),
+                        mimetype="application/gzip" if gzip else "text/csv")
+    response.headers["Content-Disposition"] = f'attachment; filename="{nama}.csv{".gz" if gzip else ""}"'
+    return response
+
+
+def path_cli(kode):
+    if not outlet.aktif():
+        return app.config["DB_PATH"]
+    path = outlet.path_outlet(kode)
+    if path is None:
+        raise click.UsageError(f"outlet tidak dikenal, pilih salah satu: {', '.join(outlet.daftar_outlet())}")
+    return path
+
+
+@app.cli.command("impor")
+@click.argument("jenis", type=click.Choice(sorted(JENIS_IMPOR)))
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--outlet", "kode", help="Kode outlet (mode multi-outlet)")
+def impor_cli(jenis, path, kode):
+    """Impor pembelian / barang dari berkas CSV atau XLSX."""
+    conn = buka_koneksi(path_cli(kode))
+    with open(path, "rb") as berkas:
+        hasil = JENIS_IMPOR[jenis](conn, baca_berkas(berkas, path))
+    conn.close()
+    for e in hasil["error"]:
+        print(f"Baris {e['baris']}: {e['error']}")
+    if hasil.get("error_lain"):
+        print(f"... dan {hasil['error_lain']} error lainnya")
+    print(f"{hasil['berhasil']} baris {jenis} diimpor.")
+
+
+@app.cli.command("rekap-ulang")
+@click.option("--outlet", "kode", help="Kode outlet (mode multi-outlet)")
+def rekap_ulang(kode):
+    """Hitung ulang tabel rekap dari tabel mentah."""
+    conn = buka_koneksi(path_cli(kode))
+    with conn:
+        bangun_ulang_rekap(conn)
+    conn.close()
+    print("Rekap selesai dihitung ulang.")
+
+
+@app.cli.command("cek-lapisan")
+@click.option("--outlet", "kode", help="Kode outlet (mode multi-outlet)")
+def cek_lapisan(kode):
+    """Bandingkan total sisa lapisan FIFO dengan stok_akhir per barang."""
+    conn = buka_koneksi(path_cli(kode))
+    selisih = conn.execute("""
+        SELECT b.id_barang, b.nama_barang, b.stok_akhir, IFNULL(l.sisa, 0)
+        FROM barang b
+        LEFT JOIN (SELECT id_barang, SUM(sisa) AS sisa FROM stok_lapisan GROUP BY id_barang) l
+          ON l.id_barang = b.id_barang
+        WHERE MAX(b.stok_akhir, 0) != IFNULL(l.sisa, 0)
+    """).fetchall()
+    conn.close()
+    for id_barang, nama_barang, stok_akhir, sisa in selisih:
+        print(f"{id_barang} {nama_barang}: stok {stok_akhir}, lapisan {sisa}")
+    if selisih:
+        raise click.ClickException(f"{len(selisih)} barang lapisannya tidak cocok dengan stok")
+    print("Lapisan FIFO cocok dengan stok.")
+
+
+@app.cli.command("cadangan")
+@click.option("--outlet", "kode", help="Kode outlet (mode multi-outlet)")
+@click.option("--daftar", is_flag=True, help="Tampilkan cadangan yang ada saja")
+def cadangan_cli(kode, daftar):
+    """Buat cadangan database sekarang; aman dijalankan saat aplikasi melayani kasir."""
+    db_path = path_cli(kode)
+    if daftar:
+        for path in daftar_cadangan(db_path):
+            print(f"{path}  ({os.path.getsize(path) // 1024} KB)")
+        return
+    path = buat_cadangan(db_path, progres=lambda selesai, total: print(f"\r{selesai}/{total} halaman", end=""))
+    print(f"\nCadangan dibuat: {path}")
+
+
+@app.cli.command("pulihkan")
+@click.argument("berkas", type=click.Path(exists=True, dir_okay=False))
+@click.option("--outlet", "kode", help="Kode outlet (mode multi-outlet)")
+@click.confirmation_option(prompt="Isi database sekarang akan ditimpa cadangan ini. Lanjutkan?")
+def pulihkan_cli(berkas, kode):
+    """Pulihkan database dari berkas cadangan (.db atau .db.gz)."""
+    pengaman = pulihkan(berkas, path_cli(kode))
+    if pengaman:
+        print(f"Isi sebelum pulih disimpan di {pengaman}")
+    if cache.CACHE_DIR:
+        shutil.rmtree(cache.CACHE_DIR, ignore_errors=True)
+    print("Database dipulihkan. Restart aplikasi supaya cache di memori ikut dibuang.")
+
+
+def init_db():
+    for _, path in daftar_db():
+        siapkan_db(path)
+
+
+init_db()
+
+
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,175 @@
+"""Bangun aset front-end.
+
+Contoh:
+    python aset.py
+    TAILWIND_BIN=/usr/local/bin/tailwindcss python aset.py
+
+Tailwind dikompilasi dari templates/*.html (CLI standalone atau npx), library
+JS/CSS diunduh sekali ke static/vendor/, lalu semuanya digabung jadi satu
+app.css dan satu app.js bernama hash isi di static/dist/, lengkap dengan
+varian .gz (dan .br kalau paket brotli terpasang). Tanpa hasil build,
+base.html tetap memakai CDN.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import urllib.request
+
+from flask import abort, request, send_file
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATIC = os.path.join(ROOT, "static")
+DIST = os.path.join(STATIC, "dist")
+VENDOR = os.path.join(STATIC, "vendor")
+MANIFEST = os.path.join(DIST, "manifest.json")
+TAILWIND_INPUT = os.path.join(STATIC, "src", "tailwind.css")
+TAILWIND_VERSI = "3.4.1"
+# <dasar>.<12 hex sha256>.<ext>, nama berkas hasil build
+POLA_HASH = re.compile(r"^[A-Za-z0-9_-]+\.[0-9a-f]{12}\.(css|js)$")
+
+VENDOR_URL = {
+    "jquery.min.js": "https://code.jquery.com/jquery-3.7.0.min.js",
+    "jquery.dataTables.min.js": "https://cdn.datatables.net/1.13.6/js/jquery.dataTables.min.js",
+    "jquery.dataTables.min.css": "https://cdn.datatables.net/1.13.6/css/jquery.dataTables.min.css",
+    "select2.min.js": "https://cdn.jsdelivr.net/npm/select2@4.1.0-rc.0/dist/js/select2.min.js",
+    "select2.min.css": "https://cdn.jsdelivr.net/npm/select2@4.1.0-rc.0/dist/css/select2.min.css",
+    "autoNumeric.min.js": "https://cdn.jsdelivr.net/npm/autonumeric@4.6.0/dist/autoNumeric.min.js",
+}
+
+# nama bundel -> isi berurutan; "tailwind" = hasil kompilasi Tailwind
+BUNDEL = {
+    "app.css": ["jquery.dataTables.min.css", "select2.min.css", "tailwind"],
+    "app.js": ["jquery.min.js", "jquery.dataTables.min.js", "select2.min.js", "autoNumeric.min.js"],
+}
+
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+# === BUILD ===
+def ambil_vendor(nama):
+    path = os.path.join(VENDOR, nama)
+    if not os.path.exists(path):
+        os.makedirs(VENDOR, exist_ok=True)
+        print(f"unduh {VENDOR_URL[nama]}")
+        with urllib.request.urlopen(VENDOR_URL[nama], timeout=30) as r, open(path + ".tmp", "wb") as f:
+            shutil.copyfileobj(r, f)
+        os.replace(path + ".tmp", path)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def kompilasi_tailwind():
+    perintah = os.environ.get("TAILWIND_BIN") or shutil.which("tailwindcss")
+    if perintah:
+        perintah = [perintah]
+    elif shutil.which("npx"):
+        perintah = ["npx", "--yes", f"tailwindcss@{TAILWIND_VERSI}"]
+    else:
+        raise SystemExit("CLI tailwindcss tidak ditemukan; pasang versi standalone atau set TAILWIND_BIN")
+
+    with tempfile.TemporaryDirectory() as folder:
+        keluaran = os.path.join(folder, "tailwind.css")
+        subprocess.run(perintah + ["-i", TAILWIND_INPUT, "-o", keluaran, "--minify",
+                                   "--content", os.path.join(ROOT, "templates", "**", "*.html")],
+                       check=True)
+        with open(keluaran, "rb") as f:
+            return f.read()
+
+
+def tulis_varian(path, isi):
+    with open(path, "wb") as f:
+        f.write(isi)
+    with open(path + ".gz", "wb") as f:
+        f.write(gzip.compress(isi, 9, mtime=0))
+    try:
+        import brotli
+    except ImportError:
+        return
+    with open(path + ".br", "wb") as f:
+        f.write(brotli.compress(isi, quality=11))
+
+
+def bangun():
+    os.makedirs(DIST, exist_ok=True)
+    lama = baca_manifest()
+    manifest = {}
+    for nama, bagian in BUNDEL.items():
+        isi = b"\n".join(kompilasi_tailwind() if b == "tailwind" else ambil_vendor(b) for b in bagian)
+        dasar, ext = os.path.splitext(nama)
+        nama_hash = f"{dasar}.{hashlib.sha256(isi).hexdigest()[:12]}{ext}"
+        tulis_varian(os.path.join(DIST, nama_hash), isi)
+        manifest[nama] = nama_hash
+        print(f"{nama} -> {nama_hash} ({len(isi) // 1024} KB)")
+
+    # Berkas build sebelumnya disimpan satu generasi, untuk halaman yang
+    # masih terbuka saat deploy
+    dipakai = set(manifest.values()) | set(lama.values())
+    for entri in os.scandir(DIST):
+        dasar = entri.name.removesuffix(".gz").removesuffix(".br")
+        if entri.name != "manifest.json" and dasar not in dipakai:
+            os.remove(entri.path)
+
+    with open(MANIFEST + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(MANIFEST + ".tmp", MANIFEST)
+
+
+# === RUNTIME ===
+_manifest = {}
+
+
+def baca_manifest():
+    try:
+        with open(MANIFEST) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def aset_url(nama):
+    """URL berfingerprint untuk bundel ('app.css' / 'app.js'), None kalau belum di-build."""
+    nama_hash = _manifest.get(nama)
+    return f"/aset/{nama_hash}" if nama_hash else None
+
+
+def layani_aset(nama):
+    # Bukan hanya isi manifest sekarang: build generasi sebelumnya tetap
+    # dilayani untuk halaman yang dibuka sebelum deploy
+    path = os.path.join(DIST, nama)
+    if not POLA_HASH.match(nama) or not os.path.isfile(path):
+        abort(404)
+    mimetype = mimetypes.guess_type(nama)[0]
+    for encoding, ext in (("br", ".br"), ("gzip", ".gz")):
+        if request.accept_encodings[encoding] and os.path.exists(path + ext):
+            response = send_file(path + ext, mimetype=mimetype, etag=False)
+            response.headers["Content-Encoding"] = encoding
+            break
+    else:
+        response = send_file(path, mimetype=mimetype, etag=False)
+    # Nama berkas berubah setiap isinya berubah, jadi boleh di-cache selamanya
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
+def init_app(app):
+    _manifest.update(baca_manifest())
+    app.jinja_env.globals["aset_url"] = aset_url
+    app.add_url_rule("/aset/<nama>", "aset", layani_aset)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.parse_args()
+    bangun()
+
+
+if __name__ == "__main__":
+    main()
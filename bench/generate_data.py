@@ -0,0 +1,152 @@
+"""Buat database pos sintetis untuk benchmark.
+
+Contoh:
+    python bench/generate_data.py --ukuran 100k --out bench/data/pos_100k.db
+
+Skema tabel dasar disalin dari pos.db, lalu migrasi aplikasi dijalankan
+supaya tabel turunan (lapisan FIFO, rekap, index, dll.) ikut terbentuk.
+Dengan --seed yang sama hasilnya selalu sama.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+UKURAN = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+TABEL_DASAR = ["barang", "pelanggan", "pemodal", "pengeluaran", "pembelian"]
+# Penjualan ditulis dalam skema datar lama; migrasi 8 memecahnya jadi
+# header + item, jadi jalur migrasi ikut teruji setiap kali data dibuat.
+SKEMA_PENJUALAN_LAMA = """
+    CREATE TABLE penjualan(id_penjualan TEXT, tanggal TEXT, id_pelanggan TEXT, id_barang TEXT,
+                           nama_barang TEXT, jumlah INTEGER, harga_jual INTEGER, total INTEGER,
+                           catatan TEXT, hpp_unit INTEGER, laba INTEGER)
+"""
+
+SATUAN = ["pcs", "bungkus", "botol", "dus", "liter", "kg", "pak", "sak", "renceng", "kaleng"]
+KATEGORI = ["Minuman", "Makanan", "Kebersihan", "Sembako", "Perlengkapan", "Gas", "Rokok", "Lainnya"]
+KATA = ["KOPI", "TEH", "GULA", "BERAS", "MINYAK", "SABUN", "SUSU", "MIE", "KECAP", "SAUS",
+        "TISU", "GAS", "ROTI", "AIR", "TELUR", "GARAM", "SIKAT", "SAMPO", "BISKUIT", "PERMEN"]
+CATATAN = ["tunai", "hutang", "grosir", "ecer"]
+
+
+def salin_skema(conn, sumber):
+    src = sqlite3.connect(sumber)
+    for tabel in TABEL_DASAR:
+        row = src.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (tabel,)).fetchone()
+        conn.execute(row[0])
+    src.close()
+    conn.execute(SKEMA_PENJUALAN_LAMA)
+
+
+def buat_data(conn, jumlah_baris, rnd, hari_akhir):
+    jumlah_barang = max(200, jumlah_baris // 200)
+    jumlah_pelanggan = max(50, jumlah_baris // 100)
+    jumlah_pembelian = max(500, jumlah_baris // 5)
+    # Sekitar 300 baris penjualan per hari, berakhir hari ini
+    jumlah_hari = max(60, jumlah_baris // 300)
+    hari_awal = hari_akhir - timedelta(days=jumlah_hari - 1)
+
+    def tanggal_acak():
+        return (hari_awal + timedelta(days=rnd.randrange(jumlah_hari))).isoformat()
+
+    barang = []
+    for i in range(1, jumlah_barang + 1):
+        nama = f"{rnd.choice(KATA)} {rnd.choice(KATA)} {i}"
+        barang.append((f"BRG{i:03d}", nama, rnd.choice(SATUAN), rnd.choice(KATEGORI)))
+    harga_dasar = {b[0]: rnd.randrange(1000, 50000, 500) for b in barang}
+
+    conn.executemany("INSERT INTO pelanggan (id_pelanggan, nama, wa) VALUES (?, ?, ?)",
+                     [(f"PL{i:03d}", f"PELANGGAN {i}", f"628{rnd.randrange(10**9, 10**10)}")
+                      for i in range(1, jumlah_pelanggan + 1)])
+
+    stok = dict.fromkeys(harga_dasar, 0)
+    pembelian = []
+    for i in range(1, jumlah_pembelian + 1):
+        id_barang = rnd.choice(barang)[0]
+        jumlah = rnd.randint(10, 60)
+        harga = int(harga_dasar[id_barang] * rnd.uniform(0.9, 1.1))
+        nama = barang[int(id_barang[3:]) - 1][1]
+        pembelian.append((f"PB{i:03d}", tanggal_acak(), id_barang, nama, jumlah, harga, jumlah * harga, ""))
+        stok[id_barang] += jumlah
+    pembelian.sort(key=lambda p: p[1])
+    conn.executemany("""
+        INSERT INTO pembelian (id_pembelian, tanggal, id_barang, nama_barang, jumlah, harga_beli, total_beli, keterangan)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, pembelian)
+
+    penjualan = []
+    nomor = 0
+    while len(penjualan) < jumlah_baris:
+        nomor += 1
+        id_penjualan = f"PJ{nomor:03d}"
+        tanggal = tanggal_acak()
+        id_pelanggan = f"PL{rnd.randint(1, jumlah_pelanggan):03d}"
+        catatan = rnd.choice(CATATAN)
+        for _ in range(rnd.randint(1, 5)):
+            id_barang, nama = rnd.choice(barang)[:2]
+            jumlah = rnd.randint(1, 3)
+            if stok[id_barang] < jumlah:
+                continue
+            stok[id_barang] -= jumlah
+            hpp = harga_dasar[id_barang]
+            harga_jual = int(hpp * rnd.uniform(1.05, 1.3))
+            penjualan.append((id_penjualan, tanggal, id_pelanggan, id_barang, nama, jumlah,
+                              harga_jual, jumlah * harga_jual, catatan, hpp, (harga_jual - hpp) * jumlah))
+    penjualan.sort(key=lambda p: (p[1], p[0]))
+    conn.executemany("""
+        INSERT INTO penjualan (id_penjualan, tanggal, id_pelanggan, id_barang, nama_barang,
+                               jumlah, harga_jual, total, catatan, hpp_unit, laba)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, penjualan)
+
+    conn.executemany("INSERT INTO barang (id_barang, nama_barang, satuan, kategori, stok_akhir) VALUES (?, ?, ?, ?, ?)",
+                     [b + (stok[b[0]],) for b in barang])
+
+    conn.executemany("INSERT INTO pengeluaran (id_pengeluaran, tanggal, kategori, jumlah, keterangan) VALUES (?, ?, ?, ?, ?)",
+                     [(f"OUT{i:03d}", tanggal_acak(), rnd.choice(["Listrik", "Sewa", "Bensin", "ATK", "Gaji", "Lainnya"]),
+                       rnd.randrange(10000, 500000, 1000), "") for i in range(1, jumlah_hari * 2 + 1)])
+    conn.executemany("INSERT INTO pemodal (id_pemodal, nama, jumlah, tanggal) VALUES (?, ?, ?, ?)",
+                     [(f"PM{i:03d}", f"PEMODAL {i % 5 + 1}", rnd.randrange(1_000_000, 10_000_000, 100_000), tanggal_acak())
+                      for i in range(1, jumlah_hari // 7 + 2)])
+    conn.commit()
+    return {"barang": jumlah_barang, "pelanggan": jumlah_pelanggan, "pembelian": jumlah_pembelian,
+            "penjualan": len(penjualan), "transaksi": nomor, "hari": jumlah_hari}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ukuran", choices=sorted(UKURAN), default="10k", help="jumlah baris penjualan")
+    parser.add_argument("--baris", type=int, help="jumlah baris penjualan (mengganti --ukuran)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--sampai", default=None, help="tanggal transaksi terakhir (YYYY-MM-DD), bawaan hari ini")
+    parser.add_argument("--skema", default=os.path.join(ROOT, "pos.db"), help="database sumber skema")
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+
+    if os.path.exists(args.out):
+        os.remove(args.out)
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+
+    conn = sqlite3.connect(args.out)
+    salin_skema(conn, args.skema)
+    hari_akhir = date.fromisoformat(args.sampai) if args.sampai else date.today()
+    info = buat_data(conn, args.baris or UKURAN[args.ukuran], random.Random(args.seed), hari_akhir)
+    conn.close()
+
+    # Tabel turunan dibangun oleh migrasi aplikasi saat app diimpor
+    os.environ["POS_DB"] = os.path.abspath(args.out)
+    import app  # noqa: F401
+    conn = sqlite3.connect(args.out)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+    print(f"{args.out}: {info}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""Benchmark jalur utama POS lewat Flask test client.
+
+Contoh:
+    python bench/generate_data.py --ukuran 10k --out bench/data/pos_10k.db
+    python bench/run_bench.py --db bench/data/pos_10k.db --out hasil.json
+    python bench/run_bench.py --db bench/data/pos_10k.db --banding hasil.json
+
+Database disalin ke folder sementara dulu, jadi berkas aslinya tidak berubah.
+Worker latar (outbox WA, sinkron Google Sheets, snapshot stok, cadangan
+terjadwal, ringkasan restok) dimatikan supaya bisa jalan offline dan tidak
+ikut terukur bersama beban kerja.
+Untuk tiap skenario dicatat latensi p50/p95, jumlah query SQL per request dan
+puncak memori Python (tracemalloc, diukur di putaran terpisah).
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+jumlah_query = 0
+
+
+def hitung_query(_sql):
+    global jumlah_query
+    jumlah_query += 1
+
+
+def siapkan_app(path_db):
+    os.environ["POS_DB"] = path_db
+    import db
+
+    # Setiap koneksi aplikasi dipasangi penghitung query
+    buka_asli = db.buka_koneksi
+
+    def buka_koneksi(path=None):
+        conn = buka_asli(path)
+        conn.set_trace_callback(hitung_query)
+        return conn
+
+    db.buka_koneksi = buka_koneksi
+
+    import app as aplikasi
+    aplikasi.jalankan_pengirim = lambda *a: None
+    aplikasi.jalankan_sinkron = lambda *a: None
+    aplikasi.jalankan_snapshot = lambda *a: None
+    aplikasi.jalankan_penjadwal = lambda *a: None
+    aplikasi.jalankan_ringkasan = lambda *a: None
+    aplikasi.app.config["TESTING"] = True
+    return aplikasi
+
+
+def ambil_referensi(path_db):
+    conn = sqlite3.connect(path_db)
+    barang = [row[0] for row in conn.execute("SELECT id_barang FROM barang WHERE stok_akhir > 10")]
+    pelanggan = [row[0] for row in conn.execute("SELECT id_pelanggan FROM pelanggan")]
+    bulan_lalu = conn.execute("SELECT MIN(tanggal) FROM penjualan").fetchone()[0]
+    conn.close()
+    return barang, pelanggan, bulan_lalu
+
+
+def skenario(aplikasi, path_db, rnd):
+    client = aplikasi.app.test_client()
+    barang, pelanggan, tanggal_awal = ambil_referensi(path_db)
+    today = date.today()
+    lama = date.fromisoformat(tanggal_awal) if tanggal_awal else today
+
+    def checkout():
+        ids = rnd.sample(barang, k=min(len(barang), rnd.randint(1, 5)))
+        return client.post("/penjualan", data={
+            "id_pelanggan": rnd.choice(pelanggan),
+            "id_barang[]": ids,
+            "jumlah[]": ["1"] * len(ids),
+            "harga_jual[]": ["15000"] * len(ids),
+            "catatan": "tunai",
+        })
+
+    def beli():
+        return client.post("/pembelian", data={
+            "id_barang": rnd.choice(barang), "jumlah": "12", "harga_beli": "9000",
+        })
+
+    def generate_id():
+        conn = aplikasi.buka_koneksi(path_db)
+        try:
+            aplikasi.generate_id("penjualan", "PJ", conn.cursor())
+            conn.commit()
+        finally:
+            conn.close()
+
+    return {
+        "checkout_post": checkout,
+        "penjualan_list": lambda: client.get("/penjualan"),
+        "penjualan_api": lambda: client.get("/api/penjualan?draw=1&start=0&length=10"),
+        "penjualan_form": lambda: client.get("/penjualan?tambah=1"),
+        "laporan_bulan_ini": lambda: client.get("/laporan"),
+        "laporan_bulan_lama": lambda: client.get(f"/laporan?bulan={lama.month:02d}&tahun={lama.year}"),
+        "laporan_tahun_ini": lambda: client.get(f"/laporan?dari={today.year}-01-01&sampai={today.isoformat()}"),
+        "pembelian_get": lambda: client.get("/pembelian"),
+        "pembelian_post": beli,
+        "generate_id": generate_id,
+    }
+
+
+def persentil(data, p):
+    data = sorted(data)
+    k = (len(data) - 1) * p / 100
+    bawah = int(k)
+    atas = min(bawah + 1, len(data) - 1)
+    return data[bawah] + (data[atas] - data[bawah]) * (k - bawah)
+
+
+def ukur(fungsi, ulang, pemanasan, sampel_memori):
+    global jumlah_query
+    for _ in range(pemanasan):
+        fungsi()
+
+    latensi = []
+    query = []
+    for _ in range(ulang):
+        jumlah_query = 0
+        mulai = time.perf_counter()
+        hasil = fungsi()
+        latensi.append((time.perf_counter() - mulai) * 1000)
+        query.append(jumlah_query)
+        if hasil is not None and hasil.status_code >= 400:
+            raise RuntimeError(f"status {hasil.status_code}")
+
+    tracemalloc.start()
+    puncak = 0
+    for _ in range(sampel_memori):
+        tracemalloc.reset_peak()
+        fungsi()
+        puncak = max(puncak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+
+    return {
+        "n": ulang,
+        "p50_ms": round(persentil(latensi, 50), 3),
+        "p95_ms": round(persentil(latensi, 95), 3),
+        "mean_ms": round(statistics.mean(latensi), 3),
+        "query_per_request": round(statistics.mean(query), 2),
+        "puncak_memori_kb": round(puncak / 1024, 1),
+    }
+
+
+def banding(lama, baru):
+    print(f"{'skenario':<22}{'p50 lama':>10}{'p50 baru':>10}{'ubah':>9}{'query':>12}")
+    for nama, b in baru["hasil"].items():
+        a = lama["hasil"].get(nama)
+        if not a:
+            continue
+        ubah = (b["p50_ms"] - a["p50_ms"]) / a["p50_ms"] * 100 if a["p50_ms"] else 0
+        print(f"{nama:<22}{a['p50_ms']:>10.2f}{b['p50_ms']:>10.2f}{ubah:>+8.1f}%"
+              f"{a['query_per_request']:>6.0f}->{b['query_per_request']:<5.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", required=True, help="database hasil generate_data.py")
+    parser.add_argument("--ulang", type=int, default=50, help="request per skenario")
+    parser.add_argument("--pemanasan", type=int, default=3)
+    parser.add_argument("--sampel-memori", type=int, default=3)
+    parser.add_argument("--skenario", nargs="*", help="hanya jalankan skenario ini")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="simpan hasil JSON ke berkas ini")
+    parser.add_argument("--banding", help="hasil JSON sebelumnya untuk dibandingkan")
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix="bench_pos_")
+    path_db = os.path.join(folder, "pos.db")
+    shutil.copy(args.db, path_db)
+
+    aplikasi = siapkan_app(path_db)
+    rnd = random.Random(args.seed)
+    hasil = {}
+    try:
+        for nama, fungsi in skenario(aplikasi, path_db, rnd).items():
+            if args.skenario and nama not in args.skenario:
+                continue
+            hasil[nama] = ukur(fungsi, args.ulang, args.pemanasan, args.sampel_memori)
+            print(f"{nama:<22} p50={hasil[nama]['p50_ms']:.2f}ms p95={hasil[nama]['p95_ms']:.2f}ms "
+                  f"query={hasil[nama]['query_per_request']} memori={hasil[nama]['puncak_memori_kb']}KB")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    laporan = {
+        "db": os.path.basename(args.db),
+        "ukuran_db_mb": round(os.path.getsize(args.db) / 2**20, 1),
+        "waktu": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "ulang": args.ulang,
+        "hasil": hasil,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(laporan, f, indent=2)
+    if args.banding:
+        with open(args.banding) as f:
+            banding(json.load(f), laporan)
+
+
+if __name__ == "__main__":
+    main()
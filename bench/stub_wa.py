@@ -0,0 +1,65 @@
+"""Gateway WA tiruan untuk mencoba outbox tanpa mengirim pesan sungguhan.
+
+Contoh:
+    python bench/stub_wa.py --port 3001
+    WA_ENDPOINT=http://127.0.0.1:3001/send-message flask run
+
+    # gateway lambat / sering gagal, untuk melihat timeout, backoff & dead-letter
+    python bench/stub_wa.py --lambat 8 --gagal 0.5
+
+Setiap pesan yang diterima dicetak satu baris. Dengan --gagal sebagian
+request dibalas 500; dengan --lambat balasan ditahan sekian detik (lebih
+dari WA_TIMEOUT berarti pengirim kena timeout).
+"""
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def buat_handler(lambat, gagal, rnd):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            panjang = int(self.headers.get("Content-Length", 0))
+            try:
+                data = json.loads(self.rfile.read(panjang) or b"{}")
+            except ValueError:
+                self.send_error(400, "JSON tidak valid")
+                return
+            if lambat:
+                time.sleep(lambat)
+            status = 500 if rnd.random() < gagal else 200
+            print(f"{status} {data.get('number')}: {(data.get('message') or '').splitlines()[:1]}", flush=True)
+            isi = json.dumps({"status": status == 200}).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(isi)))
+            self.end_headers()
+            self.wfile.write(isi)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3001)
+    parser.add_argument("--lambat", type=float, default=0, help="detik sebelum membalas")
+    parser.add_argument("--gagal", type=float, default=0, help="peluang dibalas 500 (0-1)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), buat_handler(args.lambat, args.gagal, random.Random(args.seed)))
+    print(f"Stub WA di http://{args.host}:{args.port}/send-message")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+
+from flask import Response, request
+
+from db import migrasi
+
+# === CACHE LAPORAN & NOTA ===
+# Hanya periode yang sudah tutup (sebelum bulan berjalan) yang di-cache. Kunci
+# cache memuat versi data dari tabel versi_data, yang dinaikkan trigger setiap
+# kali ada penulisan bertanggal di periode itu. Jadi entri lama tidak perlu
+# dihapus: kuncinya tidak akan diminta lagi dan tergusur LRU. Karena versinya
+# ada di database, ini tetap benar dengan beberapa proses worker.
+
+MAKS_ENTRI = int(os.environ.get("POS_CACHE_ENTRI", "256"))
+MAKS_BYTE = int(os.environ.get("POS_CACHE_MB", "32")) * 2**20
+# Backend disk opsional, dipakai bersama oleh semua proses worker
+CACHE_DIR = os.environ.get("POS_CACHE_DIR")
+MAKS_BYTE_DISK = int(os.environ.get("POS_CACHE_DISK_MB", "256")) * 2**20
+PANGKAS_DISK_SETIAP = 50
+
+# Tabel bertanggal yang memengaruhi laporan / nota suatu periode
+SUMBER_PERIODE = ["penjualan", "penjualan_item", "pembelian", "pengeluaran", "pemodal"]
+# Tabel referensi yang versinya dicatat utuh
+SUMBER_REFERENSI = ["barang", "pelanggan"]
+# Versi 'barang_nama' hanya naik kalau daftar, nama atau kategori barang
+# berubah, tidak saat stok bergerak. Laporan periode tutup memakai ini.
+KOLOM_NAMA_BARANG = ["nama_barang", "kategori"]
+
+
+class CacheMemori:
+    """LRU dibatasi jumlah entri dan total ukuran."""
+
+    def __init__(self, maks_entri=MAKS_ENTRI, maks_byte=MAKS_BYTE):
+        self.maks_entri = maks_entri
+        self.maks_byte = maks_byte
+        self.data = OrderedDict()
+        self.ukuran = 0
+        self.lock = threading.Lock()
+
+    def ambil(self, kunci):
+        with self.lock:
+            isi = self.data.get(kunci)
+            if isi is None:
+                return None
+            self.data.move_to_end(kunci)
+            return isi[0]
+
+    def simpan(self, kunci, nilai, ukuran):
+        if ukuran > self.maks_byte:
+            return
+        with self.lock:
+            lama = self.data.pop(kunci, None)
+            if lama:
+                self.ukuran -= lama[1]
+            self.data[kunci] = (nilai, ukuran)
+            self.ukuran += ukuran
+            while len(self.data) > self.maks_entri or self.ukuran > self.maks_byte:
+                _, (_, u) = self.data.popitem(last=False)
+                self.ukuran -= u
+
+
+class CacheDisk:
+    """Satu berkas pickle per kunci; berkas tertua dihapus saat melewati batas."""
+
+    def __init__(self, folder, maks_byte=MAKS_BYTE_DISK):
+        self.folder = folder
+        self.maks_byte = maks_byte
+        self.tulis = 0
+        os.makedirs(folder, exist_ok=True)
+
+    def path(self, kunci):
+        return os.path.join(self.folder, hashlib.sha1(repr(kunci).encode()).hexdigest() + ".pkl")
+
+    def ambil(self, kunci):
+        try:
+            with open(self.path(kunci), "rb") as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def simpan(self, kunci, data):
+        path = self.path(kunci)
+        sementara = f"{path}.{os.getpid()}.tmp"
+        with open(sementara, "wb") as f:
+            f.write(data)
+        os.replace(sementara, path)
+        self.tulis += 1
+        if self.tulis % PANGKAS_DISK_SETIAP == 0:
+            self.pangkas()
+
+    def pangkas(self):
+        berkas = []
+        for entri in os.scandir(self.folder):
+            if entri.name.endswith(".pkl"):
+                st = entri.stat()
+                berkas.append((st.st_mtime, st.st_size, entri.path))
+        total = sum(b[1] for b in berkas)
+        for _, ukuran, path in sorted(berkas):
+            if total <= self.maks_byte:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= ukuran
+
+
+_memori = CacheMemori()
+_disk = CacheDisk(CACHE_DIR) if CACHE_DIR else None
+
+
+def ambil(kunci):
+    nilai = _memori.ambil(kunci)
+    if nilai is None and _disk is not None:
+        nilai = _disk.ambil(kunci)
+        if nilai is not None:
+            _memori.simpan(kunci, nilai, len(pickle.dumps(nilai)))
+    return nilai
+
+
+def simpan(kunci, nilai):
+    data = pickle.dumps(nilai)
+    _memori.simpan(kunci, nilai, len(data))
+    if _disk is not None:
+        _disk.simpan(kunci, data)
+
+
+# === VERSI DATA ===
+def periode_tutup(akhir):
+    """True kalau rentang [.., akhir) seluruhnya sebelum bulan berjalan."""
+    return akhir <= date.today().replace(day=1).isoformat()
+
+
+def bulan_tutup(periode):
+    """True untuk bulan 'YYYY-MM' sebelum bulan berjalan."""
+    return periode < date.today().strftime("%Y-%m")
+
+
+def daftar_periode(awal, akhir):
+    """Bulan 'YYYY-MM' yang tercakup rentang [awal, akhir)."""
+    tahun, bulan = int(awal[:4]), int(awal[5:7])
+    hasil = []
+    while f"{tahun:04d}-{bulan:02d}-01" < akhir:
+        hasil.append(f"{tahun:04d}-{bulan:02d}")
+        tahun, bulan = (tahun + 1, 1) if bulan == 12 else (tahun, bulan + 1)
+    return hasil
+
+
+def versi_data(cur, daftar_nama):
+    """Versi untuk tiap nama (mis. 'periode:2025-08', 'barang'), urut sesuai daftar."""
+    cur.execute(f"SELECT nama, versi FROM versi_data WHERE nama IN ({', '.join('?' * len(daftar_nama))})",
+                list(daftar_nama))
+    versi = dict(cur.fetchall())
+    return tuple(versi.get(nama, 0) for nama in daftar_nama)
+
+
+def versi_riwayat(cur, akhir):
+    """Satu angka yang naik setiap ada penulisan bertanggal di bulan mana pun sebelum akhir.
+
+    Posisi stok di akhir periode bergantung pada semua mutasi sebelumnya,
+    bukan hanya mutasi di periode itu.
+    """
+    terakhir = (date.fromisoformat(akhir) - timedelta(days=1)).strftime("%Y-%m")
+    cur.execute("SELECT IFNULL(SUM(versi), 0) FROM versi_data WHERE nama >= 'periode:' AND nama <= ?",
+                ("periode:" + terakhir,))
+    return cur.fetchone()[0]
+
+
+def layani_html(kunci, buat_html):
+    """Respons HTML dari cache dengan ETag; 304 kalau browser sudah punya versi ini."""
+    etag = hashlib.sha1(repr(kunci).encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        html = ambil(kunci)
+        if html is None:
+            html = buat_html()
+            simpan(kunci, html)
+        response = Response(html, mimetype="text/html")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def sql_naikkan_versi(nama):
+    return f"""
+        INSERT INTO versi_data (nama, versi) SELECT {nama}, 1 WHERE 1
+        ON CONFLICT(nama) DO UPDATE SET versi = versi + 1;
+    """
+
+
+def sql_naikkan_periode(baris):
+    # Penulisan di bulan berjalan dilewati: periode itu memang tidak di-cache
+    return f"""
+        INSERT INTO versi_data (nama, versi)
+        SELECT 'periode:' || substr({baris}.tanggal, 1, 7), 1
+        WHERE {baris}.tanggal < strftime('%Y-%m-01', 'now', 'localtime')
+        ON CONFLICT(nama) DO UPDATE SET versi = versi + 1;
+    """
+
+
+@migrasi(9)
+def init_versi_data(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS versi_data (
+            nama TEXT PRIMARY KEY,
+            versi INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+    for tabel in SUMBER_PERIODE:
+        for aksi, isi in (("INSERT", sql_naikkan_periode("NEW")),
+                          ("DELETE", sql_naikkan_periode("OLD")),
+                          ("UPDATE", sql_naikkan_periode("OLD") + sql_naikkan_periode("NEW"))):
+            conn.execute(f"DROP TRIGGER IF EXISTS trg_versi_{tabel}_{aksi.lower()}")
+            conn.execute(f"""
+                CREATE TRIGGER trg_versi_{tabel}_{aksi.lower()}
+                AFTER {aksi} ON {tabel}
+                BEGIN
+                    {isi}
+                END
+            """)
+    for tabel in SUMBER_REFERENSI:
+        for aksi in ("INSERT", "DELETE", "UPDATE"):
+            conn.execute(f"DROP TRIGGER IF EXISTS trg_versi_{tabel}_{aksi.lower()}")
+            conn.execute(f"""
+                CREATE TRIGGER trg_versi_{tabel}_{aksi.lower()}
+                AFTER {aksi} ON {tabel}
+                BEGIN
+                    {sql_naikkan_versi(f"'{tabel}'")}
+                END
+            """)
+
+
+@migrasi(14)
+def init_versi_nama_barang(conn):
+    for aksi, kapan in (("INSERT", "INSERT"), ("DELETE", "DELETE"),
+                        ("UPDATE", f"UPDATE OF {', '.join(KOLOM_NAMA_BARANG)}")):
+        conn.execute(f"DROP TRIGGER IF EXISTS trg_versi_barang_nama_{aksi.lower()}")
+        conn.execute(f"""
+            CREATE TRIGGER trg_versi_barang_nama_{aksi.lower()}
+            AFTER {kapan} ON barang
+            BEGIN
+                {sql_naikkan_versi("'barang_nama'")}
+            END
+        """)
+
+
+# === KATALOG REFERENSI ===
+# Salinan barang & pelanggan per proses, dimuat ulang hanya kalau versinya di
+# versi_data berubah (trigger di atas ikut naik saat stok berubah).
+QUERY_KATALOG = {
+    "barang": ("SELECT * FROM barang", "id_barang"),
+    "pelanggan": ("SELECT * FROM pelanggan", "id_pelanggan"),
+}
+_katalog = {}
+_lock_katalog = threading.Lock()
+
+
+def katalog(cur, nama):
+    """dict id -> baris (dict) untuk 'barang' / 'pelanggan'. Hanya untuk dibaca."""
+    query, kunci = QUERY_KATALOG[nama]
+    if cur.connection.in_transaction:
+        # Di dalam transaksi tulis datanya belum tentu di-commit: jangan di-cache
+        cur.execute(query)
+        return {row[kunci]: dict(row) for row in cur.fetchall()}
+
+    # Satu salinan per berkas database (mode multi-outlet)
+    kunci_katalog = (cur.connection.path, nama)
+    versi = versi_data(cur, [nama])[0]
+    simpanan = _katalog.get(kunci_katalog)
+    if simpanan is not None and simpanan[0] == versi:
+        return simpanan[1]
+    cur.execute(query)
+    data = {row[kunci]: dict(row) for row in cur.fetchall()}
+    with _lock_katalog:
+        _katalog[kunci_katalog] = (versi, data)
+    return data
@@ -0,0 +1,216 @@
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from db import buka_koneksi, jalankan_migrasi, mulai_tulis
+
+# === CADANGAN DATABASE ===
+# Salinan dibuat dengan online backup API SQLite, beberapa halaman per langkah
+# dengan jeda di antaranya. Selama backup, koneksi sumber memegang satu
+# transaksi baca: berkat WAL penulis (kasir) tidak terhalang, dan salinannya
+# konsisten pada satu titik waktu tanpa diulang dari awal setiap ada
+# penulisan. Setiap salinan dicek PRAGMA integrity_check sebelum disimpan.
+
+CADANGAN_DIR = os.environ.get("POS_BACKUP_DIR")
+INTERVAL_JAM = float(os.environ.get("POS_BACKUP_JAM", "24"))
+SIMPAN = int(os.environ.get("POS_BACKUP_SIMPAN", "7"))
+GZIP = os.environ.get("POS_BACKUP_GZIP", "1") == "1"
+HALAMAN_PER_LANGKAH = int(os.environ.get("POS_BACKUP_HALAMAN", "256"))
+JEDA_LANGKAH = float(os.environ.get("POS_BACKUP_JEDA", "0.01"))
+JEDA_GAGAL = 600
+
+log = logging.getLogger("pos.cadangan")
+
+
+class CadanganRusak(Exception):
+    pass
+
+
+def folder_cadangan(db_path):
+    return CADANGAN_DIR or os.path.join(os.path.dirname(os.path.abspath(db_path)), "cadangan")
+
+
+def awalan(db_path):
+    """Nama berkas cadangan: <nama db>-YYYYmmdd-HHMMSS.db[.gz]."""
+    return os.path.splitext(os.path.basename(db_path))[0] + "-"
+
+
+def bagian_nama(db_path, nama):
+    """'20250101-120000.label.db.gz' -> ['20250101-120000', 'label', 'db', 'gz'], atau None."""
+    if not nama.startswith(awalan(db_path)) or not nama.endswith((".db", ".db.gz")):
+        return None
+    bagian = nama[len(awalan(db_path)):].split(".")
+    return bagian if bagian[0].replace("-", "").isdigit() else None
+
+
+def daftar_cadangan(db_path, terjadwal=False):
+    """Path cadangan milik db_path, terbaru dulu. terjadwal=True: tanpa yang berlabel."""
+    folder = folder_cadangan(db_path)
+    if not os.path.isdir(folder):
+        return []
+    nama = []
+    for n in os.listdir(folder):
+        bagian = bagian_nama(db_path, n)
+        if bagian and not (terjadwal and bagian[1] != "db"):
+            nama.append(n)
+    return [os.path.join(folder, n) for n in sorted(nama, reverse=True)]
+
+
+def cek_integritas(path):
+    conn = sqlite3.connect(path)
+    try:
+        hasil = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        conn.close()
+    if hasil != "ok":
+        raise CadanganRusak(f"{path}: {hasil}")
+
+
+def salin_online(sumber, tujuan, progres=None):
+    """Salin database sumber (koneksi) ke berkas tujuan secara bertahap."""
+    target = sqlite3.connect(tujuan)
+    try:
+        # Snapshot baca dipegang sepanjang backup
+        sumber.execute("BEGIN")
+        sumber.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+
+        def jeda(status, sisa, total):
+            if progres:
+                progres(total - sisa, total)
+            time.sleep(JEDA_LANGKAH)
+
+        sumber.backup(target, pages=HALAMAN_PER_LANGKAH, progress=jeda)
+        # Salinan berdiri sendiri, tanpa berkas -wal
+        target.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        if sumber.in_transaction:
+            sumber.rollback()
+        target.close()
+
+
+def buat_cadangan(db_path, label="", progres=None):
+    """Buat satu cadangan db_path; kembalikan path berkasnya."""
+    folder = folder_cadangan(db_path)
+    os.makedirs(folder, exist_ok=True)
+    nama = awalan(db_path) + datetime.now().strftime("%Y%m%d-%H%M%S") + (f".{label}" if label else "") + ".db"
+    path = os.path.join(folder, nama)
+    sementara = path + ".tmp"
+
+    sumber = buka_koneksi(db_path)
+    try:
+        salin_online(sumber, sementara, progres)
+    finally:
+        sumber.close()
+    try:
+        cek_integritas(sementara)
+        if GZIP:
+            with open(sementara, "rb") as f, gzip.open(path + ".gz.tmp", "wb", compresslevel=6) as gz:
+                shutil.copyfileobj(f, gz, 1024 * 1024)
+            os.remove(sementara)
+            sementara, path = path + ".gz.tmp", path + ".gz"
+        os.replace(sementara, path)
+    finally:
+        if os.path.exists(sementara):
+            os.remove(sementara)
+
+    if not label:
+        rotasi(db_path)
+    return path
+
+
+def rotasi(db_path, simpan=SIMPAN):
+    """Hapus cadangan terjadwal yang lebih lama dari `simpan` terbaru."""
+    for path in daftar_cadangan(db_path, terjadwal=True)[simpan:]:
+        os.remove(path)
+
+
+def pulihkan(path_cadangan, db_path):
+    """Timpa isi db_path dengan cadangan, lewat backup API supaya aman walau ada koneksi lain.
+
+    Isi sekarang dicadangkan dulu dengan label 'sebelum-pulih'.
+    """
+    folder = os.path.dirname(os.path.abspath(db_path))
+    sementara = os.path.join(folder, f".pulih-{os.getpid()}.db")
+    try:
+        if path_cadangan.endswith(".gz"):
+            with gzip.open(path_cadangan, "rb") as gz, open(sementara, "wb") as f:
+                shutil.copyfileobj(gz, f, 1024 * 1024)
+        else:
+            shutil.copyfile(path_cadangan, sementara)
+        cek_integritas(sementara)
+
+        pengaman = buat_cadangan(db_path, label="sebelum-pulih") if os.path.exists(db_path) else None
+        conn = buka_koneksi(db_path)
+        try:
+            versi_lama = baca_versi_data(conn)
+            snapshot = sqlite3.connect(sementara)
+            try:
+                # Satu langkah: koneksi lain tidak pernah melihat isi setengah jadi
+                snapshot.backup(conn)
+            finally:
+                snapshot.close()
+            # Cadangan lama mungkin skema lama
+            jalankan_migrasi(conn)
+            # Versi data dinaikkan melewati versi sebelum pulih, supaya cache
+            # laporan/katalog di proses yang masih jalan tidak dipakai lagi
+            lompat = max(versi_lama.values(), default=0) + 1
+            mulai_tulis(conn)
+            conn.execute("UPDATE versi_data SET versi = versi + ?", (lompat,))
+            conn.executemany("INSERT OR IGNORE INTO versi_data (nama, versi) VALUES (?, ?)",
+                             [(nama, lompat) for nama in set(versi_lama) | {"barang", "barang_nama", "pelanggan"}])
+            conn.commit()
+        finally:
+            conn.close()
+        return pengaman
+    finally:
+        if os.path.exists(sementara):
+            os.remove(sementara)
+
+
+def baca_versi_data(conn):
+    try:
+        return dict(conn.execute("SELECT nama, versi FROM versi_data").fetchall())
+    except sqlite3.OperationalError:
+        return {}
+
+
+# === PENJADWAL ===
+class PenjadwalCadangan(threading.Thread):
+    """Worker latar yang membuat cadangan setiap INTERVAL_JAM."""
+
+    def __init__(self, db_path):
+        super().__init__(name="cadangan", daemon=True)
+        self.db_path = db_path
+
+    def run(self):
+        while True:
+            # Jadwal dihitung dari cadangan terakhir, jadi restart tidak memicu backup baru
+            terakhir = daftar_cadangan(self.db_path, terjadwal=True)
+            sisa = INTERVAL_JAM * 3600 - (time.time() - os.path.getmtime(terakhir[0])) if terakhir else 0
+            if sisa <= 0:
+                try:
+                    log.info("Cadangan dibuat: %s", buat_cadangan(self.db_path))
+                    continue
+                except (sqlite3.Error, OSError, CadanganRusak) as e:
+                    log.error("Cadangan %s gagal: %s", self.db_path, e)
+                    sisa = JEDA_GAGAL
+            time.sleep(min(sisa, 600))
+
+
+_penjadwal = {}   # db_path -> PenjadwalCadangan
+_penjadwal_lock = threading.Lock()
+
+
+def jalankan_penjadwal(db_path):
+    if INTERVAL_JAM <= 0:
+        return None
+    with _penjadwal_lock:
+        if db_path not in _penjadwal:
+            _penjadwal[db_path] = PenjadwalCadangan(db_path)
+            _penjadwal[db_path].start()
+    return _penjadwal[db_path]
@@ -0,0 +1,63 @@
+BATAS_HALAMAN = 500
+
+
+def _angka(nilai, bawaan):
+    try:
+        return int(nilai)
+    except (TypeError, ValueError):
+        return bawaan
+
+
+def layani_datatables(cur, tabel, kolom, kolom_urut, kolom_cari, args, urutan_bawaan, params_tabel=()):
+    """Jawab satu request DataTables server-side processing.
+
+    kolom_urut: kolom database untuk tiap kolom tabel di halaman, sesuai
+    indeks order[i][column]. Nama kolom di SQL hanya berasal dari daftar di
+    kode, tidak pernah dari request. tabel boleh berupa subquery; nilai untuk
+    placeholder-nya diberikan lewat params_tabel.
+    """
+    params_tabel = list(params_tabel)
+    draw = _angka(args.get("draw"), 0)
+    start = max(0, _angka(args.get("start"), 0))
+    length = _angka(args.get("length"), 10)
+    if length < 0 or length > BATAS_HALAMAN:
+        length = BATAS_HALAMAN
+
+    cari = (args.get("search[value]") or "").strip()
+    where = ""
+    params = []
+    if cari:
+        where = "WHERE " + " OR ".join(f"{k} LIKE ?" for k in kolom_cari)
+        params = [f"%{cari}%"] * len(kolom_cari)
+
+    urutan = []
+    i = 0
+    while f"order[{i}][column]" in args:
+        indeks = _angka(args.get(f"order[{i}][column]"), -1)
+        arah = "DESC" if args.get(f"order[{i}][dir]") == "desc" else "ASC"
+        if 0 <= indeks < len(kolom_urut):
+            urutan.append(f"{kolom_urut[indeks]} {arah}")
+        i += 1
+    urutan.append(urutan_bawaan)
+
+    cur.execute(f"SELECT COUNT(*) FROM {tabel}", params_tabel)
+    total = cur.fetchone()[0]
+    if cari:
+        cur.execute(f"SELECT COUNT(*) FROM {tabel} {where}", params_tabel + params)
+        tersaring = cur.fetchone()[0]
+    else:
+        tersaring = total
+
+    cur.execute(f"""
+        SELECT {", ".join(kolom)} FROM {tabel} {where}
+        ORDER BY {", ".join(urutan)}
+        LIMIT ? OFFSET ?
+    """, params_tabel + params + [length, start])
+    data = [dict(zip(kolom, row)) for row in cur.fetchall()]
+
+    return {
+        "draw": draw,
+        "recordsTotal": total,
+        "recordsFiltered": tersaring,
+        "data": data,
+    }
@@ -0,0 +1,175 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from flask import current_app, g
+
+from metrik import KoneksiTerukur
+
+DB_PATH = os.environ.get("POS_DB", "pos.db")
+
+# Pengaturan koneksi, bisa diubah lewat environment
+BUSY_TIMEOUT_MS = int(os.environ.get("POS_DB_BUSY_TIMEOUT", "5000"))
+CACHE_SIZE_KB = int(os.environ.get("POS_DB_CACHE_KB", "20000"))
+# Percobaan BEGIN IMMEDIATE sebelum menyerah (masing-masing menunggu busy_timeout)
+MAKS_COBA_TULIS = int(os.environ.get("POS_DB_COBA_TULIS", "3"))
+
+_lokal = threading.local()
+
+
+def buka_koneksi(path=None):
+    """Buka koneksi baru dengan pragma standar aplikasi."""
+    # KoneksiTerukur mencatat jumlah dan waktu statement per request untuk /metrics
+    conn = sqlite3.connect(path or DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000, factory=KoneksiTerukur)
+    conn.row_factory = sqlite3.Row
+    # Dipakai sebagai pembeda cache per database (mode multi-outlet)
+    conn.path = path or DB_PATH
+    # WAL: pembaca /laporan tidak lagi memblokir penulis di kasir
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def path_db():
+    """Database untuk request ini: milik outlet terpilih, atau DB_PATH."""
+    return g.get("db_path") or current_app.config["DB_PATH"]
+
+
+def get_db():
+    """Koneksi milik thread ini, dipakai ulang antar request."""
+    if "db" not in g:
+        path = path_db()
+        koneksi = getattr(_lokal, "koneksi", None)
+        if koneksi is None:
+            koneksi = _lokal.koneksi = {}
+        conn = koneksi.get(path)
+        if conn is None:
+            conn = koneksi[path] = buka_koneksi(path)
+        g.db = conn
+    return g.db
+
+
+def selesai_request(exc=None):
+    conn = g.pop("db", None)
+    if conn is not None and conn.in_transaction:
+        # Transaksi yang tidak di-commit (misalnya karena error) dibatalkan
+        # supaya koneksi bersih untuk request berikutnya.
+        conn.rollback()
+
+
+class DatabaseSibuk(Exception):
+    pass
+
+
+def mulai_tulis(conn):
+    """Mulai transaksi tulis dengan BEGIN IMMEDIATE.
+
+    Kunci tulis diambil di awal transaksi, jadi penulis dari proses lain antre
+    di sini lewat busy_timeout. Tanpa ini transaksi dimulai sebagai baca lalu
+    gagal "database is locked" saat naik menjadi tulis.
+    """
+    if conn.in_transaction:
+        return
+    for coba in range(1, MAKS_COBA_TULIS + 1):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            return
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e) and "busy" not in str(e):
+                raise
+            if coba == MAKS_COBA_TULIS:
+                raise DatabaseSibuk(str(e)) from e
+            time.sleep(random.uniform(0.05, 0.2) * coba)
+
+
+def init_app(app):
+    app.config.setdefault("DB_PATH", DB_PATH)
+    app.teardown_appcontext(selesai_request)
+
+
+# === MIGRASI SKEMA ===
+# Versi skema disimpan di PRAGMA user_version. Setiap modul mendaftarkan
+# migrasinya dengan @migrasi(versi); migrasi dijalankan berurutan, masing-masing
+# dalam satu transaksi.
+_daftar_migrasi = {}
+
+
+def migrasi(versi):
+    def daftar(fungsi):
+        if versi in _daftar_migrasi:
+            raise ValueError(f"versi migrasi {versi} dipakai dua kali")
+        _daftar_migrasi[versi] = fungsi
+        return fungsi
+    return daftar
+
+
+def jalankan_migrasi(conn):
+    versi_db = conn.execute("PRAGMA user_version").fetchone()[0]
+    for versi in sorted(_daftar_migrasi):
+        if versi <= versi_db:
+            continue
+        mulai_tulis(conn)
+        try:
+            # Dibaca ulang di dalam kunci tulis: beberapa proses worker bisa
+            # start bersamaan dan hanya satu yang boleh menjalankan migrasi.
+            if conn.execute("PRAGMA user_version").fetchone()[0] < versi:
+                _daftar_migrasi[versi](conn)
+                conn.execute(f"PRAGMA user_version={versi}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+# === NOMOR URUT ID ===
+# Satu baris per prefix. UPDATE ... RETURNING mengambil nomor secara atomik di
+# dalam transaksi penulisan, jadi dua kasir tidak mendapat ID yang sama.
+PREFIX_ID = {
+    "barang": "BRG",
+    "pembelian": "PB",
+    "penjualan": "PJ",
+    "pelanggan": "PL",
+    "pengeluaran": "OUT",
+    "pemodal": "PM",
+}
+
+
+def nomor_terakhir(table, prefix, cur):
+    cur.execute(f"""
+        SELECT IFNULL(MAX(CAST(SUBSTR(id_{table}, ?) AS INTEGER)), 0)
+        FROM {table} WHERE id_{table} LIKE ?
+    """, (len(prefix) + 1, prefix + "%"))
+    return cur.fetchone()[0]
+
+
+def generate_id(table, prefix, cur, jumlah=1):
+    """Ambil ID berikutnya. Dengan jumlah > 1, kembalikan ID pertama dari blok berurutan."""
+    cur.execute("UPDATE id_urut SET nilai = nilai + ? WHERE prefix = ? RETURNING nilai", (jumlah, prefix))
+    row = cur.fetchone()
+    if row is None:
+        # Prefix baru: mulai dari data yang sudah ada
+        nilai = nomor_terakhir(table, prefix, cur) + jumlah
+        cur.execute("INSERT INTO id_urut (prefix, nilai) VALUES (?, ?)", (prefix, nilai))
+    else:
+        nilai = row[0]
+    new_num = nilai - jumlah + 1
+    return f"{prefix}{new_num:03d}"
+
+
+@migrasi(6)
+def init_id_urut(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS id_urut (
+            prefix TEXT PRIMARY KEY,
+            nilai INTEGER
+        )
+    """)
+    cur = conn.cursor()
+    for table, prefix in PREFIX_ID.items():
+        cur.execute("INSERT OR REPLACE INTO id_urut (prefix, nilai) VALUES (?, ?)",
+                    (prefix, nomor_terakhir(table, prefix, cur)))
@@ -0,0 +1,101 @@
+import csv
+import io
+import tempfile
+import zlib
+
+UKURAN_FETCH = 500
+
+# jenis -> (kolom header, query dengan rentang [awal, akhir))
+EKSPOR = {
+    "penjualan": (
+        ["id_penjualan", "tanggal", "id_pelanggan", "id_barang", "nama_barang",
+         "jumlah", "harga_jual", "total", "catatan", "hpp_unit", "laba"],
+        """
+        SELECT p.id_penjualan, p.tanggal, p.id_pelanggan, i.id_barang, i.nama_barang,
+               i.jumlah, i.harga_jual, i.total, p.catatan, i.hpp_unit, i.laba
+        FROM penjualan p JOIN penjualan_item i ON i.id_penjualan = p.id_penjualan
+        WHERE p.tanggal >= ? AND p.tanggal < ?
+        ORDER BY p.tanggal, p.id_penjualan, i.id
+        """,
+    ),
+    "pembelian": (
+        ["id_pembelian", "tanggal", "id_barang", "nama_barang", "jumlah",
+         "harga_beli", "total_beli", "keterangan"],
+        """
+        SELECT id_pembelian, tanggal, id_barang, nama_barang, jumlah,
+               harga_beli, total_beli, keterangan
+        FROM pembelian WHERE tanggal >= ? AND tanggal < ?
+        ORDER BY tanggal, id_pembelian
+        """,
+    ),
+    "pengeluaran": (
+        ["id_pengeluaran", "tanggal", "kategori", "jumlah", "keterangan"],
+        """
+        SELECT id_pengeluaran, tanggal, kategori, jumlah, keterangan
+        FROM pengeluaran WHERE tanggal >= ? AND tanggal < ?
+        ORDER BY tanggal, id_pengeluaran
+        """,
+    ),
+    "laporan": (
+        ["tanggal", "penjualan", "laba", "pembelian", "pengeluaran", "modal"],
+        """
+        SELECT tanggal, penjualan, laba, pembelian, pengeluaran, modal
+        FROM rekap_harian WHERE tanggal >= ? AND tanggal < ?
+        ORDER BY tanggal
+        """,
+    ),
+}
+
+
+def baris_ekspor(cur, jenis, awal, akhir):
+    """Generator baris hasil query; cursor dibaca bertahap, tanpa fetchall."""
+    _, query = EKSPOR[jenis]
+    cur.execute(query, (awal, akhir))
+    while True:
+        rows = cur.fetchmany(UKURAN_FETCH)
+        if not rows:
+            break
+        for row in rows:
+            yield tuple(row)
+
+
+def stream_csv(header, rows, gzip=False):
+    """Generator potongan bytes CSV, opsional dikompres gzip."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    kompres = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+
+    def ambil():
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return kompres.compress(data) if kompres else data
+
+    buffer.write("\ufeff")  # BOM agar Excel membaca UTF-8
+    writer.writerow(header)
+    for i, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if i % UKURAN_FETCH == 0:
+            potongan = ambil()
+            if potongan:
+                yield potongan
+    potongan = ambil()
+    if potongan:
+        yield potongan
+    if kompres:
+        yield kompres.flush()
+
+
+def tulis_xlsx(header, rows):
+    """Tulis XLSX mode write_only ke berkas sementara, kembalikan berkasnya."""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(header)
+    for row in rows:
+        ws.append(row)
+    berkas = tempfile.TemporaryFile(suffix=".xlsx")
+    wb.save(berkas)
+    berkas.seek(0)
+    return berkas
@@ -0,0 +1,23 @@
+# Mode produksi: gunicorn -c gunicorn.conf.py app:app
+# Beberapa proses worker berbagi pos.db. Penulisan diserialkan oleh SQLite
+# lewat BEGIN IMMEDIATE (db.mulai_tulis), pembacaan jalan paralel berkat WAL.
+import multiprocessing
+import os
+
+bind = os.environ.get("POS_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("POS_WORKERS", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.environ.get("POS_THREADS", "20"))
+# Dashboard SSE (/api/peristiwa) memegang satu thread selama tersambung.
+# Per proses paling banyak POS_SSE_MAKS dashboard, bawaannya POS_THREADS - 4
+# (peristiwa.THREAD_KASIR), jadi 4 thread selalu tersisa untuk kasir. Thread
+# yang menunggu SSE hampir tidak memakai CPU; naikkan POS_THREADS untuk
+# menambah penonton.
+timeout = 60
+accesslog = "-"
+
+# Migrasi skema dijalankan sekali di master sebelum proses worker di-fork
+preload_app = True
+
+# Worker latar (outbox WA, sinkron Sheets) cukup di satu proses
+os.environ.setdefault("POS_KUNCI_LATAR", os.path.abspath(os.environ.get("POS_DB", "pos.db")) + ".latar")
@@ -0,0 +1,248 @@
+import csv
+import io
+from collections import defaultdict
+from datetime import date
+
+from db import generate_id, mulai_tulis
+from restok import perbarui_kecepatan
+
+UKURAN_CHUNK = 500
+MAKS_LAPORAN_ERROR = 200
+
+SATUAN_BAWAAN = "pcs"
+KATEGORI_BAWAAN = "Lainnya"
+
+
+# === BACA BERKAS ===
+def baca_csv(berkas):
+    teks = io.TextIOWrapper(berkas, encoding="utf-8-sig", newline="")
+    contoh = teks.read(2048)
+    teks.seek(0)
+    try:
+        dialek = csv.Sniffer().sniff(contoh, delimiters=",;\t")
+    except csv.Error:
+        dialek = csv.excel
+    reader = csv.reader(teks, dialek)
+    header = next(reader, None)
+    if header is None:
+        return
+    kunci = [h.strip().lower() for h in header]
+    for row in reader:
+        if any(sel.strip() for sel in row):
+            yield dict(zip(kunci, row))
+        else:
+            yield None
+
+
+def baca_xlsx(berkas):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("Impor XLSX butuh paket openpyxl (pip install openpyxl)")
+    wb = load_workbook(berkas, read_only=True, data_only=True)
+    rows = wb.active.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return
+    kunci = [str(h or "").strip().lower() for h in header]
+    for row in rows:
+        if any(sel not in (None, "") for sel in row):
+            yield dict(zip(kunci, ("" if sel is None else sel for sel in row)))
+        else:
+            yield None
+    wb.close()
+
+
+def baca_berkas(berkas, nama_berkas):
+    """Generator dict per baris data; header baris pertama, baris kosong = None."""
+    if nama_berkas.lower().endswith((".xlsx", ".xlsm")):
+        return baca_xlsx(berkas)
+    return baca_csv(berkas)
+
+
+def per_chunk(baris_iter):
+    chunk = []
+    # Nomor baris mengikuti berkas: header di baris 1
+    for nomor, data in enumerate(baris_iter, start=2):
+        if data is None:
+            continue
+        chunk.append((nomor, data))
+        if len(chunk) == UKURAN_CHUNK:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def teks(data, kolom):
+    return str(data.get(kolom) or "").strip()
+
+
+def angka(data, kolom):
+    nilai = data.get(kolom)
+    if isinstance(nilai, (int, float)):
+        if nilai != int(nilai):
+            raise ValueError(f"{kolom} harus bilangan bulat")
+        return int(nilai)
+    nilai = teks(data, kolom).replace(".", "").replace(",", "")
+    if not nilai:
+        raise ValueError(f"{kolom} kosong")
+    return int(nilai)
+
+
+def ambil_tanggal(data, bawaan):
+    nilai = data.get("tanggal")
+    if hasattr(nilai, "date"):
+        return nilai.date().isoformat()
+    nilai = teks(data, "tanggal")
+    if not nilai:
+        return bawaan
+    return date.fromisoformat(nilai[:10]).isoformat()
+
+
+# === IMPOR ===
+def impor_pembelian(conn, baris_iter, tanggal=None):
+    """Impor pembelian dalam satu transaksi. Kolom: id_barang atau nama_barang,
+    jumlah, harga_beli, [tanggal], [keterangan]."""
+    tanggal = tanggal or str(date.today())
+    mulai_tulis(conn)
+    cur = conn.cursor()
+    hasil = {"berhasil": 0, "error": []}
+    stok_delta = defaultdict(int)
+
+    for chunk in per_chunk(baris_iter):
+        # Cari barang sekaligus untuk satu chunk
+        daftar_id = {teks(d, "id_barang") for _, d in chunk} - {""}
+        daftar_nama = {teks(d, "nama_barang").upper() for _, d in chunk} - {""}
+        barang_id, barang_nama = {}, {}
+        if daftar_id:
+            cur.execute(f"SELECT id_barang, nama_barang FROM barang WHERE id_barang IN ({', '.join('?' * len(daftar_id))})",
+                        list(daftar_id))
+            barang_id = {row[0]: row[1] for row in cur.fetchall()}
+        if daftar_nama:
+            cur.execute(f"SELECT id_barang, nama_barang FROM barang WHERE UPPER(nama_barang) IN ({', '.join('?' * len(daftar_nama))})",
+                        list(daftar_nama))
+            barang_nama = {row[1].upper(): (row[0], row[1]) for row in cur.fetchall()}
+
+        valid = []
+        for nomor, data in chunk:
+            try:
+                id_barang = teks(data, "id_barang")
+                if id_barang:
+                    if id_barang not in barang_id:
+                        raise ValueError(f"id_barang {id_barang} tidak ditemukan")
+                    nama_barang = barang_id[id_barang]
+                else:
+                    nama = teks(data, "nama_barang").upper()
+                    if nama not in barang_nama:
+                        raise ValueError(f"barang '{nama}' tidak ditemukan")
+                    id_barang, nama_barang = barang_nama[nama]
+                jumlah = angka(data, "jumlah")
+                harga = angka(data, "harga_beli")
+                if jumlah <= 0 or harga < 0:
+                    raise ValueError("jumlah harus > 0 dan harga_beli tidak boleh negatif")
+                tgl = ambil_tanggal(data, tanggal)
+            except ValueError as e:
+                if len(hasil["error"]) < MAKS_LAPORAN_ERROR:
+                    hasil["error"].append({"baris": nomor, "error": str(e)})
+                else:
+                    hasil["error_lain"] = hasil.get("error_lain", 0) + 1
+                continue
+            valid.append((tgl, id_barang, nama_barang, jumlah, harga, teks(data, "keterangan")))
+
+        if not valid or hasil["error"]:
+            # Sudah ada error: cukup validasi sisa berkas, tidak perlu menulis
+            continue
+
+        pertama = generate_id("pembelian", "PB", cur, jumlah=len(valid))
+        mulai = int(pertama[2:])
+        baris_pembelian = []
+        baris_lapisan = []
+        for i, (tgl, id_barang, nama_barang, jumlah, harga, keterangan) in enumerate(valid):
+            id_pembelian = f"PB{mulai + i:03d}"
+            baris_pembelian.append((id_pembelian, tgl, id_barang, nama_barang, jumlah, harga, jumlah * harga, keterangan))
+            baris_lapisan.append((id_pembelian, id_barang, tgl, harga, jumlah, jumlah))
+            stok_delta[id_barang] += jumlah
+
+        cur.executemany("""
+            INSERT INTO pembelian (id_pembelian, tanggal, id_barang, nama_barang,
+                                   jumlah, harga_beli, total_beli, keterangan)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, baris_pembelian)
+        cur.executemany("""
+            INSERT INTO stok_lapisan (id_pembelian, id_barang, tanggal, harga_beli, jumlah, sisa)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, baris_lapisan)
+        hasil["berhasil"] += len(valid)
+
+    if hasil["error"]:
+        # Semua atau tidak sama sekali, supaya berkas yang sudah dibetulkan
+        # bisa diimpor ulang tanpa dobel.
+        conn.rollback()
+        hasil["berhasil"] = 0
+        return hasil
+
+    # Stok ditambah sekali per barang, bukan per baris
+    cur.executemany("UPDATE barang SET stok_akhir = stok_akhir + ? WHERE id_barang = ?",
+                    [(delta, id_barang) for id_barang, delta in stok_delta.items()])
+    perbarui_kecepatan(cur)
+    conn.commit()
+    return hasil
+
+
+def impor_barang(conn, baris_iter):
+    """Impor barang baru dalam satu transaksi. Kolom: nama_barang, [satuan], [kategori]."""
+    mulai_tulis(conn)
+    cur = conn.cursor()
+    hasil = {"berhasil": 0, "error": []}
+
+    for chunk in per_chunk(baris_iter):
+        daftar_nama = {teks(d, "nama_barang").upper() for _, d in chunk} - {""}
+        sudah_ada = set()
+        if daftar_nama:
+            cur.execute(f"SELECT UPPER(nama_barang) FROM barang WHERE UPPER(nama_barang) IN ({', '.join('?' * len(daftar_nama))})",
+                        list(daftar_nama))
+            sudah_ada = {row[0] for row in cur.fetchall()}
+
+        valid = []
+        for nomor, data in chunk:
+            nama = teks(data, "nama_barang").upper()
+            if not nama:
+                error = "nama_barang kosong"
+            elif nama in sudah_ada:
+                error = f"barang '{nama}' sudah ada"
+            else:
+                error = None
+            if error:
+                if len(hasil["error"]) < MAKS_LAPORAN_ERROR:
+                    hasil["error"].append({"baris": nomor, "error": error})
+                else:
+                    hasil["error_lain"] = hasil.get("error_lain", 0) + 1
+                continue
+            sudah_ada.add(nama)
+            valid.append((nama, teks(data, "satuan") or SATUAN_BAWAAN, teks(data, "kategori") or KATEGORI_BAWAAN))
+
+        if not valid or hasil["error"]:
+            continue
+
+        pertama = generate_id("barang", "BRG", cur, jumlah=len(valid))
+        mulai = int(pertama[3:])
+        cur.executemany("""
+            INSERT INTO barang (id_barang, nama_barang, satuan, kategori, stok_akhir)
+            VALUES (?, ?, ?, ?, 0)
+        """, [(f"BRG{mulai + i:03d}", nama, satuan, kategori) for i, (nama, satuan, kategori) in enumerate(valid)])
+        hasil["berhasil"] += len(valid)
+
+    if hasil["error"]:
+        conn.rollback()
+        hasil["berhasil"] = 0
+        return hasil
+
+    conn.commit()
+    return hasil
+
+
+JENIS_IMPOR = {
+    "pembelian": impor_pembelian,
+    "barang": impor_barang,
+}
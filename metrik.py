@@ -0,0 +1,208 @@
+import cProfile
+import io
+import os
+import pstats
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+from flask import Response, before_render_template, g, has_request_context, request, template_rendered
+
+# Log request lambat beserta query-nya; 0 = mati
+SLOW_MS = float(os.environ.get("POS_SLOW_MS", "0"))
+# Profil cProfile satu dari setiap N request; 0 = mati
+PROFIL_SETIAP = int(os.environ.get("POS_PROFIL_SETIAP", "0"))
+PROFIL_DIR = os.environ.get("POS_PROFIL_DIR", "profil")
+
+BUCKET = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self):
+        self.bucket = [0] * len(BUCKET)
+        self.jumlah = 0
+        self.total = 0.0
+
+    def catat(self, nilai):
+        for i, batas in enumerate(BUCKET):
+            if nilai <= batas:
+                self.bucket[i] += 1
+        self.jumlah += 1
+        self.total += nilai
+
+
+_lock = threading.Lock()
+_latensi = defaultdict(Histogram)        # (route, method) -> Histogram
+_request = defaultdict(int)              # (route, method, status) -> jumlah
+_sql_jumlah = defaultdict(int)           # route -> jumlah statement
+_sql_waktu = defaultdict(float)          # route -> detik
+_render = defaultdict(Histogram)         # template -> Histogram
+_hitung_profil = 0
+
+
+# === SQL ===
+def catat_sql(sql, durasi):
+    if has_request_context() and "metrik_sql" in g:
+        g.metrik_sql.append((sql, durasi))
+
+
+class CursorTerukur(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        mulai = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            catat_sql(sql, time.perf_counter() - mulai)
+
+    def executemany(self, sql, seq_of_parameters):
+        mulai = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            catat_sql(sql, time.perf_counter() - mulai)
+
+
+class KoneksiTerukur(sqlite3.Connection):
+    """Koneksi yang mencatat setiap statement dan durasinya ke request aktif."""
+
+    def cursor(self, factory=CursorTerukur):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+# === REQUEST & RENDER ===
+def mulai_request():
+    global _hitung_profil
+    g.metrik_mulai = time.perf_counter()
+    g.metrik_sql = []
+    g.metrik_render = 0.0
+    if PROFIL_SETIAP > 0:
+        with _lock:
+            _hitung_profil += 1
+            ambil = _hitung_profil % PROFIL_SETIAP == 0
+        if ambil:
+            g.metrik_profil = cProfile.Profile()
+            g.metrik_profil.enable()
+
+
+def selesai_request(response):
+    if "metrik_mulai" not in g:
+        return response
+    durasi = time.perf_counter() - g.metrik_mulai
+    route = request.endpoint or "tidak_ada"
+    sql = g.metrik_sql
+    waktu_sql = sum(d for _, d in sql)
+
+    with _lock:
+        _latensi[(route, request.method)].catat(durasi)
+        _request[(route, request.method, response.status_code)] += 1
+        _sql_jumlah[route] += len(sql)
+        _sql_waktu[route] += waktu_sql
+
+    profil = g.pop("metrik_profil", None)
+    if profil is not None:
+        profil.disable()
+        simpan_profil(profil, route)
+
+    if SLOW_MS and durasi * 1000 >= SLOW_MS:
+        baris = [f"  {d * 1000:8.2f}ms  {' '.join(q.split())[:200]}" for q, d in sql]
+        from flask import current_app
+        current_app.logger.warning(
+            "Request lambat %s %s: %.1fms (sql %d statement, %.1fms; render %.1fms)\n%s",
+            request.method, request.full_path, durasi * 1000, len(sql), waktu_sql * 1000,
+            g.metrik_render * 1000, "\n".join(baris))
+    return response
+
+
+def simpan_profil(profil, route):
+    from flask import current_app
+    os.makedirs(PROFIL_DIR, exist_ok=True)
+    path = os.path.join(PROFIL_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{route}.prof")
+    profil.dump_stats(path)
+    keluaran = io.StringIO()
+    pstats.Stats(profil, stream=keluaran).sort_stats("cumulative").print_stats(15)
+    current_app.logger.info("Profil %s disimpan ke %s\n%s", route, path, keluaran.getvalue())
+
+
+def mulai_render(sender, template, context, **extra):
+    if has_request_context():
+        g.metrik_render_mulai = time.perf_counter()
+
+
+def selesai_render(sender, template, context, **extra):
+    if has_request_context() and "metrik_render_mulai" in g:
+        durasi = time.perf_counter() - g.pop("metrik_render_mulai")
+        if "metrik_render" in g:
+            g.metrik_render += durasi
+        with _lock:
+            _render[template.name or "?"].catat(durasi)
+
+
+# === PROMETHEUS ===
+def _label(**label):
+    isi = ",".join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                   for k, v in label.items())
+    return "{" + isi + "}"
+
+
+def _tulis_histogram(baris, nama, data, **label):
+    for i, batas in enumerate(BUCKET):
+        baris.append(f"{nama}_bucket{_label(**label, le=batas)} {data.bucket[i]}")
+    baris.append(f"{nama}_bucket{_label(**label, le='+Inf')} {data.jumlah}")
+    baris.append(f"{nama}_sum{_label(**label)} {data.total:.6f}")
+    baris.append(f"{nama}_count{_label(**label)} {data.jumlah}")
+
+
+def teks_prometheus(status_outbox=None):
+    baris = []
+    with _lock:
+        baris.append("# HELP pos_request_duration_seconds Latensi request per route")
+        baris.append("# TYPE pos_request_duration_seconds histogram")
+        for (route, method), data in sorted(_latensi.items()):
+            _tulis_histogram(baris, "pos_request_duration_seconds", data, route=route, method=method)
+
+        baris.append("# HELP pos_requests_total Jumlah request per route dan status")
+        baris.append("# TYPE pos_requests_total counter")
+        for (route, method, status), n in sorted(_request.items()):
+            baris.append(f"pos_requests_total{_label(route=route, method=method, status=status)} {n}")
+
+        baris.append("# HELP pos_sql_statements_total Jumlah statement SQL per route")
+        baris.append("# TYPE pos_sql_statements_total counter")
+        for route, n in sorted(_sql_jumlah.items()):
+            baris.append(f"pos_sql_statements_total{_label(route=route)} {n}")
+
+        baris.append("# HELP pos_sql_seconds_total Waktu eksekusi SQL per route")
+        baris.append("# TYPE pos_sql_seconds_total counter")
+        for route, detik in sorted(_sql_waktu.items()):
+            baris.append(f"pos_sql_seconds_total{_label(route=route)} {detik:.6f}")
+
+        baris.append("# HELP pos_render_duration_seconds Waktu render template Jinja")
+        baris.append("# TYPE pos_render_duration_seconds histogram")
+        for template, data in sorted(_render.items()):
+            _tulis_histogram(baris, "pos_render_duration_seconds", data, template=template)
+
+    if status_outbox is not None:
+        baris.append("# HELP pos_wa_outbox Jumlah pesan WA di outbox per status")
+        baris.append("# TYPE pos_wa_outbox gauge")
+        for status, n in status_outbox:
+            baris.append(f"pos_wa_outbox{_label(status=status)} {n}")
+
+    return "\n".join(baris) + "\n"
+
+
+def init_app(app, ambil_status_outbox=None):
+    app.before_request(mulai_request)
+    app.after_request(selesai_request)
+    before_render_template.connect(mulai_render, app)
+    template_rendered.connect(selesai_render, app)
+
+    @app.route("/metrics")
+    def metrics():
+        status = ambil_status_outbox() if ambil_status_outbox else None
+        return Response(teks_prometheus(status), mimetype="text/plain; version=0.0.4")
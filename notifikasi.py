@@ -0,0 +1,162 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+from db import buka_koneksi, migrasi
+
+WA_ENDPOINT = os.environ.get("WA_ENDPOINT", "http://194.163.184.129:3001/send-message")
+WA_TIMEOUT = float(os.environ.get("WA_TIMEOUT", "5"))
+
+UKURAN_BATCH = 20
+MAKS_PERCOBAAN = 6
+JEDA_AWAL = 10          # detik, dilipatgandakan tiap gagal
+JEDA_MAKS = 30 * 60
+# Batch yang sedang dikirim dikunci selama ini. Satu kirim bisa makan
+# WA_TIMEOUT untuk menyambung dan WA_TIMEOUT lagi menunggu balasan.
+JEDA_KUNCI = UKURAN_BATCH * 2 * WA_TIMEOUT + 60
+INTERVAL_POLL = 15
+
+log = logging.getLogger("pos.notifikasi")
+
+
+@migrasi(2)
+def init_outbox(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS wa_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_penjualan TEXT,
+            nomor_wa TEXT,
+            pesan TEXT,
+            status TEXT DEFAULT 'antri',
+            percobaan INTEGER DEFAULT 0,
+            coba_lagi REAL DEFAULT 0,
+            error TEXT,
+            dibuat TEXT,
+            terkirim TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_wa_outbox_antri
+        ON wa_outbox (coba_lagi) WHERE status = 'antri'
+    """)
+
+
+def antre_wa(cur, nomor_wa, pesan, id_penjualan=None):
+    """Simpan pesan ke outbox. Dipanggil di dalam transaksi penjualan."""
+    if not nomor_wa:
+        return
+    cur.execute("""
+        INSERT INTO wa_outbox (id_penjualan, nomor_wa, pesan, dibuat)
+        VALUES (?, ?, ?, ?)
+    """, (id_penjualan, nomor_wa, pesan, datetime.now().isoformat(timespec="seconds")))
+
+
+def hitung_outbox(cur):
+    """Jumlah pesan per status, untuk /metrics."""
+    cur.execute("SELECT status, COUNT(*) FROM wa_outbox GROUP BY status")
+    return [tuple(row) for row in cur.fetchall()]
+
+
+def kirim_wa(nomor_wa, pesan, session=None):
+    payload = {
+        "number": nomor_wa,
+        "message": pesan
+    }
+    response = (session or requests).post(WA_ENDPOINT, json=payload, timeout=WA_TIMEOUT)
+    if response.status_code != 200:
+        raise RuntimeError(f"gateway WA membalas {response.status_code}")
+
+
+def hitung_jeda(percobaan):
+    return min(JEDA_MAKS, JEDA_AWAL * 2 ** (percobaan - 1))
+
+
+class PengirimWA(threading.Thread):
+    """Worker latar belakang yang mengosongkan tabel wa_outbox."""
+
+    def __init__(self, db_path):
+        super().__init__(name="pengirim-wa", daemon=True)
+        self.db_path = db_path
+        self.bangun = threading.Event()
+        self.session = requests.Session()
+
+    def run(self):
+        conn = buka_koneksi(self.db_path)
+        while True:
+            try:
+                jumlah = self.proses_batch(conn)
+            except sqlite3.Error as e:
+                log.error("Outbox WA %s error: %s", self.db_path, e)
+                jumlah = 0
+            # Batch penuh berarti mungkin masih ada antrean, langsung lanjut
+            if jumlah < UKURAN_BATCH:
+                self.bangun.wait(INTERVAL_POLL)
+                self.bangun.clear()
+
+    def proses_batch(self, conn):
+        sekarang = time.time()
+        batas_kunci = sekarang + JEDA_KUNCI
+        # Klaim satu batch sekaligus; kunci sementara lewat coba_lagi supaya
+        # pesan tidak terkirim dua kali kalau ada worker lain.
+        rows = conn.execute("""
+            UPDATE wa_outbox SET coba_lagi = ?
+            WHERE id IN (
+                SELECT id FROM wa_outbox
+                WHERE status = 'antri' AND coba_lagi <= ?
+                ORDER BY coba_lagi, id LIMIT ?
+            )
+            RETURNING id, nomor_wa, pesan, percobaan
+        """, (batas_kunci, sekarang, UKURAN_BATCH)).fetchall()
+        conn.commit()
+
+        for id_pesan, nomor_wa, pesan, percobaan in rows:
+            if time.time() + 2 * WA_TIMEOUT > batas_kunci:
+                # Kunci bisa habis di tengah kirim (mis. database sibuk lama):
+                # sisanya tidak dikirim, diklaim ulang setelah kuncinya lewat
+                break
+            try:
+                kirim_wa(nomor_wa, pesan, self.session)
+            except Exception as e:
+                percobaan += 1
+                if percobaan >= MAKS_PERCOBAAN:
+                    # Dead-letter: berhenti mencoba, simpan error terakhir
+                    conn.execute("""
+                        UPDATE wa_outbox SET status = 'gagal', percobaan = ?, error = ?
+                        WHERE id = ?
+                    """, (percobaan, str(e), id_pesan))
+                else:
+                    conn.execute("""
+                        UPDATE wa_outbox SET percobaan = ?, coba_lagi = ?, error = ?
+                        WHERE id = ?
+                    """, (percobaan, time.time() + hitung_jeda(percobaan), str(e), id_pesan))
+            else:
+                conn.execute("""
+                    UPDATE wa_outbox SET status = 'terkirim', percobaan = ?, terkirim = ?
+                    WHERE id = ?
+                """, (percobaan + 1, datetime.now().isoformat(timespec="seconds"), id_pesan))
+            conn.commit()
+
+        return len(rows)
+
+
+_pengirim = {}   # db_path -> PengirimWA, satu per database outlet
+_pengirim_lock = threading.Lock()
+
+
+def jalankan_pengirim(db_path):
+    with _pengirim_lock:
+        if db_path not in _pengirim:
+            _pengirim[db_path] = PengirimWA(db_path)
+            _pengirim[db_path].start()
+    return _pengirim[db_path]
+
+
+def bangunkan_pengirim(db_path):
+    pengirim = _pengirim.get(db_path)
+    if pengirim is not None:
+        pengirim.bangun.set()
@@ -0,0 +1,77 @@
+import os
+import re
+
+from flask import g, jsonify, redirect, render_template, request
+
+# === MODE MULTI-OUTLET ===
+# Dengan POS_OUTLET_DIR, setiap berkas <kode>.db di folder itu adalah satu
+# outlet dengan database sendiri. Outlet dipilih per request lewat header
+# X-Outlet (kasir / API), ?outlet=, atau cookie dari halaman /outlet; semua
+# route lalu memakai database outlet itu lewat get_db(). Tanpa POS_OUTLET_DIR
+# aplikasi tetap satu toko dengan POS_DB.
+
+OUTLET_DIR = os.environ.get("POS_OUTLET_DIR")
+COOKIE = "outlet"
+POLA_KODE = re.compile(r"^[A-Za-z0-9_-]{1,40}$")
+# Route yang tidak butuh outlet terpilih
+BEBAS = ("/outlet", "/aset/", "/static/", "/metrics", "/laporan/gabungan")
+
+
+def aktif():
+    return bool(OUTLET_DIR)
+
+
+def daftar_outlet():
+    """dict kode -> path database, urut kode."""
+    if not OUTLET_DIR:
+        return {}
+    hasil = {}
+    for nama in sorted(os.listdir(OUTLET_DIR)):
+        kode, ext = os.path.splitext(nama)
+        if ext == ".db" and POLA_KODE.match(kode):
+            hasil[kode] = os.path.join(OUTLET_DIR, nama)
+    return hasil
+
+
+def path_outlet(kode):
+    if not kode or not POLA_KODE.match(kode):
+        return None
+    path = os.path.join(OUTLET_DIR, kode + ".db")
+    return path if os.path.exists(path) else None
+
+
+def outlet_aktif():
+    return g.get("outlet")
+
+
+def init_app(app, siapkan_db):
+    """siapkan_db(path) dipanggil sekali per database outlet (migrasi, worker)."""
+    app.jinja_env.globals["outlet_aktif"] = outlet_aktif
+    if not aktif():
+        return
+
+    @app.before_request
+    def pilih_outlet():
+        kode = request.headers.get("X-Outlet") or request.args.get("outlet") or request.cookies.get(COOKIE)
+        path = path_outlet(kode)
+        if path is None:
+            if request.path.startswith(BEBAS):
+                return None
+            if request.path.startswith("/api/") or request.method != "GET":
+                return jsonify({"error": "outlet tidak dikenal; kirim header X-Outlet"}), 400
+            return redirect("/outlet")
+        siapkan_db(path)
+        g.outlet = kode
+        g.db_path = path
+
+    @app.route("/outlet")
+    def pilih_outlet_halaman():
+        return render_template("outlet.html", daftar=list(daftar_outlet()))
+
+    @app.route("/outlet/<kode>")
+    def ganti_outlet(kode):
+        if path_outlet(kode) is None:
+            return "Outlet tidak ditemukan", 404
+        response = redirect("/")
+        response.set_cookie(COOKIE, kode, max_age=365 * 24 * 3600, samesite="Lax")
+        return response
@@ -0,0 +1,146 @@
+import re
+
+from db import migrasi
+
+# === PENCARIAN FTS5 ===
+# barang_fts dan pelanggan_fts menyimpan salinan kolom yang dicari beserta
+# kunci tabelnya (kolom UNINDEXED), bukan external-content atas rowid:
+# barang & pelanggan ber-PRIMARY KEY TEXT, jadi rowid-nya bisa bernomor
+# ulang saat VACUUM. Trigger menjaga index tetap sama dengan tabelnya.
+INDEX_FTS = {
+    "barang_fts": ("barang", "id_barang", ["nama_barang", "kategori"]),
+    "pelanggan_fts": ("pelanggan", "id_pelanggan", ["nama", "wa"]),
+}
+
+BATAS_HASIL = 20
+
+
+@migrasi(7)
+def init_pencarian(conn):
+    for fts, (tabel, _, kolom) in INDEX_FTS.items():
+        daftar = ", ".join(kolom)
+        baru = ", ".join(f"NEW.{k}" for k in kolom)
+        lama = ", ".join(f"OLD.{k}" for k in kolom)
+        conn.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                {daftar}, content='{tabel}', content_rowid='rowid',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{fts}_insert AFTER INSERT ON {tabel} BEGIN
+                INSERT INTO {fts} (rowid, {daftar}) VALUES (NEW.rowid, {baru});
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{fts}_delete AFTER DELETE ON {tabel} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {daftar}) VALUES ('delete', OLD.rowid, {lama});
+            END
+        """)
+        # Hanya kolom yang diindex; update stok_akhir tidak menyentuh index
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{fts}_update AFTER UPDATE OF {daftar} ON {tabel} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {daftar}) VALUES ('delete', OLD.rowid, {lama});
+                INSERT INTO {fts} (rowid, {daftar}) VALUES (NEW.rowid, {baru});
+            END
+        """)
+        conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+
+@migrasi(15)
+def init_pencarian_kunci(conn):
+    # Index lama (content_rowid='rowid', migrasi 7) diganti index berkunci id
+    for fts in INDEX_FTS:
+        for aksi in ("insert", "delete", "update"):
+            conn.execute(f"DROP TRIGGER IF EXISTS trg_{fts}_{aksi}")
+        conn.execute(f"DROP TABLE IF EXISTS {fts}")
+    buat_index_fts(conn)
+
+
+def buat_index_fts(conn):
+    for fts, (tabel, kunci, kolom) in INDEX_FTS.items():
+        daftar = ", ".join(kolom)
+        baru = ", ".join(f"NEW.{k}" for k in kolom)
+        conn.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                {kunci} UNINDEXED, {daftar},
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{fts}_insert AFTER INSERT ON {tabel} BEGIN
+                INSERT INTO {fts} ({kunci}, {daftar}) VALUES (NEW.{kunci}, {baru});
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{fts}_delete AFTER DELETE ON {tabel} BEGIN
+                DELETE FROM {fts} WHERE {kunci} = OLD.{kunci};
+            END
+        """)
+        # Hanya kolom yang diindex; update stok_akhir tidak menyentuh index
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{fts}_update AFTER UPDATE OF {kunci}, {daftar} ON {tabel} BEGIN
+                DELETE FROM {fts} WHERE {kunci} = OLD.{kunci};
+                INSERT INTO {fts} ({kunci}, {daftar}) VALUES (NEW.{kunci}, {baru});
+            END
+        """)
+        conn.execute(f"DELETE FROM {fts}")
+        conn.execute(f"INSERT INTO {fts} ({kunci}, {daftar}) SELECT {kunci}, {daftar} FROM {tabel}")
+
+
+def query_prefix(teks):
+    # Setiap kata jadi prefix "kata"*; tanda baca dibuang supaya sintaks FTS aman
+    kata = re.findall(r"\w+", teks or "")
+    return " ".join(f'"{k}"*' for k in kata)
+
+
+def cari_barang(cur, teks, batas=BATAS_HASIL, hanya_tersedia=False):
+    query = query_prefix(teks)
+    filter_stok = "AND b.stok_akhir > 0" if hanya_tersedia else ""
+    kolom = """
+        b.id_barang, b.nama_barang, b.satuan, b.kategori, b.stok_akhir,
+        (SELECT harga_beli FROM pembelian p WHERE p.id_barang = b.id_barang
+         ORDER BY p.tanggal DESC, p.rowid DESC LIMIT 1) AS harga_terakhir
+    """
+    if query:
+        cur.execute(f"""
+            SELECT {kolom} FROM barang_fts f JOIN barang b ON b.id_barang = f.id_barang
+            WHERE barang_fts MATCH ? {filter_stok}
+            ORDER BY f.rank LIMIT ?
+        """, (query, batas))
+    else:
+        cur.execute(f"""
+            SELECT {kolom} FROM barang b
+            WHERE 1 {filter_stok}
+            ORDER BY b.id_barang LIMIT ?
+        """, (batas,))
+    return [dict(row) for row in cur.fetchall()]
+
+
+def cari_pelanggan(cur, teks, batas=BATAS_HASIL):
+    query = query_prefix(teks)
+    if query:
+        cur.execute("""
+            SELECT p.id_pelanggan, p.nama, p.wa
+            FROM pelanggan_fts f JOIN pelanggan p ON p.id_pelanggan = f.id_pelanggan
+            WHERE pelanggan_fts MATCH ?
+            ORDER BY f.rank LIMIT ?
+        """, (query, batas))
+    else:
+        cur.execute("SELECT id_pelanggan, nama, wa FROM pelanggan ORDER BY id_pelanggan LIMIT ?", (batas,))
+    return [dict(row) for row in cur.fetchall()]
+
+
+def info_barang(cur, daftar_id):
+    """Data barang + harga beli terakhir untuk sejumlah id_barang tertentu."""
+    daftar_id = list(dict.fromkeys(daftar_id))
+    if not daftar_id:
+        return {}
+    tanda = ", ".join("?" * len(daftar_id))
+    cur.execute(f"""
+        SELECT b.id_barang, b.nama_barang, b.satuan, b.kategori, b.stok_akhir,
+               (SELECT harga_beli FROM pembelian p WHERE p.id_barang = b.id_barang
+                ORDER BY p.tanggal DESC, p.rowid DESC LIMIT 1) AS harga_terakhir
+        FROM barang b WHERE b.id_barang IN ({tanda})
+    """, daftar_id)
+    return {row["id_barang"]: dict(row) for row in cur.fetchall()}
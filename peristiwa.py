@@ -0,0 +1,219 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from db import buka_koneksi, migrasi
+
+# === BUS PERISTIWA ===
+# Route penulisan mencatat peristiwa ringkas (rekap harian tanggal terkait,
+# stok barang terkait, penjualan baru) ke tabel peristiwa di transaksi yang
+# sama. Per proses satu thread penyalur membaca peristiwa baru sekali per
+# INTERVAL_POLL, hanya selama ada pelanggan, lalu membagikannya ke semua
+# dashboard yang tersambung lewat SSE. Penulisan di proses yang sama langsung
+# membangunkan penyalur; tabel membuat peristiwa dari proses gunicorn lain
+# ikut sampai. Jumlah penonton tidak menambah query.
+#
+# Isi peristiwa adalah nilai akhir, bukan selisih (baris rekap_harian per
+# tanggal, stok_akhir per barang), jadi peristiwa yang datang beruntun cukup
+# digabung: yang terbaru menimpa yang lama.
+
+MAKS_SIMPAN = 10000                # baris peristiwa yang disimpan untuk menyambung ulang
+INTERVAL_POLL = float(os.environ.get("POS_SSE_POLL", "1"))
+JEDA_GABUNG = float(os.environ.get("POS_SSE_GABUNG", "0.5"))
+# Satu koneksi SSE memegang satu thread worker gunicorn (gthread) selama
+# tersambung. Bawaan: semua thread per proses (POS_THREADS, bawaan sama dengan
+# gunicorn.conf.py) boleh dipakai dashboard kecuali THREAD_KASIR, yang selalu
+# tersisa untuk kasir & halaman biasa.
+THREAD_KASIR = 4
+MAKS_PELANGGAN = int(os.environ.get("POS_SSE_MAKS") or
+                     max(1, int(os.environ.get("POS_THREADS", "20")) - THREAD_KASIR))
+DETAK = 15
+MAKS_DAFTAR = 20
+
+log = logging.getLogger("pos.peristiwa")
+
+KOLOM_REKAP = ("penjualan", "laba", "pembelian", "pengeluaran", "modal")
+
+
+@migrasi(13)
+def init_peristiwa(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS peristiwa (
+            id INTEGER PRIMARY KEY,
+            jenis TEXT NOT NULL,
+            data TEXT NOT NULL,
+            dibuat TEXT DEFAULT (datetime('now', 'localtime'))
+        )
+    """)
+
+
+# === PENCATATAN (di dalam transaksi tulis) ===
+def catat(cur, jenis, data):
+    cur.execute("INSERT INTO peristiwa (jenis, data) VALUES (?, ?)", (jenis, json.dumps(data)))
+    cur.execute("DELETE FROM peristiwa WHERE id <= ?", (cur.lastrowid - MAKS_SIMPAN,))
+
+
+def catat_perubahan(cur, tanggal=(), id_barang=(), penjualan=()):
+    """Catat rekap harian untuk tanggal, stok untuk id_barang, dan daftar penjualan baru."""
+    tanggal = sorted({t for t in tanggal if t})
+    if tanggal:
+        cur.execute(f"""
+            SELECT tanggal, {", ".join(KOLOM_REKAP)} FROM rekap_harian
+            WHERE tanggal IN ({", ".join("?" * len(tanggal))})
+        """, tanggal)
+        rekap = {t: dict.fromkeys(KOLOM_REKAP, 0) for t in tanggal}
+        for row in cur.fetchall():
+            rekap[row[0]] = dict(zip(KOLOM_REKAP, row[1:]))
+        catat(cur, "rekap", rekap)
+
+    id_barang = sorted({i for i in id_barang if i})
+    if id_barang:
+        cur.execute(f"""
+            SELECT id_barang, nama_barang, stok_akhir FROM barang
+            WHERE id_barang IN ({", ".join("?" * len(id_barang))})
+        """, id_barang)
+        catat(cur, "stok", {row[0]: {"nama": row[1], "stok": row[2]} for row in cur.fetchall()})
+
+    if penjualan:
+        catat(cur, "penjualan", list(penjualan)[-MAKS_DAFTAR:])
+
+
+# === PELANGGAN ===
+def gabung(tertunda, jenis, data):
+    if isinstance(data, list):
+        tertunda[jenis] = (tertunda.get(jenis, []) + data)[-MAKS_DAFTAR:]
+    else:
+        tertunda.setdefault(jenis, {}).update(data)
+
+
+class Langganan:
+    """Peristiwa yang belum terkirim ke satu dashboard, sudah digabung per jenis."""
+
+    def __init__(self, terakhir):
+        self.terakhir = terakhir
+        self.tertunda = {}
+        self.kondisi = threading.Condition()
+
+    def terima(self, id_peristiwa, jenis, data):
+        with self.kondisi:
+            if id_peristiwa <= self.terakhir:
+                return
+            self.terakhir = id_peristiwa
+            gabung(self.tertunda, jenis, data)
+            self.kondisi.notify()
+
+    def ambil(self, timeout):
+        with self.kondisi:
+            if not self.tertunda:
+                self.kondisi.wait(timeout)
+            hasil, self.tertunda = self.tertunda, {}
+            return hasil, self.terakhir
+
+
+class BusPeristiwa(threading.Thread):
+    """Penyalur peristiwa satu database ke semua langganan di proses ini."""
+
+    def __init__(self, db_path):
+        super().__init__(name="bus-peristiwa", daemon=True)
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.pelanggan = set()
+        self.bangun = threading.Event()
+        self.terakhir = None
+
+    def run(self):
+        conn = buka_koneksi(self.db_path)
+        while True:
+            self.bangun.wait(INTERVAL_POLL)
+            self.bangun.clear()
+            try:
+                self.salurkan(conn)
+            except sqlite3.Error as e:
+                log.error("Bus peristiwa %s error: %s", self.db_path, e)
+
+    def salurkan(self, conn):
+        with self.lock:
+            if not self.pelanggan:
+                self.terakhir = None
+                return
+            if self.terakhir is None:
+                self.terakhir = min(l.terakhir for l in self.pelanggan)
+        rows = conn.execute("SELECT id, jenis, data FROM peristiwa WHERE id > ? ORDER BY id LIMIT 1000",
+                            (self.terakhir,)).fetchall()
+        with self.lock:
+            for id_peristiwa, jenis, data in rows:
+                data = json.loads(data)
+                for langganan in self.pelanggan:
+                    langganan.terima(id_peristiwa, jenis, data)
+        if rows:
+            self.terakhir = rows[-1][0]
+            if len(rows) == 1000:
+                self.bangun.set()
+
+    def langgan(self, conn, dari=None):
+        """Daftarkan dashboard baru; peristiwa sesudah id `dari` dikirim ulang dulu."""
+        with self.lock:
+            # Dibaca di dalam kunci: penyalur tidak bisa membagikan peristiwa
+            # di antara pembacaan cursor dan pendaftaran
+            terakhir, awal = conn.execute("SELECT IFNULL(MAX(id), 0), IFNULL(MIN(id), 1) FROM peristiwa").fetchone()
+            langganan = Langganan(terakhir if dari is None else dari)
+            if dari is not None:
+                if dari < awal - 1:
+                    # Peristiwa yang terlewat sudah dipangkas; dashboard harus dimuat ulang
+                    langganan.tertunda["muat_ulang"] = {}
+                rows = conn.execute("SELECT id, jenis, data FROM peristiwa WHERE id > ? ORDER BY id",
+                                    (dari,)).fetchall()
+                for id_peristiwa, jenis, data in rows:
+                    langganan.terima(id_peristiwa, jenis, json.loads(data))
+            self.pelanggan.add(langganan)
+        self.bangun.set()
+        return langganan
+
+    def berhenti(self, langganan):
+        with self.lock:
+            self.pelanggan.discard(langganan)
+
+
+_bus = {}   # db_path -> BusPeristiwa
+_bus_lock = threading.Lock()
+
+
+def bus(db_path):
+    with _bus_lock:
+        if db_path not in _bus:
+            _bus[db_path] = BusPeristiwa(db_path)
+            _bus[db_path].start()
+    return _bus[db_path]
+
+
+def umumkan(db_path):
+    """Dipanggil setelah commit: salurkan peristiwa baru tanpa menunggu poll."""
+    if db_path in _bus:
+        _bus[db_path].bangun.set()
+
+
+def jumlah_pelanggan():
+    return sum(len(b.pelanggan) for b in list(_bus.values()))
+
+
+def alirkan(bus_db, langganan):
+    """Generator SSE; peristiwa yang datang dalam JEDA_GABUNG dikirim sebagai satu pesan per jenis."""
+    try:
+        yield "retry: 3000\n\n"
+        terakhir_kirim = 0
+        while True:
+            jeda = JEDA_GABUNG - (time.monotonic() - terakhir_kirim)
+            if jeda > 0:
+                time.sleep(jeda)
+            hasil, id_peristiwa = langganan.ambil(DETAK)
+            if not hasil:
+                yield ": detak\n\n"
+                continue
+            terakhir_kirim = time.monotonic()
+            for jenis, data in hasil.items():
+                yield f"id: {id_peristiwa}\nevent: {jenis}\ndata: {json.dumps(data)}\n\n"
+    finally:
+        bus_db.berhenti(langganan)
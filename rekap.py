@@ -0,0 +1,152 @@
+from db import migrasi
+
+# === TABEL REKAP ===
+# rekap_harian dan rekap_barang dijaga oleh trigger pada tabel mentah, jadi
+# selalu ikut transaksi yang sama dengan penulisan di penjualan(), pembelian(),
+# pengeluaran() dan pemodal(). Laporan cukup membaca rekap ini.
+
+# tabel sumber -> {tabel rekap: [(kolom rekap, ekspresi dari baris sumber)]}
+# Penjualan direkap dari baris item (penjualan_item), bukan dari header.
+SUMBER_REKAP = {
+    "penjualan_item": {
+        "rekap_harian": [("penjualan", "total"), ("laba", "laba"), ("baris_jual", "1")],
+        "rekap_barang": [("qty_jual", "jumlah"), ("penjualan", "total"), ("laba", "laba")],
+    },
+    "pembelian": {
+        "rekap_harian": [("pembelian", "total_beli")],
+        "rekap_barang": [("qty_beli", "jumlah"), ("pembelian", "total_beli")],
+    },
+    "pengeluaran": {
+        "rekap_harian": [("pengeluaran", "jumlah")],
+    },
+    "pemodal": {
+        "rekap_harian": [("modal", "jumlah")],
+    },
+}
+
+KOLOM_REKAP_BARANG = ("id_barang", "qty_jual", "penjualan", "laba", "qty_beli", "pembelian")
+
+KUNCI_REKAP = {
+    "rekap_harian": ["tanggal"],
+    "rekap_barang": ["tanggal", "id_barang"],
+}
+
+
+def sql_tambah_rekap(tabel_rekap, kolom, baris, tanda):
+    """Upsert satu baris rekap dari baris sumber (NEW/OLD) dengan tanda +/-."""
+    kunci = KUNCI_REKAP[tabel_rekap]
+    nama_kolom = kunci + [k for k, _ in kolom]
+    nilai = [f"{baris}.{k}" for k in kunci] + [f"{tanda}IFNULL({baris}.{e}, 0)" if e != "1" else f"{tanda}1"
+                                              for _, e in kolom]
+    update = ", ".join(f"{k} = {k} + excluded.{k}" for k, _ in kolom)
+    return f"""
+        INSERT INTO {tabel_rekap} ({", ".join(nama_kolom)})
+        VALUES ({", ".join(nilai)})
+        ON CONFLICT({", ".join(kunci)}) DO UPDATE SET {update};
+    """
+
+
+def tabel_ada(conn, tabel):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (tabel,)).fetchone() is not None
+
+
+def buat_trigger_rekap(conn, tabel):
+    target = SUMBER_REKAP[tabel]
+    for aksi, langkah in (("INSERT", [("NEW", "")]),
+                          ("DELETE", [("OLD", "-")]),
+                          ("UPDATE", [("OLD", "-"), ("NEW", "")])):
+        isi = "".join(sql_tambah_rekap(tabel_rekap, kolom, baris, tanda)
+                      for baris, tanda in langkah
+                      for tabel_rekap, kolom in target.items())
+        conn.execute(f"DROP TRIGGER IF EXISTS trg_rekap_{tabel}_{aksi.lower()}")
+        conn.execute(f"""
+            CREATE TRIGGER trg_rekap_{tabel}_{aksi.lower()}
+            AFTER {aksi} ON {tabel}
+            BEGIN
+                {isi}
+            END
+        """)
+
+
+def bangun_ulang_rekap(conn):
+    """Hitung ulang semua tabel rekap dari tabel mentah."""
+    conn.execute("DELETE FROM rekap_harian")
+    conn.execute("DELETE FROM rekap_barang")
+    for tabel, target in SUMBER_REKAP.items():
+        if not tabel_ada(conn, tabel):
+            # penjualan_item baru dibuat oleh migrasi 8
+            continue
+        for tabel_rekap, kolom in target.items():
+            kunci = KUNCI_REKAP[tabel_rekap]
+            agregat = [f"SUM(IFNULL({e}, 0))" if e != "1" else "COUNT(*)" for _, e in kolom]
+            update = ", ".join(f"{k} = {k} + excluded.{k}" for k, _ in kolom)
+            conn.execute(f"""
+                INSERT INTO {tabel_rekap} ({", ".join(kunci + [k for k, _ in kolom])})
+                SELECT {", ".join(kunci + agregat)} FROM {tabel}
+                WHERE tanggal IS NOT NULL
+                GROUP BY {", ".join(kunci)}
+                ON CONFLICT({", ".join(kunci)}) DO UPDATE SET {update}
+            """)
+
+
+@migrasi(5)
+def init_rekap(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS rekap_harian (
+            tanggal TEXT PRIMARY KEY,
+            penjualan INTEGER DEFAULT 0,
+            laba INTEGER DEFAULT 0,
+            baris_jual INTEGER DEFAULT 0,
+            pembelian INTEGER DEFAULT 0,
+            pengeluaran INTEGER DEFAULT 0,
+            modal INTEGER DEFAULT 0
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS rekap_barang (
+            tanggal TEXT,
+            id_barang TEXT,
+            qty_jual INTEGER DEFAULT 0,
+            penjualan INTEGER DEFAULT 0,
+            laba INTEGER DEFAULT 0,
+            qty_beli INTEGER DEFAULT 0,
+            pembelian INTEGER DEFAULT 0,
+            PRIMARY KEY (tanggal, id_barang)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_rekap_barang_barang ON rekap_barang (id_barang, tanggal)")
+    for tabel in SUMBER_REKAP:
+        if tabel_ada(conn, tabel):
+            buat_trigger_rekap(conn, tabel)
+    bangun_ulang_rekap(conn)
+
+
+def ambil_rekap(cur, awal, akhir):
+    """Total dan ringkasan harian untuk rentang tanggal [awal, akhir)."""
+    cur.execute("""
+        SELECT IFNULL(SUM(penjualan), 0), IFNULL(SUM(laba), 0), IFNULL(SUM(pembelian), 0),
+               IFNULL(SUM(pengeluaran), 0), IFNULL(SUM(modal), 0)
+        FROM rekap_harian
+        WHERE tanggal >= ? AND tanggal < ?
+    """, (awal, akhir))
+    total = dict(zip(("penjualan", "laba", "pembelian", "pengeluaran", "modal"), cur.fetchone()))
+
+    cur.execute("""
+        SELECT tanggal, penjualan, laba FROM rekap_harian
+        WHERE tanggal >= ? AND tanggal < ? AND baris_jual > 0
+        ORDER BY tanggal
+    """, (awal, akhir))
+    ringkasan = [(row[0], {"penjualan": row[1], "laba": row[2]}) for row in cur.fetchall()]
+    return total, ringkasan
+
+
+def ambil_rekap_barang(cur, awal, akhir):
+    """Total per barang untuk rentang tanggal [awal, akhir), penjualan terbesar dulu."""
+    cur.execute(f"""
+        SELECT id_barang, {", ".join(f"SUM({k})" for k in KOLOM_REKAP_BARANG[1:])}
+        FROM rekap_barang
+        WHERE tanggal >= ? AND tanggal < ?
+        GROUP BY id_barang
+        ORDER BY SUM(penjualan) DESC, id_barang
+    """, (awal, akhir))
+    return [dict(zip(KOLOM_REKAP_BARANG, row)) for row in cur.fetchall()]
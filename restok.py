@@ -0,0 +1,263 @@
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+
+from db import buka_koneksi, migrasi, mulai_tulis, DatabaseSibuk
+from notifikasi import antre_wa, bangunkan_pengirim
+from rekap import tabel_ada
+
+# === MESIN RESTOK ===
+# Kecepatan jual harian per barang disimpan sebagai rata-rata bergerak
+# eksponensial (EWMA) di barang_kecepatan. Pembaruannya melipat baris
+# stok_mutasi yang belum dibaca (cursor di sync_cursor), jadi checkout dan
+# pembelian hanya menyentuh baris miliknya sendiri; riwayat tidak pernah
+# dipindai ulang. Koreksi transaksi lama (batal_penjualan bertanggal mundur)
+# dilipat dengan bobot sesuai umurnya.
+#
+# Per barang disimpan EWMA sampai hari sebelum `hari` dan penjualan `hari`
+# yang belum masuk EWMA. Halaman restok cukup membaca satu baris per barang.
+
+HARI_EWMA = float(os.environ.get("POS_RESTOK_HARI_EWMA", "14"))
+ALFA = 2 / (HARI_EWMA + 1)
+HARI_TUNGGU = float(os.environ.get("POS_RESTOK_TUNGGU", "3"))     # pesan sampai barang datang
+HARI_AMAN = float(os.environ.get("POS_RESTOK_AMAN", "2"))         # stok pengaman
+HARI_TARGET = float(os.environ.get("POS_RESTOK_TARGET", "14"))    # stok yang dibeli sekali pesan
+WA_RESTOK = os.environ.get("POS_RESTOK_WA")                      # penerima ringkasan harian
+JAM_RINGKASAN = int(os.environ.get("POS_RESTOK_JAM", "7"))
+INTERVAL_KEJAR = int(os.environ.get("POS_RESTOK_DETIK", "60"))
+MAKS_BARIS_WA = 30
+
+log = logging.getLogger("pos.restok")
+
+JENIS_JUAL = ("penjualan", "batal_penjualan")
+
+
+@migrasi(12)
+def init_restok(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS barang_kecepatan (
+            id_barang TEXT PRIMARY KEY,
+            kecepatan REAL NOT NULL DEFAULT 0,
+            hari TEXT,
+            qty_hari REAL NOT NULL DEFAULT 0,
+            harga_beli INTEGER,
+            tanggal_beli TEXT
+        ) WITHOUT ROWID
+    """)
+    # Isi awal dari seluruh jurnal, sekali saja; tanpa tabel pembelian
+    # pengisian ditunda sampai pembaruan pertama
+    if tabel_ada(conn, "pembelian"):
+        perbarui_kecepatan(conn.cursor())
+
+
+# === EWMA ===
+def lipat(kecepatan, qty_hari, jumlah_hari):
+    """EWMA setelah qty_hari masuk, lalu jumlah_hari - 1 hari tanpa penjualan."""
+    return (ALFA * qty_hari + (1 - ALFA) * kecepatan) * (1 - ALFA) ** (jumlah_hari - 1)
+
+
+def tambah_jual(kecepatan, hari, qty_hari, tanggal, qty):
+    """Masukkan qty terjual pada tanggal ke state (kecepatan, hari, qty_hari)."""
+    if hari is None or tanggal == hari:
+        return kecepatan, tanggal, (qty_hari if hari else 0) + qty
+    selisih = date.fromisoformat(tanggal).toordinal() - date.fromisoformat(hari).toordinal()
+    if selisih > 0:
+        return lipat(kecepatan, qty_hari, selisih), tanggal, qty
+    # Bertanggal mundur: bobotnya sudah meluruh selama -selisih hari
+    return max(0.0, kecepatan + ALFA * (1 - ALFA) ** (-selisih - 1) * qty), hari, qty_hari
+
+
+def kecepatan_kini(kecepatan, hari, qty_hari, hari_ini):
+    """Kecepatan jual per hari sampai kemarin (hari ini belum selesai)."""
+    if hari is None:
+        return 0.0
+    selisih = hari_ini.toordinal() - date.fromisoformat(hari).toordinal()
+    return lipat(kecepatan, qty_hari, selisih) if selisih > 0 else kecepatan
+
+
+# === PEMBARUAN ===
+def perbarui_kecepatan(cur):
+    """Lipat mutasi stok sejak cursor ke barang_kecepatan. Dipanggil di dalam transaksi tulis."""
+    cur.execute("SELECT versi FROM sync_cursor WHERE nama = 'restok'")
+    row = cur.fetchone()
+    dari = row[0] if row else 0
+    cur.execute("SELECT IFNULL(MAX(id), 0) FROM stok_mutasi")
+    sampai = cur.fetchone()[0]
+    if sampai <= dari:
+        return 0
+
+    cur.execute(f"""
+        SELECT id_barang, tanggal, -SUM(jumlah) FROM stok_mutasi
+        WHERE id > ? AND id <= ? AND jenis IN ({', '.join('?' * len(JENIS_JUAL))})
+          AND tanggal IS NOT NULL
+        GROUP BY id_barang, tanggal
+        ORDER BY id_barang, tanggal
+    """, (dari, sampai) + JENIS_JUAL)
+    jual = {}
+    for id_barang, tanggal, qty in cur.fetchall():
+        jual.setdefault(id_barang, []).append((tanggal, qty))
+
+    cur.execute("""
+        SELECT m.id_barang, p.tanggal, p.harga_beli FROM stok_mutasi m
+        JOIN pembelian p ON p.id_pembelian = m.ref
+        WHERE m.id > ? AND m.id <= ? AND m.jenis = 'pembelian'
+        ORDER BY p.tanggal, m.id
+    """, (dari, sampai))
+    beli = {id_barang: (tanggal, harga) for id_barang, tanggal, harga in cur.fetchall()}
+
+    for id_barang in jual.keys() | beli.keys():
+        cur.execute("""
+            SELECT kecepatan, hari, qty_hari, harga_beli, tanggal_beli
+            FROM barang_kecepatan WHERE id_barang = ?
+        """, (id_barang,))
+        kecepatan, hari, qty_hari, harga_beli, tanggal_beli = cur.fetchone() or (0.0, None, 0, None, None)
+        for tanggal, qty in jual.get(id_barang, []):
+            kecepatan, hari, qty_hari = tambah_jual(kecepatan, hari, qty_hari, tanggal, qty)
+        if id_barang in beli and (tanggal_beli is None or (beli[id_barang][0] or "") >= tanggal_beli):
+            tanggal_beli, harga_beli = beli[id_barang]
+        cur.execute("""
+            INSERT OR REPLACE INTO barang_kecepatan
+                (id_barang, kecepatan, hari, qty_hari, harga_beli, tanggal_beli)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (id_barang, kecepatan, hari, qty_hari, harga_beli, tanggal_beli))
+
+    cur.execute("INSERT OR REPLACE INTO sync_cursor (nama, versi) VALUES ('restok', ?)", (sampai,))
+    return len(jual.keys() | beli.keys())
+
+
+def kejar_kecepatan(conn):
+    """Lipat mutasi yang ditulis di luar checkout/pembelian (impor, penyesuaian, ...)."""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT (SELECT IFNULL(MAX(id), 0) FROM stok_mutasi)
+             > IFNULL((SELECT versi FROM sync_cursor WHERE nama = 'restok'), 0)
+    """)
+    if not cur.fetchone()[0]:
+        return
+    mulai_tulis(conn)
+    try:
+        perbarui_kecepatan(cur)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+# === DAFTAR RESTOK ===
+def daftar_restok(cur, semua=False, hari_ini=None):
+    """Hari stok tersisa & saran pesan per barang, satu baris per barang.
+
+    Tanpa semua=True hanya barang yang stoknya sudah di bawah titik pesan.
+    """
+    hari_ini = hari_ini or date.today()
+    cur.execute("""
+        SELECT b.id_barang, b.nama_barang, b.satuan, b.stok_akhir,
+               k.kecepatan, k.hari, k.qty_hari, k.harga_beli
+        FROM barang b LEFT JOIN barang_kecepatan k ON k.id_barang = b.id_barang
+    """)
+    hasil = []
+    for id_barang, nama_barang, satuan, stok_akhir, kecepatan, hari, qty_hari, harga_beli in cur.fetchall():
+        v = kecepatan_kini(kecepatan or 0.0, hari, qty_hari or 0, hari_ini)
+        stok = max(0, stok_akhir or 0)
+        titik_pesan = v * (HARI_TUNGGU + HARI_AMAN)
+        perlu = v > 0 and stok <= titik_pesan
+        if not (perlu or semua):
+            continue
+        saran = max(0, math.ceil(v * (HARI_TUNGGU + HARI_AMAN + HARI_TARGET) - stok)) if v > 0 else 0
+        hasil.append({
+            "id_barang": id_barang,
+            "nama_barang": nama_barang,
+            "satuan": satuan,
+            "stok": stok,
+            "kecepatan": round(v, 2),
+            "hari_tersisa": round(stok / v, 1) if v > 0 else None,
+            "titik_pesan": math.ceil(titik_pesan),
+            "saran_pesan": saran,
+            "harga_beli": harga_beli or 0,
+            "perkiraan_biaya": saran * (harga_beli or 0),
+            "perlu_pesan": perlu,
+        })
+    hasil.sort(key=lambda b: (b["hari_tersisa"] is None, b["hari_tersisa"] or 0, b["nama_barang"] or ""))
+    return hasil
+
+
+def format_wa_restok(daftar, outlet=None):
+    baris = [f"*Stok menipis{' ' + outlet if outlet else ''}* ({date.today():%d-%m-%Y})"]
+    for b in daftar[:MAKS_BARIS_WA]:
+        baris.append(f"- {b['nama_barang']}: sisa {b['stok']} {b['satuan'] or ''} "
+                     f"(±{b['hari_tersisa']} hari), pesan {b['saran_pesan']}")
+    if len(daftar) > MAKS_BARIS_WA:
+        baris.append(f"... dan {len(daftar) - MAKS_BARIS_WA} barang lain")
+    return "\n".join(baris)
+
+
+# === WORKER LATAR ===
+class RingkasanRestok(threading.Thread):
+    """Worker latar yang melipat mutasi tertinggal (lihat kejar_kecepatan) dan,
+    kalau POS_RESTOK_WA diisi, mengantre ringkasan stok menipis sekali sehari.
+
+    Halaman restok hanya membaca; penulisnya checkout, pembelian, impor,
+    penyesuaian, dan worker ini untuk sisanya.
+    """
+
+    def __init__(self, db_path, outlet=None):
+        super().__init__(name="ringkasan-restok", daemon=True)
+        self.db_path = db_path
+        self.outlet = outlet
+
+    def run(self):
+        conn = buka_koneksi(self.db_path)
+        while True:
+            try:
+                kejar_kecepatan(conn)
+                if WA_RESTOK:
+                    self.kirim_kalau_waktunya(conn)
+            except (sqlite3.Error, DatabaseSibuk) as e:
+                log.error("Ringkasan restok %s error: %s", self.db_path, e)
+            time.sleep(INTERVAL_KEJAR)
+
+    def kirim_kalau_waktunya(self, conn):
+        sekarang = datetime.now()
+        if sekarang.hour < JAM_RINGKASAN:
+            return
+        hari = date.today().toordinal()
+        cur = conn.cursor()
+        # Cek tanpa kunci tulis dulu; worker ini bangun tiap INTERVAL_KEJAR
+        cur.execute("SELECT versi FROM sync_cursor WHERE nama = 'restok_wa'")
+        row = cur.fetchone()
+        if row and row[0] >= hari:
+            return
+        mulai_tulis(conn)
+        try:
+            # Tanggal kirim terakhir dicatat di transaksi yang sama dengan antrean
+            cur.execute("SELECT versi FROM sync_cursor WHERE nama = 'restok_wa'")
+            row = cur.fetchone()
+            if row and row[0] >= hari:
+                conn.rollback()
+                return
+            daftar = daftar_restok(cur)
+            if daftar:
+                antre_wa(cur, WA_RESTOK, format_wa_restok(daftar, self.outlet))
+            cur.execute("INSERT OR REPLACE INTO sync_cursor (nama, versi) VALUES ('restok_wa', ?)", (hari,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if daftar:
+            bangunkan_pengirim(self.db_path)
+
+
+_ringkasan = {}   # db_path -> RingkasanRestok
+_ringkasan_lock = threading.Lock()
+
+
+def jalankan_ringkasan(db_path, outlet=None):
+    with _ringkasan_lock:
+        if db_path not in _ringkasan:
+            _ringkasan[db_path] = RingkasanRestok(db_path, outlet)
+            _ringkasan[db_path].start()
+    return _ringkasan[db_path]
@@ -0,0 +1,172 @@
+import logging
+import os
+import threading
+import time
+
+from db import buka_koneksi, migrasi
+
+CREDENTIALS = os.environ.get("GOOGLE_CREDENTIALS", "credentials.json")
+NAMA_SHEET = os.environ.get("SHEET_NAMA", "poswaserda")
+NAMA_WORKSHEET = os.environ.get("SHEET_WORKSHEET", "Data Barang")
+INTERVAL_SYNC = int(os.environ.get("SHEET_INTERVAL", "60"))
+
+UKURAN_BATCH = 500
+JEDA_MAKS = 30 * 60
+HEADER = ["ID Barang", "Nama Barang", "Satuan", "Kategori", "Stok Akhir"]
+
+log = logging.getLogger("pos.sinkron_sheet")
+
+
+@migrasi(3)
+def init_sinkron(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='barang_perubahan'")
+    sudah_ada = cur.fetchone() is not None
+
+    # Setiap insert/update barang menaikkan versi baris itu; sinkronisasi
+    # cukup mengambil versi di atas cursor terakhir.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS barang_perubahan (
+            id_barang TEXT PRIMARY KEY,
+            versi INTEGER
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_barang_perubahan_versi ON barang_perubahan (versi)")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS sync_cursor (
+            nama TEXT PRIMARY KEY,
+            versi INTEGER
+        )
+    """)
+    for aksi in ("INSERT", "UPDATE"):
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_barang_perubahan_{aksi.lower()}
+            AFTER {aksi} ON barang
+            BEGIN
+                INSERT INTO barang_perubahan (id_barang, versi)
+                VALUES (NEW.id_barang, (SELECT IFNULL(MAX(versi), 0) + 1 FROM barang_perubahan))
+                ON CONFLICT(id_barang) DO UPDATE SET versi = excluded.versi;
+            END
+        """)
+
+    if not sudah_ada:
+        # Sinkron pertama mengirim seluruh katalog
+        cur.execute("""
+            INSERT INTO barang_perubahan (id_barang, versi)
+            SELECT id_barang, ROW_NUMBER() OVER (ORDER BY id_barang) FROM barang
+        """)
+
+
+def buka_worksheet(nama_worksheet):
+    # Import di sini supaya aplikasi tetap jalan tanpa gspread / tanpa jaringan
+    import gspread
+    from oauth2client.service_account import ServiceAccountCredentials
+
+    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+    creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS, scope)
+    client = gspread.authorize(creds)
+    return client.open(NAMA_SHEET).worksheet(nama_worksheet)
+
+
+def kena_kuota(e):
+    response = getattr(e, "response", None)
+    return getattr(response, "status_code", None) in (429, 500, 503)
+
+
+class SinkronSheet(threading.Thread):
+    """Worker yang mencerminkan tabel barang ke Google Sheets secara berkala."""
+
+    def __init__(self, db_path, nama_worksheet=NAMA_WORKSHEET):
+        super().__init__(name="sinkron-sheet", daemon=True)
+        self.db_path = db_path
+        self.nama_worksheet = nama_worksheet
+        self.sheet = None
+        self.baris_sheet = {}   # id_barang -> nomor baris di sheet
+        self.baris_baru = 2
+        self.jeda = INTERVAL_SYNC
+
+    def run(self):
+        conn = buka_koneksi(self.db_path)
+        while True:
+            try:
+                while self.sinkron_batch(conn) == UKURAN_BATCH:
+                    pass
+                self.jeda = INTERVAL_SYNC
+            except Exception as e:
+                # Offline / kuota habis: mundur eksponensial, sheet dibuka ulang nanti
+                if not kena_kuota(e):
+                    self.sheet = None
+                self.jeda = min(JEDA_MAKS, self.jeda * 2)
+                log.warning("Sinkron sheet gagal, coba lagi dalam %s detik: %s", self.jeda, e)
+            time.sleep(self.jeda)
+
+    def siapkan_sheet(self):
+        if self.sheet is not None:
+            return
+        sheet = buka_worksheet(self.nama_worksheet)
+        kolom_id = sheet.col_values(1)
+        if not kolom_id:
+            sheet.update("A1:E1", [HEADER])
+            kolom_id = [HEADER[0]]
+        self.baris_sheet = {id_barang: i + 1 for i, id_barang in enumerate(kolom_id) if i > 0}
+        self.baris_baru = len(kolom_id) + 1
+        self.sheet = sheet
+
+    def sinkron_batch(self, conn):
+        cur = conn.cursor()
+        cur.execute("SELECT versi FROM sync_cursor WHERE nama = 'barang'")
+        row = cur.fetchone()
+        cursor_versi = row[0] if row else 0
+
+        cur.execute("""
+            SELECT p.versi, b.id_barang, b.nama_barang, b.satuan, b.kategori, b.stok_akhir
+            FROM barang_perubahan p JOIN barang b ON b.id_barang = p.id_barang
+            WHERE p.versi > ?
+            ORDER BY p.versi LIMIT ?
+        """, (cursor_versi, UKURAN_BATCH))
+        rows = cur.fetchall()
+        if not rows:
+            return 0
+
+        self.siapkan_sheet()
+        data = []
+        baris_baru = self.baris_baru
+        for versi, id_barang, nama, satuan, kategori, stok in rows:
+            nomor = self.baris_sheet.get(id_barang)
+            if nomor is None:
+                nomor = baris_baru
+                baris_baru += 1
+            data.append({"range": f"A{nomor}:E{nomor}",
+                         "values": [[id_barang, nama, satuan, kategori, stok]]})
+
+        if baris_baru - 1 > self.sheet.row_count:
+            self.sheet.add_rows(baris_baru - 1 - self.sheet.row_count)
+        self.sheet.batch_update(data)
+
+        # Baru dicatat setelah batch_update berhasil
+        for versi, id_barang, *_ in rows:
+            if id_barang not in self.baris_sheet:
+                self.baris_sheet[id_barang] = self.baris_baru
+                self.baris_baru += 1
+        cur.execute("""
+            INSERT INTO sync_cursor (nama, versi) VALUES ('barang', ?)
+            ON CONFLICT(nama) DO UPDATE SET versi = excluded.versi
+        """, (rows[-1][0],))
+        conn.commit()
+        return len(rows)
+
+
+_sinkron = {}   # db_path -> SinkronSheet
+_sinkron_lock = threading.Lock()
+
+
+def jalankan_sinkron(db_path, outlet=None):
+    """Outlet memakai worksheet sendiri: "<SHEET_WORKSHEET> <kode outlet>"."""
+    if not os.path.exists(CREDENTIALS):
+        return None
+    with _sinkron_lock:
+        if db_path not in _sinkron:
+            nama_worksheet = f"{NAMA_WORKSHEET} {outlet}" if outlet else NAMA_WORKSHEET
+            _sinkron[db_path] = SinkronSheet(db_path, nama_worksheet)
+            _sinkron[db_path].start()
+    return _sinkron[db_path]
@@ -0,0 +1,262 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import date
+
+from db import buka_koneksi, migrasi, mulai_tulis, DatabaseSibuk
+from rekap import tabel_ada
+
+# === JURNAL MUTASI STOK ===
+# stok_mutasi mencatat setiap perubahan stok dan tidak pernah diubah: pembelian,
+# penjualan, pembalik saat transaksi diedit/dihapus, dan penyesuaian manual.
+# Baris pembelian & penjualan ditulis trigger, jadi selalu ikut transaksi yang
+# sama. Tanggal mutasi = tanggal transaksinya, sehingga koreksi transaksi lama
+# ikut mengubah posisi stok di tanggal itu.
+#
+# stok_bulanan menyimpan stok dan harga beli terakhir per barang di akhir tiap
+# bulan yang sudah tutup, dibangun oleh worker latar. Posisi stok pada tanggal
+# mana pun = snapshot terakhir sebelum tanggal itu + mutasi sesudahnya. Mutasi
+# bertanggal mundur menghapus snapshot bulan itu dan sesudahnya.
+
+INTERVAL_SNAPSHOT = int(os.environ.get("POS_SNAPSHOT_DETIK", "3600"))
+
+log = logging.getLogger("pos.stok")
+
+# tabel sumber -> (arah stok, kolom referensi, jenis masuk, jenis pembalik)
+SUMBER_MUTASI = {
+    "pembelian": (1, "id_pembelian", "pembelian", "batal_pembelian"),
+    "penjualan_item": (-1, "id_penjualan", "penjualan", "batal_penjualan"),
+}
+
+
+def sql_catat_mutasi(baris, tanda, jenis, kolom_ref):
+    return f"""
+        INSERT INTO stok_mutasi (tanggal, id_barang, jumlah, jenis, ref)
+        VALUES ({baris}.tanggal, {baris}.id_barang, {tanda}IFNULL({baris}.jumlah, 0), '{jenis}', {baris}.{kolom_ref});
+    """
+
+
+def buat_trigger_mutasi(conn, tabel):
+    arah, kolom_ref, jenis, jenis_balik = SUMBER_MUTASI[tabel]
+    masuk = ("NEW", "" if arah > 0 else "-", jenis)
+    balik = ("OLD", "-" if arah > 0 else "", jenis_balik)
+    for aksi, langkah in (("INSERT", [masuk]), ("DELETE", [balik]), ("UPDATE", [balik, masuk])):
+        isi = "".join(sql_catat_mutasi(baris, tanda, j, kolom_ref) for baris, tanda, j in langkah)
+        conn.execute(f"DROP TRIGGER IF EXISTS trg_mutasi_{tabel}_{aksi.lower()}")
+        conn.execute(f"""
+            CREATE TRIGGER trg_mutasi_{tabel}_{aksi.lower()}
+            AFTER {aksi} ON {tabel}
+            BEGIN
+                {isi}
+            END
+        """)
+
+
+@migrasi(11)
+def init_mutasi_stok(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS stok_mutasi (
+            id INTEGER PRIMARY KEY,
+            tanggal TEXT,
+            id_barang TEXT,
+            jumlah INTEGER NOT NULL,
+            jenis TEXT NOT NULL,
+            ref TEXT,
+            keterangan TEXT,
+            dicatat TEXT DEFAULT (datetime('now', 'localtime'))
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_stok_mutasi_tanggal ON stok_mutasi (tanggal, id_barang)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_stok_mutasi_barang ON stok_mutasi (id_barang, tanggal)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS stok_bulanan (
+            periode TEXT,
+            id_barang TEXT,
+            stok INTEGER NOT NULL,
+            harga_beli INTEGER,
+            PRIMARY KEY (periode, id_barang)
+        ) WITHOUT ROWID
+    """)
+
+    # Isi awal dari riwayat yang ada, lalu satu baris saldo_awal per barang
+    # supaya jumlah jurnal sama dengan stok_akhir saat ini.
+    if tabel_ada(conn, "pembelian"):
+        conn.execute("""
+            INSERT INTO stok_mutasi (tanggal, id_barang, jumlah, jenis, ref)
+            SELECT tanggal, id_barang, IFNULL(jumlah, 0), 'pembelian', id_pembelian
+            FROM pembelian WHERE tanggal IS NOT NULL ORDER BY tanggal, rowid
+        """)
+    if tabel_ada(conn, "penjualan_item"):
+        conn.execute("""
+            INSERT INTO stok_mutasi (tanggal, id_barang, jumlah, jenis, ref)
+            SELECT tanggal, id_barang, -IFNULL(jumlah, 0), 'penjualan', id_penjualan
+            FROM penjualan_item WHERE tanggal IS NOT NULL ORDER BY tanggal, id
+        """)
+    if tabel_ada(conn, "barang"):
+        conn.execute("""
+            INSERT INTO stok_mutasi (tanggal, id_barang, jumlah, jenis)
+            SELECT (SELECT IFNULL(MIN(tanggal), date('now', 'localtime')) FROM stok_mutasi),
+                   b.id_barang, IFNULL(b.stok_akhir, 0) - IFNULL(m.jumlah, 0), 'saldo_awal'
+            FROM barang b
+            LEFT JOIN (SELECT id_barang, SUM(jumlah) AS jumlah FROM stok_mutasi GROUP BY id_barang) m
+                   ON m.id_barang = b.id_barang
+            WHERE IFNULL(b.stok_akhir, 0) != IFNULL(m.jumlah, 0)
+        """)
+
+    for tabel in SUMBER_MUTASI:
+        if tabel_ada(conn, tabel):
+            buat_trigger_mutasi(conn, tabel)
+    # Bulan berjalan tidak punya snapshot, jadi mutasi bulan ini tidak menghapus apa-apa
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_stok_mutasi_snapshot
+        AFTER INSERT ON stok_mutasi
+        WHEN NEW.tanggal < strftime('%Y-%m-01', 'now', 'localtime')
+        BEGIN
+            DELETE FROM stok_bulanan WHERE periode >= substr(NEW.tanggal, 1, 7);
+        END
+    """)
+
+
+def catat_penyesuaian(cur, id_barang, stok_fisik, keterangan=""):
+    """Samakan stok_akhir dengan hasil hitung fisik.
+
+    Kembalikan (selisih, id baris stok_mutasi); id None kalau tidak ada selisih.
+    """
+    cur.execute("SELECT stok_akhir FROM barang WHERE id_barang = ?", (id_barang,))
+    row = cur.fetchone()
+    if row is None:
+        raise ValueError(f"id_barang {id_barang} tidak ditemukan")
+    selisih = stok_fisik - (row[0] or 0)
+    id_mutasi = None
+    if selisih:
+        cur.execute("UPDATE barang SET stok_akhir = ? WHERE id_barang = ?", (stok_fisik, id_barang))
+        cur.execute("""
+            INSERT INTO stok_mutasi (tanggal, id_barang, jumlah, jenis, keterangan)
+            VALUES (?, ?, ?, 'penyesuaian', ?)
+        """, (str(date.today()), id_barang, selisih, keterangan))
+        id_mutasi = cur.lastrowid
+    return selisih, id_mutasi
+
+
+# === POSISI STOK ===
+def bulan_berikutnya(periode):
+    tahun, bulan = int(periode[:4]), int(periode[5:7])
+    tahun, bulan = (tahun + 1, 1) if bulan == 12 else (tahun, bulan + 1)
+    return f"{tahun:04d}-{bulan:02d}"
+
+
+def posisi_stok(cur, akhir):
+    """Stok & harga beli terakhir per barang sebelum tanggal akhir (eksklusif).
+
+    Kembalikan dict id_barang -> {"stok", "harga_beli"}.
+    """
+    cur.execute("SELECT MAX(periode) FROM stok_bulanan WHERE periode < ?", (akhir[:7],))
+    periode = cur.fetchone()[0]
+    posisi = {}
+    awal = ""
+    if periode:
+        cur.execute("SELECT id_barang, stok, harga_beli FROM stok_bulanan WHERE periode = ?", (periode,))
+        for id_barang, stok, harga_beli in cur.fetchall():
+            posisi[id_barang] = {"stok": stok, "harga_beli": harga_beli or 0}
+        awal = bulan_berikutnya(periode) + "-01"
+
+    cur.execute("""
+        SELECT id_barang, SUM(jumlah) FROM stok_mutasi
+        WHERE tanggal >= ? AND tanggal < ?
+        GROUP BY id_barang
+    """, (awal, akhir))
+    for id_barang, jumlah in cur.fetchall():
+        posisi.setdefault(id_barang, {"stok": 0, "harga_beli": 0})["stok"] += jumlah
+
+    cur.execute("""
+        SELECT id_barang, harga_beli, MAX(tanggal) FROM pembelian
+        WHERE tanggal >= ? AND tanggal < ?
+        GROUP BY id_barang
+    """, (awal, akhir))
+    for id_barang, harga_beli, _ in cur.fetchall():
+        posisi.setdefault(id_barang, {"stok": 0, "harga_beli": 0})["harga_beli"] = harga_beli or 0
+    return posisi
+
+
+# === SNAPSHOT AKHIR BULAN ===
+def periode_snapshot_berikutnya(conn):
+    terakhir = conn.execute("SELECT MAX(periode) FROM stok_bulanan").fetchone()[0]
+    if terakhir:
+        return bulan_berikutnya(terakhir)
+    pertama = conn.execute("SELECT MIN(tanggal) FROM stok_mutasi").fetchone()[0]
+    return pertama[:7] if pertama else None
+
+
+def isi_snapshot(conn, periode):
+    """Snapshot periode = snapshot bulan sebelumnya + mutasi bulan ini."""
+    tahun, bulan = int(periode[:4]), int(periode[5:7])
+    sebelum = f"{tahun - 1:04d}-12" if bulan == 1 else f"{tahun:04d}-{bulan - 1:02d}"
+    conn.execute("""
+        WITH sebelum AS (
+            SELECT id_barang, stok, harga_beli FROM stok_bulanan WHERE periode = :sebelum
+        ), mutasi AS (
+            SELECT id_barang, SUM(jumlah) AS jumlah FROM stok_mutasi
+            WHERE tanggal >= :awal AND tanggal < :akhir GROUP BY id_barang
+        ), harga AS (
+            SELECT id_barang, harga_beli, MAX(tanggal) FROM pembelian
+            WHERE tanggal >= :awal AND tanggal < :akhir GROUP BY id_barang
+        )
+        INSERT INTO stok_bulanan (periode, id_barang, stok, harga_beli)
+        SELECT :periode, b.id_barang, IFNULL(s.stok, 0) + IFNULL(m.jumlah, 0),
+               COALESCE(h.harga_beli, s.harga_beli)
+        FROM (SELECT id_barang FROM sebelum UNION SELECT id_barang FROM mutasi) b
+        LEFT JOIN sebelum s ON s.id_barang = b.id_barang
+        LEFT JOIN mutasi m ON m.id_barang = b.id_barang
+        LEFT JOIN harga h ON h.id_barang = b.id_barang
+    """, {"periode": periode, "sebelum": sebelum,
+          "awal": periode + "-01", "akhir": bulan_berikutnya(periode) + "-01"})
+
+
+def bangun_snapshot(conn):
+    """Lengkapi stok_bulanan sampai bulan lalu, satu transaksi per bulan."""
+    bulan_ini = date.today().strftime("%Y-%m")
+    dibangun = 0
+    while True:
+        mulai_tulis(conn)
+        try:
+            periode = periode_snapshot_berikutnya(conn)
+            if periode is None or periode >= bulan_ini:
+                conn.commit()
+                return dibangun
+            isi_snapshot(conn, periode)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        dibangun += 1
+
+
+class SnapshotStok(threading.Thread):
+    """Worker latar belakang yang menjaga stok_bulanan tetap lengkap."""
+
+    def __init__(self, db_path):
+        super().__init__(name="snapshot-stok", daemon=True)
+        self.db_path = db_path
+
+    def run(self):
+        conn = buka_koneksi(self.db_path)
+        while True:
+            try:
+                bangun_snapshot(conn)
+            except (sqlite3.Error, DatabaseSibuk) as e:
+                log.error("Snapshot stok %s error: %s", self.db_path, e)
+            time.sleep(INTERVAL_SNAPSHOT)
+
+
+_snapshot = {}   # db_path -> SnapshotStok
+_snapshot_lock = threading.Lock()
+
+
+def jalankan_snapshot(db_path):
+    with _snapshot_lock:
+        if db_path not in _snapshot:
+            _snapshot[db_path] = SnapshotStok(db_path)
+            _snapshot[db_path].start()
+    return _snapshot[db_path]